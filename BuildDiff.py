@@ -0,0 +1,111 @@
+"""
+Include map comparison across builds of Zephyr Include Map, the "diff" command.
+
+The same sources built for several boards or configurations have include
+maps that differ by a few headers, out of hundreds. Every translation unit
+of every build is preprocessed in the same job pool, and the maps are merged
+into one structure:
+
+    paths:             every header path once, shared by all builds and translation units
+    translationUnits:  <srcFileFullPath, <(fromId, toId), bit mask of the builds with this edge>>
+
+so a header included by all 15 boards is stored once, not 15 times, and the
+headers and edges added or removed by a board are found by bit tests.
+
+The generated headers of a build (autoconf.h, devicetree_generated.h...) are
+in its own build folder, so their paths are made relative to it, as
+"<bldDir>/zephyr/include/generated/autoconf.h", to match across builds.
+"""
+import os.path
+import json
+from PathCanonicalizer import IsInDir
+
+BUILD_DIR_TOKEN = "<bldDir>"
+
+def NormalizePath(path, bldDir):
+    if(IsInDir(path, bldDir)):
+        return BUILD_DIR_TOKEN + path[len(bldDir.rstrip(os.path.sep)):]
+    return path
+
+def GetBuildNames(bldDirs):
+    # the build folder names, e.g. "reel_board" and "qemu_x86_64", or the full paths if they are not unique
+    names = [os.path.basename(x.rstrip(os.path.sep)) for x in bldDirs]
+    return names if len(set(names)) == len(names) else list(bldDirs)
+
+class BuildDiff:
+    def __init__(self, buildNames):
+        self.buildNames = buildNames
+        self.paths = [] # <pathId, path>
+        self.pathIds = dict() # <path, pathId>
+        self.translationUnits = dict() # <srcFileFullPath, <(fromId, toId), build mask>>, in include order
+        self.builtBy = dict() # <srcFileFullPath, build mask>
+
+    def GetPathId(self, path):
+        pathId = self.pathIds.get(path)
+        if(pathId is None):
+            pathId = len(self.paths)
+            self.paths.append(path)
+            self.pathIds[path] = pathId
+        return pathId
+
+    def AddGraph(self, buildIndex, srcFileFullPath, graph, bldDir):
+        bit = 1 << buildIndex
+        edges = self.translationUnits.setdefault(srcFileFullPath, dict())
+        self.builtBy[srcFileFullPath] = self.builtBy.get(srcFileFullPath, 0) | bit
+        pathIds = [self.GetPathId(NormalizePath(x, bldDir)) for x in graph.nodes] # each node of the graph is looked up once
+        for fromId, successors in graph.successors.items():
+            for toId in successors:
+                key = (pathIds[fromId], pathIds[toId])
+                edges[key] = edges.get(key, 0) | bit
+        return
+
+    def GetHeaders(self, srcFileFullPath):
+        # <pathId, build mask>: a header is in a build if an edge of that build leads to it
+        headers = dict()
+        for (fromId, toId), mask in self.translationUnits[srcFileFullPath].items():
+            headers[toId] = headers.get(toId, 0) | mask
+        return headers
+
+    def Compare(self, srcFileFullPath, baseIndex, otherIndex):
+        """
+        Return the headers and the edges added and removed in a build compared to the base build, as paths.
+        """
+        baseBit = 1 << baseIndex
+        otherBit = 1 << otherIndex
+        paths = self.paths
+        result = {"addedHeaders": [], "removedHeaders": [], "addedEdges": [], "removedEdges": []}
+        for pathId, mask in self.GetHeaders(srcFileFullPath).items():
+            if(mask & otherBit and not mask & baseBit):
+                result["addedHeaders"].append(paths[pathId])
+            elif(mask & baseBit and not mask & otherBit):
+                result["removedHeaders"].append(paths[pathId])
+        for (fromId, toId), mask in self.translationUnits[srcFileFullPath].items():
+            if(mask & otherBit and not mask & baseBit):
+                result["addedEdges"].append((paths[fromId], paths[toId]))
+            elif(mask & baseBit and not mask & otherBit):
+                result["removedEdges"].append((paths[fromId], paths[toId]))
+        return result
+
+    def CountPerBuild(self):
+        # the distinct headers and the edges of every build, over all translation units
+        headers = [set() for x in self.buildNames]
+        edges = [0] * len(self.buildNames)
+        for srcFileFullPath, tuEdges in self.translationUnits.items():
+            for (fromId, toId), mask in tuEdges.items():
+                for i in range(len(self.buildNames)):
+                    if(mask >> i & 1):
+                        headers[i].add(toId)
+                        edges[i] += 1
+        return [(name, len(headers[i]), edges[i]) for i, name in enumerate(self.buildNames)]
+
+    def ToDict(self):
+        data = dict()
+        data["builds"] = self.buildNames
+        data["paths"] = self.paths
+        data["translationUnits"] = [{"source": x, "builtBy": self.builtBy[x], "edges": [[a, b, mask] for (a, b), mask in edges.items()]} for x, edges in self.translationUnits.items()]
+        return data
+
+    def Export(self, fileFullPath):
+        with open(fileFullPath, "w") as f:
+            json.dump(self.ToDict(), f)
+        return
@@ -0,0 +1,153 @@
+"""
+Compile database for Zephyr Include Map.
+
+Where the compile settings of the source files come from. Two backends produce
+the same index:
+
+    <srcFileFullPath, {"DEFINES": ..., "INCLUDES": ..., "FLAGS": ..., "rule": ...}>
+
+- "ninja": build.ninja, see NinjaParser.py.
+- "json": compile_commands.json, which CMake emits next to build.ninja and which
+  also exists for CMake+Make builds.
+
+With "auto", a fresh cached ninja index is used first (no parsing at all), then
+compile_commands.json (one json.load), and a full build.ninja parse last.
+"""
+import os.path
+import re
+import sys
+import shlex
+
+NINJA_BUILD_FILE_NAME = "build.ninja"
+COMPILE_COMMANDS_FILE_NAME = "compile_commands.json"
+BACKENDS = ("auto", "ninja", "json")
+
+# a shell word: plain chars, backslash escapes and quoted strings
+shellWordRegex = re.compile(r"(?:[^\s\"'\\]|\\.|\"(?:[^\"\\]|\\.)*\"|'[^']*')+")
+
+INCLUDE_OPTIONS = ("-I", "-isystem", "-iquote", "-idirafter")
+DEFINE_OPTIONS = ("-D", "-U")
+# dependency file and output options make no sense for "-E"
+SKIPPED_OPTIONS_WITH_VALUE = ("-o", "-MF", "-MT", "-MQ")
+SKIPPED_OPTIONS = ("-c", "-MD", "-MMD", "-MP", "-M", "-MM")
+
+def SplitCommand(command):
+    # shlex.split() is slow for thousands of long command lines, so only the words with quotes go through it.
+    words = []
+    for word in shellWordRegex.findall(command):
+        if("\"" in word or "'" in word or "\\" in word):
+            words.extend(shlex.split(word, posix=True))
+        else:
+            words.append(word)
+    return words
+
+def SplitArguments(arguments, directory, srcFile):
+    # sort the compiler arguments into DEFINES, INCLUDES and FLAGS like CMake does in build.ninja
+    defines = []
+    includes = []
+    flags = []
+    i = 1 # arguments[0] is the compiler
+    while(i < len(arguments)):
+        arg = arguments[i]
+        i += 1
+        if(arg in SKIPPED_OPTIONS or arg == srcFile):
+            continue
+        if(arg in SKIPPED_OPTIONS_WITH_VALUE):
+            i += 1
+            continue
+        option = next((x for x in INCLUDE_OPTIONS + DEFINE_OPTIONS if arg.startswith(x)), None)
+        if(option is None):
+            flags.append(shlex.quote(arg))
+            continue
+        value = arg[len(option):]
+        if(value == "" and i < len(arguments)):
+            value = arguments[i]
+            i += 1
+        if(option in DEFINE_OPTIONS):
+            defines.append(shlex.quote(option + value))
+        else:
+            value = value if os.path.isabs(value) else os.path.normpath(os.path.join(directory, value))
+            includes.append(shlex.quote(option + value) if option == "-I" else "{0} {1}".format(option, shlex.quote(value)))
+    return " ".join(defines), " ".join(includes), " ".join(flags)
+
+def SplitIncludeOptions(includes, directory):
+    """
+    Return the (option, folder) pairs of INCLUDES in command line order, relative folders made absolute from directory.
+    A word that is not an include option is kept as (None, word), it is passed to the compiler unchanged.
+    """
+    words = SplitCommand(includes)
+    pairs = []
+    i = 0
+    while(i < len(words)):
+        word = words[i]
+        i += 1
+        option = next((x for x in INCLUDE_OPTIONS if word.startswith(x)), None)
+        if(option is None):
+            pairs.append((None, word))
+            continue
+        value = word[len(option):]
+        if(value == ""):
+            if(i == len(words)):
+                break
+            value = words[i]
+            i += 1
+        pairs.append((option, os.path.normpath(os.path.join(directory, value))))
+    return pairs
+
+def FormatIncludeOptions(pairs):
+    # the INCLUDES string of the pairs, quoted so that SplitCommand() gives the argv of GetIncludeArgv() back
+    return " ".join(shlex.quote(value) if option is None else shlex.quote(option + value) if option == "-I" else "{0} {1}".format(option, shlex.quote(value)) for option, value in pairs)
+
+def GetIncludeArgv(pairs):
+    argv = []
+    for option, value in pairs:
+        if(option is None):
+            argv.append(value)
+        elif(option == "-I"):
+            argv.append(option + value)
+        else:
+            argv.extend((option, value))
+    return argv
+
+def LoadCompileCommandsIndex(compileCommandsFile):
+    """
+    Load compile_commands.json and index it by the full path of each source file.
+    """
+    import json # the query commands import this module for BACKENDS only
+    with open(compileCommandsFile, "r") as f:
+        commands = json.load(f)
+    index = dict()
+    for command in commands:
+        directory = command.get("directory", os.path.dirname(compileCommandsFile))
+        srcFileFullPath = os.path.realpath(os.path.join(directory, command["file"]))
+        if(srcFileFullPath in index):
+            continue # like with build.ninja, the first command of a source file wins
+        arguments = command["arguments"] if "arguments" in command else SplitCommand(command["command"])
+        defines, includes, flags = SplitArguments(arguments, directory, command["file"])
+        entry = dict()
+        entry["DEFINES"] = sys.intern(defines)
+        entry["INCLUDES"] = sys.intern(includes)
+        entry["FLAGS"] = sys.intern(flags)
+        entry["rule"] = None # compile_commands.json has no rules; the source suffix tells the language
+        index[srcFileFullPath] = entry
+    return index
+
+def LoadCompileDb(bldDir, backend = "auto"):
+    """
+    Return (compileDbFile, index) for the build folder, or (None, None) if there is no compile database.
+    """
+    import NinjaParser # and the pickled caches it reads, only for the commands making maps
+    ninjaBldFile = os.path.join(bldDir, NINJA_BUILD_FILE_NAME)
+    compileCommandsFile = os.path.join(bldDir, COMPILE_COMMANDS_FILE_NAME)
+    hasNinja = backend in ("auto", "ninja") and os.path.exists(ninjaBldFile)
+    hasJson = backend in ("auto", "json") and os.path.exists(compileCommandsFile)
+
+    if(hasNinja and hasJson):
+        index = NinjaParser.LoadSourceIndex(ninjaBldFile, bldDir, cachedOnly=True)
+        if(index is not None):
+            return ninjaBldFile, index
+    if(hasJson):
+        return compileCommandsFile, LoadCompileCommandsIndex(compileCommandsFile)
+    if(hasNinja):
+        return ninjaBldFile, NinjaParser.LoadSourceIndex(ninjaBldFile, bldDir)
+    return None, None
@@ -6,6 +6,7 @@ import string
 import json
 import subprocess
 import glob
+import HeaderResolver
 from graphviz import Digraph
 
 # TODO
@@ -62,6 +63,10 @@ def LoadIncludeSearchPaths(everything):
     includeSearchPaths.extend(x[2:] if not x[-1] == "." else x[2:-1] for x in m)
     rawIncludeSearchPaths = [x if os.path.isabs(x) else os.path.join(everything["bldDir"], x) for x in includeSearchPaths]
     everything["includeSearchPaths"] = [os.path.normpath(x) for x in rawIncludeSearchPaths]
+    # -isystem <dir>, searched after all the -I folders
+    rawSystemSearchPaths = re.findall(r"-isystem\s+([^\s]+)", line)
+    everything["systemSearchPaths"] = [os.path.normpath(x if os.path.isabs(x) else os.path.join(everything["bldDir"], x)) for x in rawSystemSearchPaths]
+    everything["searchPath"] = everything["headerResolver"].GetSearchPath([], everything["includeSearchPaths"], everything["systemSearchPaths"])
     return
 
 def PreProcessSrcFile(everything, srcFileFullpath):
@@ -101,24 +106,19 @@ def GetNextItemFromBacklog(everything):
             return t # <srcFileFullpath, preprocessedSrcFile>
     return None
 
-def ResolveFullPathForHeader(everything, headerToResolve, dirOfIncluder):
-    includeSearchPaths = everything["includeSearchPaths"]
-    includeSearchPaths2 = includeSearchPaths + [dirOfIncluder]
-    for d in includeSearchPaths2:
-        headerFullpath = os.path.join(d, headerToResolve)
-        if(os.path.exists(headerFullpath)):
-            return os.path.normpath(headerFullpath)
-    return None
+def ResolveFullPathForHeader(everything, headerToResolve, quoted, dirOfIncluder):
+    # "..." looks in the includer's folder first, <...> only in the search paths. See HeaderResolver.py.
+    return everything["searchPath"].Resolve(headerToResolve, quoted, dirOfIncluder)[0]
 
 def GetIncludesFromAFile(everything, ppSrcFileFullpath, originalSrcFileDir):
     with open(ppSrcFileFullpath, "r") as f:
         lines = f.readlines()
     includes = []
     for line in lines:
-        m = re.match(r"#include\s+[<\"](.*)[>\"]", line)
+        m = re.match(r"#include\s+([<\"])(.*)[>\"]", line)
         if(not m is None):
-            header = m.group(1)
-            headerFullpath = ResolveFullPathForHeader(everything, header, originalSrcFileDir)
+            header = m.group(2)
+            headerFullpath = ResolveFullPathForHeader(everything, header, m.group(1) == "\"", originalSrcFileDir)
             if(not headerFullpath is None):
                 includes.append(headerFullpath)
             else:
@@ -288,6 +288,7 @@ if __name__=="__main__":
         everything["backlog"] = dict()
         # <nodeA, <nodeX, nodeY, nodeZ, ...>>, A connects "to" X, Y, Z, ...
         everything["graphMatrix"] = dict()
+        everything["headerResolver"] = HeaderResolver.HeaderResolver() # every folder is listed once, every header looked up once
         CleanseArgs(everything)
         DoWork(everything)
         GenerateGraph(everything)
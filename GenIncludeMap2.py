@@ -9,246 +9,21 @@ The generation is based on C preprocessor result.
 Sample:
 python3 GenIncludeMap2.py  -z ~/zephyr/ -b ~/zephyr/build -t ~/toolchain/arm32-none-eabi/bin/arm-none-eabi-gcc -s ~/zephyr/samples/drivers/uart/echo_bot/src/main.c
 
+Whole-build sample (every C/C++ file in build.ninja, 8 preprocessors at a time):
+python3 GenIncludeMap2.py  -z ~/zephyr/ -b ~/zephyr/build -t ~/toolchain/arm32-none-eabi/bin/arm-none-eabi-gcc --all -j 8
+python3 GenIncludeMap2.py  -z ~/zephyr/ -b ~/zephyr/build -t ~/toolchain/arm32-none-eabi/bin/arm-none-eabi-gcc --targets "kernel/*.c"
+
 """
 import sys
 import os.path
-import re
-import subprocess
-import glob
 import argparse
-from graphviz import Digraph
-
-def ErrorHandling(everything, errNo):
-    if(errNo == 1):
-        print("The source file [{0}] is not part of the build.".format(everything["srcFileFullPath"]))
-    elif (errNo == 2):
-        print("\"build.ninja\" file cannot be found at [{0}].".format(everything["bldDir"]))
-        print("Did you specify a wrong build folder?")
-    elif (errNo == 3):
-        print("Failed to render the graph.")
-        print("Is the file [{0}] writable?".format(everything["pdfFileFullPath"]))
-    sys.exit(0)
-    return
-
-def GetNinjaBuildFile(everything):
-    ninjaBldFileFullPath = os.path.join(everything["bldDir"], "build.ninja")
-    if(not os.path.exists(ninjaBldFileFullPath)):
-        ErrorHandling(everything, 2)
-    everything["ninjaBldFile"] = ninjaBldFileFullPath    
-    print(f"[Ninja build file found:]{os.linesep}{everything["ninjaBldFile"]}")
-    return
-
-def GetNinjaBuildBlock4SourceFile(everything):
-    srcFileFullPath = everything["srcFileFullPath"]
-    zephyrDir = everything["zephyrDir"]
-    srcFileRelativePath = os.path.relpath(srcFileFullPath, zephyrDir).replace(os.path.sep, "/")
-    target = r"build\s.*{0}".format(srcFileRelativePath)
-    nextTarget = r"build\s[^:]*:"
-    buildBlockLines = []
-    with open(everything["ninjaBldFile"], "r") as f:
-        lines = f.readlines()
-        collect = False
-        for line in lines:
-            if(re.match(target, line)):
-                collect = True
-                continue
-            if(collect and re.match(nextTarget, line)):
-                break
-            if(collect):
-                buildBlockLines.append(line)
-    if(len(buildBlockLines) == 0):
-        ErrorHandling(everything, 1)
-    everything["buildBlockLines"] = buildBlockLines
-    return
-
-def LoadIncludeSearchPaths(everything):
-    includeSearchPaths = []
-    for line in everything["buildBlockLines"]:
-        if("INCLUDES" in line):
-            break
-
-    # -I<dir>
-    m = re.findall(r"(-I[^\s]+)", line) #(-I[^\s]+)|(-isystem\s[^\s]+)
-    includeSearchPaths.extend(x[2:] if not x[-1] == "." else x[2:-1] for x in m)
-    rawIncludeSearchPaths = [x if os.path.isabs(x) else os.path.join(everything["bldDir"], x) for x in includeSearchPaths]
-    includeSearchPaths = " ".join(["-I{0}".format(os.path.normpath(x)) for x in rawIncludeSearchPaths])
-
-    # -isystem <dir>
-    rawSystemSearchPaths = re.findall(r"(-isystem\s[^\s]+)", line)
-    systemSearchPaths = " ".join(rawSystemSearchPaths)
-
-    everything["includeSearchPaths"] = "{0} {1}".format(includeSearchPaths, systemSearchPaths)
-    return
-
-def LoadConfigMacros(everything):
-    for line in everything["buildBlockLines"]:
-        if("DEFINES" in line):
-            break
-    m = re.match(r".*=\s+(.*)", line)
-    configMacros = m.group(1) #load DEFINES from the build.ninja
-    everything["configMacros"] = configMacros
-    return
-
-def LoadBuildFlags(everything):
-    bldFlags = list()
-    for line in everything["buildBlockLines"]:
-        if("FLAGS" in line):
-            break
-    m = re.match(r".*=\s+(.*)", line)
-    bldFlags = m.group(1) #load FLAGS from the build.ninja
-    everything["bldFlags"] = bldFlags
-    return
-
-def PreProcessSrcFile(everything):
-    GetNinjaBuildFile(everything)
-    GetNinjaBuildBlock4SourceFile(everything)
-    LoadIncludeSearchPaths(everything)
-    LoadConfigMacros(everything)
-    LoadBuildFlags(everything)
-
-    cmdString = r"{0} -E {1} {2} {3} {4}".format(everything["gccFullPath"], everything["configMacros"], everything["includeSearchPaths"], everything["bldFlags"], everything["srcFileFullPath"])
-    srcFile = os.path.basename(everything["srcFileFullPath"])
-    ppSrcFile = "pp." + srcFile
-    ppSrcFileFullpath = os.path.join(".", ppSrcFile)
-    everything["ppFileFullPath"] = ppSrcFileFullpath
-    # print (f"preprocessed file: {ppSrcFileFullpath}")
-
-    with open(ppSrcFileFullpath, "w") as f:
-        subprocess.run(cmdString, stdout=f, shell=True)
-    return
-
-def GenerateGraphMatrix(everything):
-    lineStack = []
-    lineStack.append(os.path.normpath(os.path.realpath(everything["srcFileFullPath"])))
-    gm = everything["graphMatrix"]
-
-    with open(everything["ppFileFullPath"], "r") as f:
-        fileContent = f.read()
-    
-    #https://gcc.gnu.org/onlinedocs/gcc-3.4.6/cpp/Preprocessor-Output.html
-    lineMarkerRegex = r"#\s+\d+\s+\"(.*)\"\s+([12])"
-    lineMarkers = re.findall(lineMarkerRegex, fileContent)
-    for rawLineMarker in lineMarkers:
-        filePath = os.path.normpath(os.path.realpath(rawLineMarker[0]))
-        fileFlag = rawLineMarker[1]
-        if(fileFlag == '1'):
-            fromFile = lineStack[-1]
-            lineStack.append(filePath)
-            if(not fromFile in gm.keys()):
-                gm[fromFile] = []
-            toFile = filePath
-            if(toFile not in gm[fromFile]):
-                gm[fromFile].append(toFile)
-        elif (fileFlag == '2'):
-            lineStack.pop(-1) 
-    return
-
-def IsGeneratedFile(everything, filePath):
-    # return os.path.relpath(filePath, everything["bldDir"]) in filePath
-    return everything["bldDir"] in os.path.realpath(os.path.abspath(filePath))
-
-def IsZephyrNativeFile(everything, filePath):
-    # return os.path.relpath(filePath, everything["zephyrDir"]) in filePath
-    return everything["zephyrDir"] in os.path.realpath(os.path.abspath(filePath))
-
-def IsTheStartingNode(everything, filePath):
-    return everything["srcFileFullPath"] in os.path.realpath(os.path.abspath(filePath))
-
-def IsToolChainFile(everything, filePath):
-    # return everything["gccIncludePath"] in os.path.realpath(os.path.abspath(filePath))
-    return "zephyr-sdk" in os.path.realpath(os.path.abspath(filePath))
-
-def DetermineNodeLooks(everything, node):
-    nodeText = os.path.relpath(node, everything["zephyrDir"]).replace(os.path.sep, "/\n")
-    shape = "oval"
-    style = "filled"
-    fontName = ""
-    if(IsGeneratedFile(everything, node)):            
-        nodeColor = "orange"
-    elif(IsTheStartingNode(everything, node)):
-        shape = "box"
-        nodeColor = "green"
-        fontName = "bold"
-    # elif(IsToolChainFile(everything, node)):
-    #     shape = "diamond"
-    #     # nodeText = r"\<{0}\>".format(os.path.basename(node)) # use "<xxx>" for toolchain headers
-    #     # print (f"\t{os.path.relpath(node, everything["gccIncludePath"])} - {node}")
-    #     # nodeText = os.path.relpath(node, everything["gccIncludePath"]).replace(os.path.sep, "/\n")
-    #     nodeColor = "lightgrey"
-    elif(IsZephyrNativeFile(everything, node)):
-        nodeColor = "lightblue"
-    else:
-        nodeColor = "black"
-        style = ""
-    return tuple([nodeText, nodeColor, shape, style, fontName])
-
-def AddLegends(graph):
-    nodeText = "Generated Files"
-    shape = "oval"
-    style = "filled"
-    nodeColor = "orange"
-    graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
-
-    # nodeText = "Toolchain Files"
-    # shape = "diamond"
-    # style = "filled"
-    # nodeColor = "lightgrey"
-    # graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
-
-    nodeText = "In-Zephyr Files"
-    shape = "oval"
-    style = "filled"
-    nodeColor = "lightblue"
-    graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
-
-    nodeText = "Out-of-Zephyr Files"
-    shape = "oval"
-    style = ""
-    nodeColor = "black"
-    graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
-    pass
-
-def DumpGraph(everything):
-    gm = everything["graphMatrix"]
-    print (f"Dump graph")
-    for fromNode in gm.keys():
-        print (f"{fromNode}:\n\t{gm[fromNode]}")
-
-def GenerateGraph(everything):
-    graph = Digraph(engine="dot", comment="Include Map for {0}".format(everything["srcFileFullPath"]))
-    gm = everything["graphMatrix"]
-    drawnNodes = []
-    for fromNode in gm.keys():
-        looks1 = DetermineNodeLooks(everything, fromNode)
-        if(looks1[0] not in drawnNodes):
-            graph.node(looks1[0], label = looks1[0], color = looks1[1], shape = looks1[2], style = looks1[3], fontname = looks1[4])
-            drawnNodes.append(looks1[0])
-        for toNode in gm[fromNode]:
-            looks2 = DetermineNodeLooks(everything, toNode)
-            if(looks2[0] not in drawnNodes):
-                graph.node(looks2[0], label = looks2[0], color = looks2[1], shape = looks2[2], style = looks2[3], fontname = looks2[4])
-                drawnNodes.append(looks2[0])
-            graph.edge(looks1[0], looks2[0])
-
-    AddLegends(graph)
-
-    graphFileName = os.path.basename(everything["srcFileFullPath"])
-    try:
-        pdfFileFullPath = os.path.realpath("./IncludeMap_{0}.gv.pdf".format(graphFileName))
-        everything["pdfFileFullPath"] = pdfFileFullPath
-        graph.render(os.path.realpath("./IncludeMap_{0}.gv".format(graphFileName)), view= False, format="pdf") # graphviz will add the pdf suffix
-    except:
-        print(sys.exc_info()[0])
-        ErrorHandling(everything, 3)
-    pass
-
-def DoWork(everything):
-    print(f"[Start generating include map for:]{os.linesep}{everything["srcFileFullPath"]}")
-    PreProcessSrcFile(everything)
-    GenerateGraphMatrix(everything)
-    # DumpGraph(everything)
-    GenerateGraph(everything)
-    return
+import CompileDb
+import GraphExport
+import PreProcessorCache
+import PathCanonicalizer
+# the map stages are in IncludeMap.py and the queries in ReverseIndex.py and Reachability.py,
+# each imported only by the commands running them: "includers" and --help stay within
+# the startup budget of bench/RunBench.py
 
 def ParseArgs():
     """
@@ -257,45 +32,167 @@ def ParseArgs():
     - which overrides to apply
     """
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=("map", "serve", "includers", "analyze", "diff"), default="map", help="map: generate include maps (default).\nserve: keep the build information and include maps in memory and answer queries\non http://127.0.0.1:<port>/, see IncludeMapServer.py.\nincluders: list the translation units including the --header files, and through which chain,\nfrom the include maps cached by earlier runs, see ReverseIndex.py.\nanalyze: list the includes already pulled in by an earlier include of the same file,\nthe deepest and heaviest include chains and the include cycles of the build,\nfrom the include maps cached by earlier runs, see Reachability.py.\ndiff: compare the include maps of the same source files in several -b builds,\ne.g. one per board, and list the headers and includes each build adds or removes, see BuildDiff.py.")
     parser.add_argument("-z", "--zephyrDir", required=True, type=str, help="the full path of the zephyr RTOS.")
-    parser.add_argument("-b", "--bldDir", required=True, type=str, help="the Zephyr build folder where build.ninja file is located.")
-    parser.add_argument("-t", "--gccFullPath", required=True, type=str, help="the full path of the GCC used to build Zephyr.")
-    parser.add_argument("-s", "--srcFileFullPath", required=True, type=str, help="the full path of the Zephyr source file to generate include map for.")
+    parser.add_argument("-b", "--bldDir", required=True, type=str, nargs="+", help="the Zephyr build folder where build.ninja or compile_commands.json file is located.\n\"diff\" takes several, the first one is the base of the comparison.")
+    parser.add_argument("-t", "--gccFullPath", required=True, type=str, nargs="+", help="the full path of the GCC used to build Zephyr.\n\"diff\" takes one per -b build folder, or one for all of them.")
+    targets = parser.add_mutually_exclusive_group()
+    targets.add_argument("-s", "--srcFileFullPath", type=str, help="the full path of the Zephyr source file to generate include map for.")
+    targets.add_argument("--all", action="store_true", help="generate include maps for every C/C++ source file in the compile database.")
+    targets.add_argument("--targets", type=str, help="like --all, but only for the source files matching this glob,\neither as a full path or relative to the zephyr folder, e.g. \"kernel/*.c\".")
+    parser.add_argument("--compileDb", type=str, choices=CompileDb.BACKENDS, default="auto", help="where to read the compile settings from: build.ninja, compile_commands.json,\nor \"auto\" to pick the faster one available in the build folder.")
+    parser.add_argument("--depsOnly", action="store_true", help="build the map from the \"-H\" header trace of the preprocessor instead of its full \"-E\" output.\nmuch faster and nothing is written to disk, but the map may differ slightly from the line markers:\nthe headers included by the -include/-imacros files are missing.")
+    parser.add_argument("--keepPP", action="store_true", help="keep the preprocessed output as ./pp.<source file>.\nby default it is only streamed from the preprocessor and never written to disk.")
+    parser.add_argument("--rebuild", action="store_true", help="preprocess every source file again, even if neither its command line\nnor any header it includes has changed since the last run.")
+    parser.add_argument("--format", type=str, nargs="+", choices=("pdf", "gv") + GraphExport.FORMATS, default=["pdf"], help="what to generate, one or more of:\npdf: the rendered map (default), gv: the Graphviz source only, without the slow layout,\njson/graphml/msgpack: the graph as data, with node categories and include order.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="how many source files to preprocess in parallel with --all/--targets.\ndefault: the number of CPUs.")
+    parser.add_argument("--timeout", type=float, default=300, help="kill a preprocessor running longer than this, in seconds. With --all/--targets and diff,\nthe other source files go on and the failed ones are listed with the reason at the end.\n0: no limit. default: 300.")
+    parser.add_argument("--headerCost", type=int, nargs="?", const=30, help="count the preprocessed lines and bytes every header adds to every translation unit,\nand rank the headers by the bytes they add over all translation units (fan-out x weight).\nprints the top N (default 30), the full table is saved as ./HeaderCost_<map>.csv.")
+    parser.add_argument("--profile", type=str, nargs="?", const="table", choices=("table", "trace"), help="measure every stage: wall and CPU time, peak RSS, bytes, line markers, nodes and edges,\nsummed over the translation units. table: print a summary (default),\ntrace: save Chrome trace events as ./IncludeMap_<map>.trace.json, one row per job.")
+    parser.add_argument("--ppCacheDir", type=str, help="a preprocessor cache shared by build folders and users, like ccache:\nthe include structure is reused if the command line, the compiler, the source file\nand every header it included are unchanged, without running the compiler.\nits entries are plain JSON, checked on load, but anyone who can write to the folder\ncan make the maps of the others wrong: only share it with users you trust.")
+    parser.add_argument("--ppCacheSize", type=int, default=PreProcessorCache.DEFAULT_PP_CACHE_SIZE_MB, help="the size cap of --ppCacheDir in MB, the least recently used entries are removed.\ndefault: {0}.".format(PreProcessorCache.DEFAULT_PP_CACHE_SIZE_MB))
+    parser.add_argument("--scanner", action="store_true", help="build the map with the built-in include scanner instead of the preprocessor:\nonly the #if/#include directives are evaluated, against DEFINES, autoconf.h and the\nsearch paths, no compiler is run except once for its predefined macros, see IncludeScanner.py.")
+    parser.add_argument("--scannerDiff", action="store_true", help="build the map with the preprocessor, scan every source file too,\nand print the includes only one of them found, to check the scanner on a build.")
+    parser.add_argument("--focus", type=str, nargs="+", help="only draw the include chains from the source files to these headers,\neither as a full path or the end of one, e.g. \"sys/util.h\".")
+    parser.add_argument("--maxDepth", type=int, help="only draw the headers at most N includes away from the source files, N >= 1.")
+    parser.add_argument("--collapse", type=str, nargs="+", help="draw every header under these folders as one node per folder,\neither as a full path or relative to the zephyr folder, e.g. \"include/zephyr/sys\".")
+    parser.add_argument("--reduce", action="store_true", help="transitive reduction: do not draw an include if the header is also included\nthrough another direct include of the same file.\n--focus, --maxDepth, --collapse and --reduce only change the pdf/gv map, see GraphView.py.")
+    parser.add_argument("--header", type=str, nargs="+", help="the headers for \"includers\", either as a full path or relative to the zephyr folder.")
+    parser.add_argument("--top", type=int, default=20, help="how many entries of each list \"analyze\" prints, the full report is saved as ./IncludeAnalysis_all.json.\ndefault: 20.")
+    parser.add_argument("--port", type=int, default=8765, help="the localhost port of \"serve\". default: 8765.")
 
     args = parser.parse_args()
+    if(args.command in ("map", "diff") and args.srcFileFullPath is None and not args.all and args.targets is None):
+        parser.error("one of the arguments -s/--srcFileFullPath --all --targets is required")
+    if(args.maxDepth is not None and args.maxDepth < 1):
+        parser.error("--maxDepth must be at least 1, the source files and the headers they include")
+    if(args.headerCost is not None and args.depsOnly):
+        parser.error("--headerCost counts the \"-E\" output, it cannot be used with --depsOnly")
+    if(args.scanner and (args.depsOnly or args.headerCost is not None or args.keepPP or args.scannerDiff)):
+        parser.error("--scanner runs no preprocessor, it cannot be used with --depsOnly, --headerCost, --keepPP or --scannerDiff")
+    if(args.command != "diff" and (len(args.bldDir) > 1 or len(args.gccFullPath) > 1)):
+        parser.error("only diff takes several -b/--bldDir or -t/--gccFullPath")
+    if(args.command == "diff" and (len(args.bldDir) < 2 or len(args.gccFullPath) not in (1, len(args.bldDir)))):
+        parser.error("diff needs two or more -b/--bldDir, and one -t/--gccFullPath or one per -b/--bldDir")
+    if(args.command == "includers" and args.header is None):
+        parser.error("the argument --header is required for includers")
     return args
 
-def CleanseArgs(everything):
-    # TODO...
+def OutputIncluders(everything, headers):
+    import ReverseIndex
+    index = ReverseIndex.LoadReverseIndex(everything["bldDir"]) # tu-graphs.bin is loaded only if the graph store is stale
+    if(index is None):
+        import IncludeMap
+        IncludeMap.ErrorHandling(everything, 7)
+    for header in headers:
+        if(not os.path.isabs(header)):
+            header = os.path.join(everything["zephyrDir"], header)
+        headerFullPath = everything["pathCanonicalizer"].CanonicalPath(header)
+        includes = index.GetIncludes(headerFullPath)
+        print(f"[{len(includes)} of {index.tuCount} translation units include:]{os.linesep}{headerFullPath}")
+        for srcFileFullPath, chain in includes.items():
+            print(f"{srcFileFullPath}{os.linesep}    {" -> ".join(chain)}")
     return
 
-def OutputIncludeSearchPaths(everything):
-    print("[The include search paths:]")
-    for include in everything["includeSearchPaths"].split(" "):
-        print(f"{include}", end="")
-        if (not "isystem" in include):
-            print()
-        else:
-            print(" ", end="")
+def OutputIncludeAnalysis(everything, top):
+    import GraphStore
+    import Reachability
+    store = GraphStore.LoadGraphStore(everything["bldDir"]) # tu-graphs.bin is loaded only if the graph store is stale
+    if(store is None):
+        import IncludeMap
+        IncludeMap.ErrorHandling(everything, 7)
+    report = Reachability.AnalyzeGraphStore(store, top)
+    print(f"[Translation units analyzed:]{os.linesep}{len(report["translationUnits"])}")
+    print(Reachability.FormatAnalysis(report, top))
+    reportFileFullPath = os.path.abspath("IncludeAnalysis_all.json")
+    import json # not on the startup path of the other commands
+    with open(reportFileFullPath, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"[Include analysis saved as:]{os.linesep}{reportFileFullPath}")
     return
 
-def CleanUp(everything):
-    ppFileList = glob.glob("./pp.*")
-    for ppFile in ppFileList:
-        os.remove(ppFile)
+def CleanseArgs(everything):
+    # TODO...
     return
 
 if __name__=="__main__":
     everything = dict()
     args = ParseArgs()
     everything["zephyrDir"] = os.path.realpath(os.path.abspath(os.path.normpath(args.zephyrDir)))
-    everything["bldDir"] = os.path.realpath(os.path.abspath(os.path.normpath(args.bldDir)))
-    everything["gccFullPath"] = os.path.realpath(os.path.abspath(os.path.normpath(args.gccFullPath)))
-    everything["srcFileFullPath"] = os.path.realpath(os.path.abspath(os.path.normpath(args.srcFileFullPath)))
-    everything["graphMatrix"] = dict() # <nodeA, [nodeX, nodeY, nodeZ, ...]>, A connects "to" X, Y, Z, ...
+    bldDirs = [os.path.realpath(os.path.abspath(os.path.normpath(x))) for x in args.bldDir]
+    gccFullPaths = [os.path.realpath(os.path.abspath(os.path.normpath(x))) for x in args.gccFullPath]
+    everything["bldDir"] = bldDirs[0]
+    everything["gccFullPath"] = gccFullPaths[0]
+    toolchainDir = os.path.dirname(os.path.dirname(everything["gccFullPath"])) # <toolchainDir>/bin/<gcc>
+    everything["pathCanonicalizer"] = PathCanonicalizer.PathCanonicalizer(everything["zephyrDir"], everything["bldDir"], toolchainDir) # shared by all translation units
+    if(args.command == "includers"):
+        # a query on graph-store.bin and reverse-index.bin only, none of the map stages are loaded
+        OutputIncluders(everything, args.header)
+        sys.exit(0)
+    if(args.command == "analyze"):
+        OutputIncludeAnalysis(everything, max(1, args.top))
+        sys.exit(0)
+    import IncludeMap
+    import IncludeMapCache
+    import Profiler
+    from IncludeGraph import IncludeGraph
+    everything["graphMatrix"] = IncludeGraph() # nodeA includes nodeX, nodeY, nodeZ, ... in this order
+    everything["includeDirectives"] = IncludeGraph() # the #include directives of each file, those skipped by include guards too
+    everything["jobs"] = max(1, args.jobs)
+    everything["jobTimeout"] = args.timeout
+    everything["targets"] = args.targets
+    everything["ppFilePrefix"] = ""
+    everything["compileDbBackend"] = args.compileDb
+    everything["depsOnly"] = args.depsOnly
+    everything["keepPP"] = args.keepPP
+    everything["rebuild"] = args.rebuild
+    everything["formats"] = args.format
+    everything["headerCost"] = args.headerCost
+    everything["profiler"] = Profiler.Profiler() if args.profile is not None else None # None: no measurement at all
+    everything["profileFormat"] = args.profile
+    everything["graphCache"] = IncludeMapCache.LoadGraphCache(everything["bldDir"]) # <srcFileFullPath, graph matrix and fingerprint>
+    everything["fileStamps"] = dict() # <fileFullPath, (size, mtime)>, shared by all translation units of this run
+    everything["upToDate"] = False
+    everything["ppCacheDir"] = os.path.realpath(args.ppCacheDir) if args.ppCacheDir is not None else None
+    everything["fileHashes"] = dict() # <fileFullPath, content hash>, for the preprocessor cache
+    everything["ppCacheHit"] = False
+    everything["scanner"] = args.scanner
+    everything["focus"] = args.focus
+    everything["maxDepth"] = args.maxDepth
+    everything["collapseDirs"] = [os.path.realpath(os.path.join(everything["zephyrDir"], x)) for x in args.collapse] if args.collapse is not None else None
+    everything["reduce"] = args.reduce
+    everything["scannerDiffMode"] = args.scannerDiff
+    everything["includeScanner"] = None
+    if(args.scanner or args.scannerDiff):
+        import IncludeScanner
+        everything["includeScanner"] = IncludeScanner.ParseCache() # shared by all translation units
     CleanseArgs(everything)
-    DoWork(everything)
-    OutputIncludeSearchPaths(everything)
-    CleanUp(everything)
-    print (f"[Include map saved as:]{os.linesep}{everything["pdfFileFullPath"]}")
+    if(everything["ppCacheDir"] is not None):
+        PreProcessorCache.TrimPreProcessorCache(everything["ppCacheDir"], args.ppCacheSize << 20)
+    if(args.command == "serve"):
+        import IncludeMapServer
+        IncludeMapServer.Serve(everything, IncludeMap.BuildTranslationUnitGraph, args.port)
+        sys.exit(0)
+    if(args.command == "diff"):
+        if(args.srcFileFullPath is not None):
+            everything["srcFileFullPath"] = os.path.realpath(os.path.abspath(os.path.normpath(args.srcFileFullPath)))
+        everything["graphName"] = os.path.basename(everything["srcFileFullPath"]) if args.srcFileFullPath is not None else "all"
+        IncludeMap.DoWorkForBuilds(everything, bldDirs, gccFullPaths)
+        print(f"[Include map diff saved as:]{os.linesep}{os.linesep.join(everything["outputFiles"])}")
+        if(everything["profiler"] is not None):
+            IncludeMap.OutputProfile(everything)
+        sys.exit(0)
+    if(args.srcFileFullPath is not None):
+        everything["srcFileFullPath"] = os.path.realpath(os.path.abspath(os.path.normpath(args.srcFileFullPath)))
+        everything["startingNodes"] = {everything["srcFileFullPath"]}
+        everything["graphName"] = os.path.basename(everything["srcFileFullPath"])
+        IncludeMap.DoWork(everything)
+        IncludeMap.OutputIncludeSearchPaths(everything)
+        if("ppFileFullPath" in everything.keys()):
+            print(f"[Preprocessed file kept as:]{os.linesep}{everything["ppFileFullPath"]}")
+    else:
+        IncludeMap.DoWorkForAllTargets(everything)
+    print (f"[Include map saved as:]{os.linesep}{os.linesep.join(everything["outputFiles"])}")
+    if(everything["profiler"] is not None):
+        IncludeMap.OutputProfile(everything)
     sys.exit(0)
@@ -0,0 +1,75 @@
+"""
+Machine-readable include map export for Zephyr Include Map.
+
+The graph is written as data instead of a picture, so scripts and dashboards
+do not have to parse DOT labels, and the Graphviz layout (by far the slowest
+step for maps with 1000+ edges) is skipped entirely.
+
+Every format carries the same content:
+
+    title: what the map is for
+    roots: the node ids of the source files the map starts from
+    nodes: [{id, path, category}], category is generated/zephyr/toolchain/outOfTree
+    edges: [[fromId, toId, order]], order is the position of the include in its includer
+
+- json: plain JSON.
+- graphml: GraphML XML, for graph tools like yEd, Gephi or networkx.
+- msgpack: compact binary JSON, needs the optional "msgpack" package.
+"""
+
+FORMATS = ("json", "graphml", "msgpack")
+FILE_SUFFIXES = {"json": ".json", "graphml": ".graphml", "msgpack": ".msgpack"}
+
+def GraphToDict(title, graph, roots, categorize):
+    """
+    Flatten an IncludeGraph into plain lists; categorize(path) gives the category of a node.
+    """
+    data = dict()
+    data["title"] = title
+    data["roots"] = sorted(graph.nodeIds[x] for x in roots if x in graph.nodeIds)
+    data["nodes"] = [{"id": nodeId, "path": path, "category": categorize(path)} for nodeId, path in enumerate(graph.nodes)]
+    edges = []
+    for fromId, successors in graph.successors.items():
+        for order, toId in enumerate(successors):
+            edges.append([fromId, toId, order])
+    data["edges"] = edges
+    return data
+
+def ExportJson(data, fileFullPath):
+    import json # not on the startup path of the query commands
+    with open(fileFullPath, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    return
+
+def ExportMsgpack(data, fileFullPath):
+    import msgpack # optional, only needed for this format
+    with open(fileFullPath, "wb") as f:
+        f.write(msgpack.packb(data, use_bin_type=True))
+    return
+
+def ExportGraphML(data, fileFullPath):
+    from xml.sax.saxutils import escape, quoteattr # pulls in urllib and http.client, only needed for this format
+    with open(fileFullPath, "w") as f:
+        f.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+        f.write("<graphml xmlns=\"http://graphml.graphdrawing.org/xmlns\">\n")
+        f.write("  <key id=\"path\" for=\"node\" attr.name=\"path\" attr.type=\"string\"/>\n")
+        f.write("  <key id=\"category\" for=\"node\" attr.name=\"category\" attr.type=\"string\"/>\n")
+        f.write("  <key id=\"root\" for=\"node\" attr.name=\"root\" attr.type=\"boolean\"><default>false</default></key>\n")
+        f.write("  <key id=\"order\" for=\"edge\" attr.name=\"order\" attr.type=\"int\"/>\n")
+        f.write("  <graph id={0} edgedefault=\"directed\">\n".format(quoteattr(data["title"])))
+        roots = set(data["roots"])
+        for node in data["nodes"]:
+            f.write("    <node id=\"n{0}\"><data key=\"path\">{1}</data><data key=\"category\">{2}</data>".format(node["id"], escape(node["path"]), node["category"]))
+            if(node["id"] in roots):
+                f.write("<data key=\"root\">true</data>")
+            f.write("</node>\n")
+        for fromId, toId, order in data["edges"]:
+            f.write("    <edge source=\"n{0}\" target=\"n{1}\"><data key=\"order\">{2}</data></edge>\n".format(fromId, toId, order))
+        f.write("  </graph>\n")
+        f.write("</graphml>\n")
+    return
+
+def ExportGraph(data, fileFormat, fileFullPath):
+    exporters = {"json": ExportJson, "graphml": ExportGraphML, "msgpack": ExportMsgpack}
+    exporters[fileFormat](data, fileFullPath)
+    return
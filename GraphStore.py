@@ -0,0 +1,221 @@
+"""
+Compact graph store of Zephyr Include Map, <bldDir>/.includemap/graph-store.bin.
+
+tu-graphs.bin (see IncludeMapCache.py) keeps the graph matrix of every
+translation unit as <path, [path, ...]> dicts: loading it for a whole build
+means unpickling millions of list and string objects. The graph store keeps
+the same graphs as flat arrays of 32-bit integers, in one file that is
+memory-mapped and used as it is, without unpickling:
+
+    header          magic, version, counts, and the size+mtime of the
+                    tu-graphs.bin it was made from
+    pathOffsets     pathCount+1 offsets into the string buffer, path i is
+                    strings[pathOffsets[i]:pathOffsets[i+1]], UTF-8
+    sortedPathIds   the path ids in path order, to look a path up by binary search
+    strings         every path once, shared by all translation units
+    tuRoots         the path id of the source file of every translation unit
+    pathTus         the translation unit of every path, NO_TRANSLATION_UNIT for the
+                    headers: once the path is found, its translation unit is one
+                    read instead of a scan of tuRoots
+    tuRowStart      tuCount+1 offsets into the rows, the rows of translation unit t
+                    are rowStart[t] to rowStart[t+1]
+    rowNodes        the path id of the includer of each row
+    rowEdgeStart    rowCount+1 offsets into the edges, in the order of the rows
+    edges           the path ids of the included headers, in include order
+    tuDirectiveRowStart, directiveRowNodes, directiveRowStart, directives
+                    the include directives of every translation unit, those
+                    skipped by include guards too, laid out like the rows
+
+Each translation unit is a compressed sparse row (CSR) adjacency. The arrays
+are in native byte order, a store written on another machine fails the magic
+check and is just rebuilt.
+"""
+import os
+import os.path
+import mmap
+from array import array
+import IncludeMapCache
+
+GRAPH_STORE_FILE_NAME = "graph-store.bin"
+GRAPH_STORE_MAGIC = 0x534D495A # "ZIMS" when read in the byte order it was written in
+GRAPH_STORE_VERSION = 3 # bump when the layout changes
+HEADER_WORDS = 10 # magic, version, pathCount, stringBytes, tuCount, rowCount, edgeCount, directiveRowCount, directiveCount, reserved
+HEADER_BYTES = HEADER_WORDS * 4 + 16 # and the (size, mtime) stamp of tu-graphs.bin as two int64
+NO_TRANSLATION_UNIT = 0xFFFFFFFF
+
+def BuildGraphStore(graphCache, graphCacheStamp):
+    """
+    Return the store of the graph matrices of tu-graphs.bin as bytes, translation units in path order.
+    """
+    paths = []
+    pathIds = dict()
+    def GetPathId(path):
+        pathId = pathIds.get(path)
+        if(pathId is None):
+            pathId = len(paths)
+            paths.append(path)
+            pathIds[path] = pathId
+        return pathId
+    def AddRows(matrix, tuRowStart, rowNodes, rowEdgeStart, edges):
+        for fromNode, toNodes in matrix.items():
+            rowNodes.append(GetPathId(fromNode))
+            edges.extend(GetPathId(x) for x in toNodes)
+            rowEdgeStart.append(len(edges))
+        tuRowStart.append(len(rowNodes))
+        return
+    tuRoots = array("I")
+    graphs = [array("I", [0]), array("I"), array("I", [0]), array("I")] # tuRowStart, rowNodes, rowEdgeStart, edges
+    directives = [array("I", [0]), array("I"), array("I", [0]), array("I")] # the same for the include directives
+    for srcFileFullPath in sorted(graphCache):
+        tuRoots.append(GetPathId(srcFileFullPath))
+        AddRows(graphCache[srcFileFullPath]["graphMatrix"], *graphs)
+        AddRows(graphCache[srcFileFullPath]["includeDirectives"], *directives)
+    strings = bytearray()
+    pathOffsets = array("I", [0])
+    for path in paths:
+        strings += path.encode("utf-8", "surrogateescape")
+        pathOffsets.append(len(strings))
+    strings += b"\0" * (-len(strings) % 4) # keep the arrays after it aligned
+    pathTus = array("I", [NO_TRANSLATION_UNIT]) * len(paths)
+    for tuIndex, pathId in enumerate(tuRoots):
+        pathTus[pathId] = tuIndex
+    sortedPathIds = array("I", sorted(range(len(paths)), key=lambda x: paths[x].encode("utf-8", "surrogateescape")))
+    header = array("I", [GRAPH_STORE_MAGIC, GRAPH_STORE_VERSION, len(paths), len(strings), len(tuRoots), len(graphs[1]), len(graphs[3]), len(directives[1]), len(directives[3]), 0])
+    stamp = array("q", graphCacheStamp)
+    return b"".join([header.tobytes(), stamp.tobytes(), pathOffsets.tobytes(), sortedPathIds.tobytes(), bytes(strings), tuRoots.tobytes(), pathTus.tobytes()] + [x.tobytes() for x in graphs + directives])
+
+class GraphStore:
+    """
+    Read-only view of a graph store, on an mmap or on bytes; nothing is copied but the paths asked for.
+    """
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        header = view[:HEADER_WORDS * 4].cast("I")
+        if(len(view) < HEADER_BYTES or header[0] != GRAPH_STORE_MAGIC or header[1] != GRAPH_STORE_VERSION):
+            raise ValueError("not a graph store")
+        self.pathCount, stringBytes, self.tuCount, rowCount, edgeCount, directiveRowCount, directiveCount = header[2:9]
+        self.graphCacheStamp = tuple(view[HEADER_WORDS * 4:HEADER_BYTES].cast("q"))
+        offset = HEADER_BYTES
+        def Take(count):
+            nonlocal offset
+            section = view[offset:offset + count * 4].cast("I")
+            offset += count * 4
+            return section
+        self.pathOffsets = Take(self.pathCount + 1)
+        self.sortedPathIds = Take(self.pathCount)
+        self.strings = view[offset:offset + stringBytes]
+        offset += stringBytes
+        self.tuRoots = Take(self.tuCount)
+        self.pathTus = Take(self.pathCount)
+        self.tuRowStart = Take(self.tuCount + 1)
+        self.rowNodes = Take(rowCount)
+        self.rowEdgeStart = Take(rowCount + 1)
+        self.edges = Take(edgeCount)
+        self.tuDirectiveRowStart = Take(self.tuCount + 1)
+        self.directiveRowNodes = Take(directiveRowCount)
+        self.directiveRowStart = Take(directiveRowCount + 1)
+        self.directives = Take(directiveCount)
+        if(offset != len(view)):
+            raise ValueError("truncated graph store")
+
+    def GetPath(self, pathId):
+        return str(self.strings[self.pathOffsets[pathId]:self.pathOffsets[pathId + 1]], "utf-8", "surrogateescape")
+
+    def GetPathBytes(self, pathId):
+        return bytes(self.strings[self.pathOffsets[pathId]:self.pathOffsets[pathId + 1]])
+
+    def FindPathId(self, path):
+        # binary search in the sorted path ids, None if the path is not in the store
+        key = path.encode("utf-8", "surrogateescape")
+        low, high = 0, self.pathCount
+        while(low < high):
+            middle = (low + high) // 2
+            if(self.GetPathBytes(self.sortedPathIds[middle]) < key):
+                low = middle + 1
+            else:
+                high = middle
+        if(low < self.pathCount and self.GetPathBytes(self.sortedPathIds[low]) == key):
+            return self.sortedPathIds[low]
+        return None
+
+    def GetTranslationUnit(self, srcFileFullPath):
+        # the index of the translation unit of a source file, None if it is not in the store:
+        # O(log n) for the binary search of the path, then one read of pathTus
+        pathId = self.FindPathId(srcFileFullPath)
+        if(pathId is None or self.pathTus[pathId] == NO_TRANSLATION_UNIT):
+            return None
+        return self.pathTus[pathId]
+
+    def GetSuccessors(self, tuIndex):
+        """
+        Return <includer path id, included path ids> of a translation unit, in include order, as array views.
+        """
+        return GetRows(tuIndex, self.tuRowStart, self.rowNodes, self.rowEdgeStart, self.edges)
+
+    def GetDirectives(self, tuIndex):
+        """
+        Return <includer path id, path ids of its include directives> of a translation unit, in directive order,
+        empty if they were not recorded (--depsOnly).
+        """
+        return GetRows(tuIndex, self.tuDirectiveRowStart, self.directiveRowNodes, self.directiveRowStart, self.directives)
+
+    def GetGraphMatrix(self, tuIndex):
+        # the <path, [path, ...]> graph matrix of a translation unit, as in tu-graphs.bin
+        return {self.GetPath(x): [self.GetPath(y) for y in toIds] for x, toIds in self.GetSuccessors(tuIndex).items()}
+
+def GetRows(tuIndex, tuRowStart, rowNodes, rowEdgeStart, edges):
+    rows = dict()
+    for row in range(tuRowStart[tuIndex], tuRowStart[tuIndex + 1]):
+        rows[rowNodes[row]] = edges[rowEdgeStart[row]:rowEdgeStart[row + 1]]
+    return rows
+
+def GetGraphStoreFileFullPath(bldDir):
+    return IncludeMapCache.GetCacheFileFullPath(bldDir, GRAPH_STORE_FILE_NAME)
+
+def OpenGraphStore(fileFullPath):
+    # memory-mapped, the pages are read by the OS when they are used; None if missing or not a store
+    try:
+        with open(fileFullPath, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # stays valid after the file is closed
+    except (OSError, ValueError): # missing, or empty
+        return None
+    try:
+        return GraphStore(buffer)
+    except (ValueError, TypeError):
+        return None
+
+def SaveGraphStore(bldDir, graphCache):
+    """
+    Write the store of tu-graphs.bin, which has to be saved first, and return it.
+    """
+    graphCacheStamp = IncludeMapCache.GetFileStamp(IncludeMapCache.GetCacheFileFullPath(bldDir, IncludeMapCache.GRAPH_CACHE_FILE_NAME))
+    data = BuildGraphStore(graphCache, graphCacheStamp)
+    fileFullPath = GetGraphStoreFileFullPath(bldDir)
+    tmpFileFullPath = "{0}.{1}.tmp".format(fileFullPath, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(fileFullPath), exist_ok=True)
+        with open(tmpFileFullPath, "wb") as f:
+            f.write(data)
+        os.replace(tmpFileFullPath, fileFullPath) # a store being mapped by a query is not changed
+    except OSError:
+        if(os.path.exists(tmpFileFullPath)):
+            os.remove(tmpFileFullPath)
+    return GraphStore(data)
+
+def LoadGraphStore(bldDir, graphCache = None):
+    """
+    Return the store of the build folder, None if no include map has been cached yet.
+    The saved store is used as long as tu-graphs.bin is unchanged, otherwise it is made again from it.
+    """
+    try:
+        graphCacheStamp = IncludeMapCache.GetFileStamp(IncludeMapCache.GetCacheFileFullPath(bldDir, IncludeMapCache.GRAPH_CACHE_FILE_NAME))
+    except OSError:
+        return None
+    store = OpenGraphStore(GetGraphStoreFileFullPath(bldDir))
+    if(store is not None and store.graphCacheStamp == graphCacheStamp):
+        return store
+    if(graphCache is None):
+        graphCache = IncludeMapCache.LoadGraphCache(bldDir)
+    if(len(graphCache) == 0):
+        return None
+    return SaveGraphStore(bldDir, graphCache)
@@ -0,0 +1,125 @@
+"""
+Rendering views of Zephyr Include Map, to keep huge maps readable and the "dot" layout fast.
+
+The map of kernel/thread.c has over a thousand edges, and the "dot" layout
+cost grows much faster than the edge count. These views make a smaller
+IncludeGraph for Graphviz, the graph itself and the data exports are not
+changed. They are applied in this order:
+
+    --focus foo.h      only the include chains from the source files to the headers
+                       matching foo.h (a full path, or the end of one, e.g. sys/util.h)
+    --maxDepth N       only the headers at most N includes away from the source files
+    --collapse DIR     every header under DIR becomes one node for DIR, the edges
+                       inside DIR are dropped
+    --reduce           transitive reduction: an include is dropped if the header is
+                       also reached through another direct include of the same file
+
+The transitive reduction works on the strongly connected components, as
+headers including each other (guarded) make cycles, with the reachable
+components of each component as an integer bit set, in reverse topological
+order: one pass over the graph, see Reachability.py.
+"""
+import os.path
+from collections import deque
+from IncludeGraph import IncludeGraph
+from PathCanonicalizer import IsInDir
+from Reachability import Reachability
+
+def FindNodeIds(graph, patterns):
+    # a full path, or the trailing components of a path
+    nodeIds = set()
+    for pattern in patterns:
+        pattern = os.path.normpath(pattern)
+        suffix = os.path.sep + pattern
+        nodeIds.update(nodeId for nodeId, path in enumerate(graph.nodes) if path == pattern or path.endswith(suffix))
+    return nodeIds
+
+def GetRootIds(graph, roots):
+    return [graph.nodeIds[x] for x in roots if x in graph.nodeIds]
+
+def GetDepths(graph, rootIds):
+    # the include distance of every node reachable from the roots
+    depths = {x: 0 for x in rootIds}
+    queue = deque(rootIds)
+    while(len(queue) > 0):
+        nodeId = queue.popleft()
+        for toId in graph.successors.get(nodeId, ()):
+            if(toId not in depths):
+                depths[toId] = depths[nodeId] + 1
+                queue.append(toId)
+    return depths
+
+def GetPredecessors(graph):
+    predecessors = [[] for x in graph.nodes]
+    for fromId, successors in graph.successors.items():
+        for toId in successors:
+            predecessors[toId].append(fromId)
+    return predecessors
+
+def SelectEdges(graph, keepEdge):
+    # a new graph with the edges kept, in the same include order
+    view = IncludeGraph()
+    nodes = graph.nodes
+    for fromId, successors in graph.successors.items():
+        for toId in successors:
+            if(keepEdge(fromId, toId)):
+                view.AddEdge(nodes[fromId], nodes[toId])
+    return view
+
+def Focus(graph, roots, patterns):
+    forward = GetDepths(graph, GetRootIds(graph, roots))
+    targetIds = FindNodeIds(graph, patterns)
+    predecessors = GetPredecessors(graph)
+    backward = set(targetIds)
+    queue = deque(targetIds)
+    while(len(queue) > 0):
+        for fromId in predecessors[queue.popleft()]:
+            if(fromId not in backward):
+                backward.add(fromId)
+                queue.append(fromId)
+    return SelectEdges(graph, lambda a, b: a in forward and b in forward and a in backward and b in backward)
+
+def PruneDepth(graph, roots, maxDepth):
+    depths = GetDepths(graph, GetRootIds(graph, roots))
+    return SelectEdges(graph, lambda a, b: a in depths and depths[a] < maxDepth)
+
+def Collapse(graph, dirPaths):
+    """
+    Return the graph with the nodes under each folder merged into the folder, and the folder nodes used.
+    """
+    dirPaths = sorted(dirPaths, key=len, reverse=True) # the innermost folder wins
+    mapped = []
+    for path in graph.nodes:
+        mapped.append(next((x for x in dirPaths if IsInDir(path, x)), path))
+    view = IncludeGraph()
+    for fromId, successors in graph.successors.items():
+        for toId in successors:
+            if(mapped[fromId] != mapped[toId]):
+                view.AddEdge(mapped[fromId], mapped[toId])
+    collapsedNodes = set(dirPaths) & set(view.nodeIds)
+    return view, collapsedNodes
+
+def TransitiveReduction(graph):
+    reachability = Reachability(len(graph.nodes), graph.successors)
+    component = reachability.component
+    # covered: the components reachable through two or more edges, through a successor and not as the successor itself
+    covered = [0] * reachability.componentCount
+    for c in range(reachability.componentCount):
+        for s in reachability.componentSuccessors[c]:
+            covered[c] |= reachability.reach[s] & ~(1 << s)
+    return SelectEdges(graph, lambda a, b: component[a] == component[b] or not (covered[component[a]] >> component[b]) & 1)
+
+def ApplyViews(graph, roots, focus = None, maxDepth = None, collapseDirs = None, reduce = False):
+    """
+    Return the graph to render and the folder nodes of --collapse.
+    """
+    collapsedNodes = set()
+    if(focus is not None):
+        graph = Focus(graph, roots, focus)
+    if(maxDepth is not None):
+        graph = PruneDepth(graph, roots, maxDepth)
+    if(collapseDirs is not None):
+        graph, collapsedNodes = Collapse(graph, collapseDirs)
+    if(reduce):
+        graph = TransitiveReduction(graph)
+    return graph, collapsedNodes
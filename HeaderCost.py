@@ -0,0 +1,98 @@
+"""
+Header cost analytics of Zephyr Include Map.
+
+The line markers of the "-E" output tell exactly which lines of the
+preprocessed text come from which file. Counting them gives, per
+translation unit and per file:
+
+    selfLines, selfBytes: the preprocessed text of the file itself
+    lines, bytes: the same plus everything the file includes, i.e. what
+                  including it adds to the translation unit
+
+Over the whole build, the bytes a header adds summed over the translation units
+including it (its weight x its fan-out) approximates the compile time spent on
+it, which is what the ranked table shows.
+"""
+import os
+import csv
+
+# the per-file counters of a translation unit: <path, [selfLines, selfBytes, lines, bytes]>
+SELF_LINES = 0
+SELF_BYTES = 1
+LINES = 2
+BYTES = 3
+
+class HeaderCostCounter:
+    """
+    Fed by GenerateGraphMatrix(): Enter()/Leave() on the line markers, the other lines are counted in
+    self.current, the [lines, bytes, nested lines, nested bytes] of the file on top of the include stack.
+    """
+    def __init__(self, srcFileFullPath):
+        self.costs = dict()
+        self.stack = [(srcFileFullPath, [0, 0, 0, 0])]
+        self.current = self.stack[-1][1]
+
+    def Enter(self, filePath):
+        self.stack.append((filePath, [0, 0, 0, 0]))
+        self.current = self.stack[-1][1]
+        return
+
+    def Leave(self):
+        filePath, counts = self.stack.pop(-1)
+        lines = counts[0] + counts[2]
+        nbytes = counts[1] + counts[3]
+        cost = self.costs.get(filePath)
+        if(cost is None):
+            cost = [0, 0, 0, 0]
+            self.costs[filePath] = cost
+        cost[SELF_LINES] += counts[0]
+        cost[SELF_BYTES] += counts[1]
+        cost[LINES] += lines
+        cost[BYTES] += nbytes
+        if(len(self.stack) > 0):
+            self.current = self.stack[-1][1]
+            self.current[2] += lines
+            self.current[3] += nbytes
+        return
+
+    def Finish(self):
+        while(len(self.stack) > 0): # the source file itself, and any header left open by a broken output
+            self.Leave()
+        return self.costs
+
+def AggregateHeaderCosts(tuCosts, srcFileFullPaths):
+    """
+    Sum the per-translation-unit costs of every header.
+    Return <header, [fanOut, selfLines, selfBytes, lines, bytes]>, the source files themselves are left out.
+    """
+    headerCosts = dict()
+    for costs in tuCosts:
+        for filePath, cost in costs.items():
+            if(filePath in srcFileFullPaths):
+                continue
+            total = headerCosts.get(filePath)
+            if(total is None):
+                total = [0, 0, 0, 0, 0]
+                headerCosts[filePath] = total
+            total[0] += 1
+            for i in range(4):
+                total[i + 1] += cost[i]
+    return headerCosts
+
+def RankHeaderCosts(headerCosts):
+    # the bytes a header adds over the whole build come first.
+    return sorted(headerCosts.items(), key=lambda x: (-x[1][4], x[0]))
+
+def FormatHeaderCostTable(rankedCosts, top):
+    rows = ["{0:>6} {1:>12} {2:>14} {3:>10} {4:>12}  {5}".format("fanOut", "lines", "bytes", "selfLines", "selfBytes", "header")]
+    for filePath, total in rankedCosts[:top]:
+        rows.append("{0:>6} {1:>12} {2:>14} {3:>10} {4:>12}  {5}".format(total[0], total[3], total[4], total[1], total[2], filePath))
+    return os.linesep.join(rows)
+
+def ExportHeaderCostCsv(rankedCosts, fileFullPath):
+    with open(fileFullPath, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["header", "fanOut", "lines", "bytes", "selfLines", "selfBytes"])
+        for filePath, total in rankedCosts:
+            writer.writerow([filePath, total[0], total[3], total[4], total[1], total[2]])
+    return
@@ -0,0 +1,130 @@
+"""
+Header resolution of Zephyr Include Map, for the include scanner and GenIncludeMap.py.
+
+Probing <search path>/<header> with os.path.exists() for every #include costs
+one stat per search path, and Zephyr has 30 to 60 of them: hundreds of
+thousands of stats for a whole build, most of them for files that do not
+exist. Instead:
+
+- DirectoryIndex lists every folder once with os.scandir(), the first time a
+  header is looked up in it, and keeps its names; "zephyr/sys/util.h" is then
+  looked up name by name, so a search path without a "zephyr" folder costs a
+  dictionary lookup, not a stat.
+- SearchPath is the search chain of a command line, -iquote, then -I,
+  -isystem and the compiler's folders, like gcc: "..." includes look in the
+  includer's folder first and then in the whole chain, <...> includes skip
+  the -iquote folders, #include_next continues after the folder the includer
+  was found in. Every lookup is memorized, found or not, and shared by the
+  translation units with the same chain.
+
+A whole build needs as many folder reads as folders holding headers, a few
+thousand for Zephyr.
+"""
+import os
+import os.path
+
+class DirectoryIndex:
+    """
+    The names in every folder looked into, read once.
+    """
+    def __init__(self):
+        self.listings = dict() # <dirFullPath, <name, is a folder> or None if it cannot be read>
+        self.reads = 0
+
+    def List(self, dirFullPath):
+        listing = self.listings.get(dirFullPath, False)
+        if(listing is False):
+            self.reads += 1
+            try:
+                with os.scandir(dirFullPath) as entries:
+                    listing = {x.name: x.is_dir() for x in entries} # is_dir() follows symbolic links like open() does
+            except OSError:
+                listing = None
+            self.listings[dirFullPath] = listing
+        return listing
+
+    def IsFileIn(self, dirFullPath, relativePath):
+        # relativePath is "/"-separated as in an #include
+        names = relativePath.split("/")
+        if(".." in names or "." in names or "" in names):
+            return self.IsFile(os.path.normpath(os.path.join(dirFullPath, relativePath)))
+        listing = self.List(dirFullPath)
+        for name in names[:-1]:
+            if(listing is None or listing.get(name) is not True):
+                return False
+            dirFullPath = os.path.join(dirFullPath, name)
+            listing = self.List(dirFullPath)
+        return listing is not None and listing.get(names[-1]) is False
+
+    def IsFile(self, fileFullPath):
+        dirFullPath, name = os.path.split(fileFullPath)
+        listing = self.List(dirFullPath)
+        return listing is not None and listing.get(name) is False
+
+class SearchPath:
+    """
+    The include search chain of a command line: -iquote, then -I, -isystem and the compiler's folders.
+    """
+    def __init__(self, quoteDirs, angleDirs, systemDirs, directoryIndex):
+        # like gcc: a folder given twice is searched once, and a -I folder that is also a system folder is a system folder
+        systemSet = set(os.path.normpath(x) for x in systemDirs)
+        chain = []
+        seen = set()
+        for d in quoteDirs:
+            d = os.path.normpath(d)
+            if(d not in seen):
+                seen.add(d)
+                chain.append(d)
+        self.angleStart = len(chain)
+        seen = set()
+        for d in [x for x in angleDirs if os.path.normpath(x) not in systemSet] + list(systemDirs):
+            d = os.path.normpath(d)
+            if(d not in seen):
+                seen.add(d)
+                chain.append(d)
+        self.chain = chain
+        self.directoryIndex = directoryIndex
+        self.lookups = dict() # <(header, first folder index), (path, folder index)>, (None, None) if not found
+
+    def Resolve(self, name, quoted, includerDir, nextAfter = None):
+        """
+        Return (the path as found, the index of its folder in the chain, -1 for the includer's folder), (None, None) if not found.
+        nextAfter is the folder index of the includer for #include_next.
+        """
+        if(os.path.isabs(name)):
+            return (name, None) if self.directoryIndex.IsFile(name) else (None, None)
+        if(nextAfter is not None):
+            start = nextAfter + 1
+        else:
+            if(quoted and includerDir is not None and self.directoryIndex.IsFileIn(includerDir, name)):
+                return os.path.normpath(os.path.join(includerDir, name)), -1
+            start = 0 if quoted else self.angleStart
+        key = (name, start)
+        found = self.lookups.get(key)
+        if(found is None):
+            found = (None, None)
+            for index in range(start, len(self.chain)):
+                if(self.directoryIndex.IsFileIn(self.chain[index], name)):
+                    found = (os.path.normpath(os.path.join(self.chain[index], name)), index)
+                    break
+            self.lookups[key] = found
+        return found
+
+class HeaderResolver:
+    """
+    The folder listings and the search chains of a run, shared by all the translation units.
+    """
+    def __init__(self):
+        self.directoryIndex = DirectoryIndex()
+        self.searchPaths = dict() # <(quote, angle, system folders), SearchPath>
+
+    def GetSearchPath(self, quoteDirs, angleDirs, systemDirs):
+        key = (tuple(quoteDirs), tuple(angleDirs), tuple(systemDirs))
+        searchPath = self.searchPaths.get(key)
+        if(searchPath is None):
+            searchPath = SearchPath(quoteDirs, angleDirs, systemDirs, self.directoryIndex)
+            self.searchPaths[key] = searchPath
+        return searchPath
+
+    def IsFile(self, fileFullPath):
+        return self.directoryIndex.IsFile(fileFullPath)
@@ -0,0 +1,84 @@
+"""
+Include graph of Zephyr Include Map.
+
+Every file path is interned once and gets a dense integer node id. The
+includes of a node are kept in an insertion-ordered set (a dict with None
+values), so adding an edge and checking for it are O(1) while the include
+order, which decides the left-to-right layout of the map, is preserved.
+Nodes with includes are also kept in the order they first included something,
+which is the order the old <nodeA, [nodeX, nodeY, ...]> matrix had.
+"""
+import sys
+
+class IncludeGraph:
+    def __init__(self):
+        self.nodes = [] # <nodeId, path>
+        self.nodeIds = dict() # <path, nodeId>
+        self.successors = dict() # <nodeId, <nodeId, None>>, A includes X, Y, Z, ... in this order
+
+    def GetNodeId(self, path):
+        nodeId = self.nodeIds.get(path)
+        if(nodeId is None):
+            nodeId = len(self.nodes)
+            path = sys.intern(path)
+            self.nodes.append(path)
+            self.nodeIds[path] = nodeId
+        return nodeId
+
+    def AddEdge(self, fromPath, toPath):
+        self.AddEdgeById(self.GetNodeId(fromPath), self.GetNodeId(toPath))
+        return
+
+    def AddEdgeById(self, fromId, toId):
+        successors = self.successors.get(fromId)
+        if(successors is None):
+            successors = dict()
+            self.successors[fromId] = successors
+        successors[toId] = None
+        return
+
+    def Merge(self, other):
+        # each node of the other graph is looked up once, not once per edge.
+        idMap = [self.GetNodeId(x) for x in other.nodes]
+        for fromId, successors in other.successors.items():
+            for toId in successors:
+                self.AddEdgeById(idMap[fromId], idMap[toId])
+        return
+
+    def NodeCount(self):
+        return len(self.nodes)
+
+    def EdgeCount(self):
+        return sum(len(x) for x in self.successors.values())
+
+    def FromNodes(self):
+        # the paths of the nodes that include something, in the order they first did
+        return [self.nodes[x] for x in self.successors]
+
+    def Successors(self, path):
+        nodeId = self.nodeIds.get(path)
+        if(nodeId is None or nodeId not in self.successors):
+            return []
+        return [self.nodes[x] for x in self.successors[nodeId]]
+
+    def Edges(self):
+        nodes = self.nodes
+        for fromId, successors in self.successors.items():
+            for toId in successors:
+                yield nodes[fromId], nodes[toId]
+
+    def Matrix(self):
+        """
+        Return the graph as <nodeA, [nodeX, nodeY, nodeZ, ...]>, A connects "to" X, Y, Z, ...
+        """
+        nodes = self.nodes
+        return {nodes[fromId]: [nodes[x] for x in successors] for fromId, successors in self.successors.items()}
+
+    @classmethod
+    def FromMatrix(cls, matrix):
+        graph = cls()
+        for fromPath, toPaths in matrix.items():
+            fromId = graph.GetNodeId(fromPath)
+            for toPath in toPaths:
+                graph.AddEdgeById(fromId, graph.GetNodeId(toPath))
+        return graph
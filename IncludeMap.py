@@ -0,0 +1,803 @@
+"""
+Zephyr Include Map, the library behind GenIncludeMap2.py.
+
+Every stage of the tool works on the "everything" dict GenIncludeMap2.py
+makes from its command line: the compile database lookup, the preprocessor
+or the include scanner, the graph matrix, the rendered map and the data
+exports, the whole-build and the multi-build jobs. bench/RunBench.py and
+IncludeMapServer.py drive the same stages without the command line.
+
+Graphviz, the include scanner and the views are imported by the stages
+using them, so a run asking for --format json never loads Graphviz.
+"""
+import sys
+import os.path
+import re
+import asyncio
+import fnmatch
+import CompileDb
+import IncludeMapCache
+import GraphExport
+import HeaderCost
+import PreProcessorCache
+import BuildDiff
+import GraphStore
+import JobRunner
+import PathCanonicalizer
+from Profiler import Stage, JobStage
+from IncludeGraph import IncludeGraph
+from concurrent.futures import ThreadPoolExecutor
+
+def ErrorHandling(everything, errNo):
+    if(errNo == 1):
+        print("The source file [{0}] is not part of the build.".format(everything["srcFileFullPath"]))
+    elif (errNo == 2):
+        print("Neither \"build.ninja\" nor \"compile_commands.json\" file can be found at [{0}].".format(everything["bldDir"]))
+        print("Did you specify a wrong build folder?")
+    elif (errNo == 3):
+        print("Failed to render the graph.")
+        print("Is the file [{0}] writable?".format(everything["pdfFileFullPath"]))
+    elif (errNo == 5):
+        print("Failed to export the graph.")
+        print("Is the file [{0}] writable?".format(everything["exportFileFullPath"]))
+    elif (errNo == 6):
+        print("The \"msgpack\" package is needed for the msgpack format: pip install msgpack")
+    elif (errNo == 4):
+        print("No C/C++ source file in [{0}] matches the requested targets.".format(everything["compileDbFile"]))
+    elif (errNo == 7):
+        print("No include map is cached in [{0}] yet.".format(everything["bldDir"]))
+        print("Run with --all first, --depsOnly makes it much faster.")
+    elif (errNo == 8):
+        print("Failed to preprocess [{0}]:".format(everything["srcFileFullPath"]))
+        print(everything["error"].reason)
+        for line in everything["error"].stderrTail:
+            print(line)
+        sys.exit(1) # no include map at all, unlike the other errors it is not a usage mistake
+    sys.exit(0)
+    return
+
+def LoadCompileDb(everything):
+    # the compile database is loaded only once (build.ninja is not parsed at all when its cached index is fresh),
+    # every source file lookup after that is a dict access.
+    if("compileDb" in everything.keys()):
+        return
+    compileDbFile, compileDb = CompileDb.LoadCompileDb(everything["bldDir"], everything["compileDbBackend"])
+    if(compileDb is None):
+        ErrorHandling(everything, 2)
+    everything["compileDbFile"] = compileDbFile
+    everything["compileDb"] = compileDb
+    print(f"[Compile database found:]{os.linesep}{everything["compileDbFile"]}")
+    return
+
+def GetNinjaBuildBlock4SourceFile(everything):
+    LoadCompileDb(everything)
+    buildBlock = everything["compileDb"].get(everything["srcFileFullPath"])
+    if(buildBlock is None):
+        ErrorHandling(everything, 1)
+    everything["buildBlock"] = buildBlock # <variable, value>, for DEFINES, INCLUDES, FLAGS and rule
+    return
+
+def IsSelectedTarget(everything, srcFileFullPath):
+    targets = everything["targets"]
+    if(targets is None): # --all
+        return True
+    srcFileRelativePath = os.path.relpath(srcFileFullPath, everything["zephyrDir"]).replace(os.path.sep, "/")
+    return fnmatch.fnmatch(srcFileFullPath.replace(os.path.sep, "/"), targets) or fnmatch.fnmatch(srcFileRelativePath, targets)
+
+def IsCompileEdge4C(srcFileFullPath, buildBlock):
+    if(buildBlock["rule"] is None): # compile_commands.json
+        return os.path.splitext(srcFileFullPath)[1] in (".c", ".cc", ".cpp", ".cxx", ".C")
+    return re.match(r"(C|CXX)_COMPILER", buildBlock["rule"]) is not None
+
+def GetCompileEdges(everything):
+    LoadCompileDb(everything)
+    compileEdges = dict() # <srcFileFullPath, buildBlock>
+    for srcFileFullPath, buildBlock in everything["compileDb"].items():
+        if(IsCompileEdge4C(srcFileFullPath, buildBlock) and IsSelectedTarget(everything, srcFileFullPath)):
+            compileEdges[srcFileFullPath] = buildBlock
+    if(len(compileEdges) == 0):
+        ErrorHandling(everything, 4)
+    everything["compileEdges"] = compileEdges
+    print(f"[Translation units found:]{os.linesep}{len(compileEdges)}")
+    return
+
+def LoadIncludeSearchPaths(everything):
+    # -I, -isystem, -iquote and -idirafter in command line order, relative to the build folder:
+    # the command and its cache keys do not depend on where we are run from
+    includeOptions = CompileDb.SplitIncludeOptions(everything["buildBlock"]["INCLUDES"], everything["bldDir"])
+    everything["includeOptions"] = includeOptions # the compiler argv is made from these
+    everything["includeSearchPaths"] = CompileDb.FormatIncludeOptions(includeOptions) # for the cache keys and the scanner
+    return
+
+def LoadConfigMacros(everything):
+    configMacros = everything["buildBlock"]["DEFINES"] #load DEFINES from the compile database
+    everything["configMacros"] = configMacros
+    return
+
+def LoadBuildFlags(everything):
+    bldFlags = everything["buildBlock"]["FLAGS"] #load FLAGS from the compile database
+    everything["bldFlags"] = bldFlags
+    return
+
+def LoadCompileSettings(everything):
+    LoadIncludeSearchPaths(everything)
+    LoadConfigMacros(everything)
+    LoadBuildFlags(everything)
+    return
+
+def GetPreProcessorCmdStrings(everything):
+    mode = "scan" if everything["scanner"] else "-H" if everything["depsOnly"] else "-E"
+    return [mode, everything["gccFullPath"], everything["configMacros"], everything["includeSearchPaths"], everything["bldFlags"], everything["srcFileFullPath"]]
+
+def GetPreProcessorCmdHash(everything):
+    return IncludeMapCache.HashStrings(GetPreProcessorCmdStrings(everything))
+
+def LoadCachedGraphMatrix(everything):
+    # reuse the graph matrix of the last run if neither the command nor any file it read has changed.
+    if(everything["rebuild"] or everything["keepPP"]):
+        return False
+    entry = everything["graphCache"].get(everything["srcFileFullPath"])
+    if(not IncludeMapCache.IsGraphCacheEntryFresh(entry, GetPreProcessorCmdHash(everything), everything["fileStamps"])):
+        return False
+    if(everything["headerCost"] is not None):
+        if("headerCosts" not in entry): # cached by a run without --headerCost
+            return False
+        everything["headerCosts"] = entry["headerCosts"]
+    everything["graphMatrix"] = IncludeGraph.FromMatrix(entry["graphMatrix"])
+    everything["includeDirectives"] = IncludeGraph.FromMatrix(entry["includeDirectives"])
+    everything["upToDate"] = True
+    return True
+
+def StoreGraphMatrix(everything):
+    entry = IncludeMapCache.NewGraphCacheEntry(GetPreProcessorCmdHash(everything), everything["srcFileFullPath"], everything["graphMatrix"].Matrix(), everything["includeDirectives"].Matrix(), everything["fileStamps"])
+    if("headerCosts" in everything):
+        entry["headerCosts"] = everything["headerCosts"]
+    everything["graphCache"][everything["srcFileFullPath"]] = entry
+    return
+
+def LoadPreProcessorCacheEntry(everything):
+    # the shared cache: the same command on the same contents may have been run before, from another build folder copy or by someone else.
+    if(everything["ppCacheDir"] is None or everything["rebuild"] or everything["keepPP"]):
+        return False
+    key = PreProcessorCache.GetPreProcessorCacheKey(GetPreProcessorCmdStrings(everything), everything["gccFullPath"], everything["srcFileFullPath"], everything["fileHashes"])
+    if(key is None):
+        return False
+    variant = PreProcessorCache.LookUp(everything["ppCacheDir"], key, everything["fileHashes"], everything["headerCost"] is not None)
+    if(variant is None):
+        return False
+    everything["graphMatrix"] = IncludeGraph.FromMatrix(variant["graphMatrix"])
+    everything["includeDirectives"] = IncludeGraph.FromMatrix(variant["includeDirectives"])
+    if("headerCosts" in variant):
+        everything["headerCosts"] = variant["headerCosts"]
+    everything["ppCacheHit"] = True
+    return True
+
+def StorePreProcessorCacheEntry(everything):
+    if(everything["ppCacheDir"] is None):
+        return
+    key = PreProcessorCache.GetPreProcessorCacheKey(GetPreProcessorCmdStrings(everything), everything["gccFullPath"], everything["srcFileFullPath"], everything["fileHashes"])
+    if(key is not None):
+        PreProcessorCache.Store(everything["ppCacheDir"], key, everything["srcFileFullPath"], everything["graphMatrix"].Matrix(), everything["includeDirectives"].Matrix(), everything.get("headerCosts"), everything["fileHashes"])
+    return
+
+def GetPreProcessorArgv(everything):
+    # no shell: the compile settings are split into words the way the shell would have done it
+    # "-dI" keeps the #include directives in the "-E" output, those the include guards skip too
+    modeArgs = ["-M", "-H"] if everything["depsOnly"] else ["-E", "-dI"]
+    defines = CompileDb.SplitCommand(everything["configMacros"])
+    includes = CompileDb.GetIncludeArgv(everything["includeOptions"])
+    flags = CompileDb.SplitCommand(everything["bldFlags"])
+    return [everything["gccFullPath"]] + modeArgs + defines + includes + flags + [everything["srcFileFullPath"]]
+
+def SetPpFileFullPath(everything):
+    if(everything["keepPP"]):
+        srcFile = os.path.basename(everything["srcFileFullPath"])
+        ppSrcFile = "pp." + everything["ppFilePrefix"] + srcFile
+        everything["ppFileFullPath"] = os.path.realpath(os.path.join(".", ppSrcFile))
+    return
+
+def SetPreProcessorOutput(everything, stdout, stderr):
+    # the header trace of "-M -H" from the job runner: a line per header on stderr, nothing written to disk.
+    # The "-E" output is never kept, see GenerateGraphMatrix()
+    everything["headerTrace"] = stderr.splitlines()
+    everything["depRule"] = stdout # "<obj>: <src> <forced includes> <headers>", a few KB
+    return
+
+def GenerateGraphMatrix(everything, ppLines = None):
+    """
+    Build the graph matrix of a translation unit.
+    ppLines is the "-E" output streamed by the job runner, unused with --scanner and --depsOnly.
+    The "#include" lines of "-dI" go to the include directives: a directive followed by the line marker
+    entering a file is that file, one followed by anything else was skipped by an include guard.
+    """
+    if(everything["scanner"]):
+        with Stage(everything, "graphBuild") as span:
+            GenerateGraphMatrixFromScan(everything, everything["graphMatrix"], everything["includeDirectives"])
+            span.CountGraph(everything["graphMatrix"])
+        return
+    if(everything["depsOnly"]):
+        with Stage(everything, "graphBuild") as span:
+            GenerateGraphMatrixFromHeaderTrace(everything)
+            span.Count("markers", len(everything["headerTrace"]))
+            span.CountGraph(everything["graphMatrix"])
+        return
+    lineStack = []
+    lineStack.append(os.path.normpath(os.path.realpath(everything["srcFileFullPath"])))
+    gm = everything["graphMatrix"]
+    directives = everything["includeDirectives"]
+    pending = None # (includer, quoted, header as written) of the last "-dI" directive, until it is known whether it was entered
+    entered = dict() # <header as written, the files entered with that name>, for the skipped ones
+
+    #https://gcc.gnu.org/onlinedocs/gcc-3.4.6/cpp/Preprocessor-Output.html
+    lineMarkerRegex = re.compile(r"#\s+\d+\s+\"(.*)\"\s+([12])")
+    includeDirectiveRegex = re.compile(r"#\s*include(?:_next)?\s*([\"<])(.*)[\">]") # "-dI" only: #ident, #if kept by "-dD"-like flags or #import are text
+    canonicalPath = everything["pathCanonicalizer"].CanonicalPath
+    ppFile = open(everything["ppFileFullPath"], "w") if everything["keepPP"] else None
+    counter = HeaderCost.HeaderCostCounter(lineStack[0]) if everything["headerCost"] is not None else None
+    with Stage(everything, "graphBuild") as span: # the preprocessor is still running, its time is part of this stage
+        try:
+            for line in span.Lines(ppLines):
+                m = includeDirectiveRegex.match(line) if line.startswith("#") else None
+                if(m is not None): # "-dI", not part of the preprocessed text
+                    if(pending is not None):
+                        AddSkippedDirective(gm, directives, entered, pending)
+                    pending = (lineStack[-1], m.group(1) == "\"", m.group(2))
+                    continue
+                if(ppFile is not None):
+                    ppFile.write(line)
+                m = lineMarkerRegex.match(line) if line.startswith("#") else None
+                if(m is None):
+                    if(counter is not None and not line.startswith("# ")): # the text of the file on top of the stack, markers excluded
+                        counter.current[0] += 1
+                        counter.current[1] += len(line) # characters, the same as bytes for the ASCII Zephyr sources
+                    continue
+                filePath = canonicalPath(m.group(1))
+                fileFlag = m.group(2)
+                if(fileFlag == '1'):
+                    fromFile = lineStack[-1]
+                    lineStack.append(filePath)
+                    gm.AddEdge(fromFile, filePath)
+                    if(pending is not None): # not for the -include files, they have no directive
+                        directives.AddEdge(pending[0], filePath)
+                        entered.setdefault(pending[2], []).append(filePath)
+                        pending = None
+                    if(counter is not None):
+                        counter.Enter(filePath)
+                elif (fileFlag == '2'):
+                    if(pending is not None):
+                        AddSkippedDirective(gm, directives, entered, pending)
+                        pending = None
+                    lineStack.pop(-1) 
+                    if(counter is not None):
+                        counter.Leave()
+            if(pending is not None):
+                AddSkippedDirective(gm, directives, entered, pending)
+        finally:
+            if(ppFile is not None):
+                ppFile.close()
+        span.CountGraph(gm)
+    if(counter is not None):
+        everything["headerCosts"] = counter.Finish()
+    return
+
+def AddSkippedDirective(gm, directives, entered, pending):
+    # the header was entered earlier in the translation unit, most likely with the same name:
+    # for "..." the one in the includer's folder, otherwise the first one.
+    # Without a directive of that name (an -include file, or another spelling), a file of the graph ending with it.
+    includer, quoted, name = pending
+    candidates = entered.get(name)
+    if(candidates is None):
+        suffix = os.sep + os.path.normpath(name)
+        candidates = [x for x in gm.nodes if x.endswith(suffix)]
+        if(len(candidates) == 0):
+            return
+    local = os.path.normpath(os.path.join(os.path.dirname(includer), name)) if quoted else None
+    directives.AddEdge(includer, local if local in candidates else candidates[0])
+    return
+
+def GenerateGraphMatrixFromHeaderTrace(everything):
+    lineStack = []
+    lineStack.append(os.path.normpath(os.path.realpath(everything["srcFileFullPath"])))
+    gm = everything["graphMatrix"]
+
+    headerTraceRegex = re.compile(r"(\.+)\s(.*)") # e.g. ".. /zephyr/include/zephyr/sys/util.h"
+    headerTrace = [m for m in (headerTraceRegex.match(x) for x in everything["headerTrace"]) if m is not None] # skip warnings and the "Multiple include guards may be useful for:" list
+    canonicalPath = everything["pathCanonicalizer"].CanonicalPath
+    firstHeader = canonicalPath(headerTrace[0].group(2)) if len(headerTrace) > 0 else None
+
+    # "-imacros"/"-include" files and the implicit stdc-predef.h are processed before the source file,
+    # they are not part of the "-H" trace, but are listed first in the dependency rule.
+    # In the line markers they show up as included by the source file.
+    # Their own includes are not traced either and come right after them in the rule: those are left out,
+    # the rule does not tell who includes them, so the subtrees of the forced includes are missing in this mode.
+    forced = GetForcedIncludes(everything)
+    depRule = re.split(r":\s", everything["depRule"].replace("\\\n", " "), maxsplit=1)
+    deps = [x.replace("\\ ", " ") for x in re.split(r"(?<!\\)\s+", depRule[-1].strip())]
+    for dep in deps[1:]: # deps[0] is the source file
+        filePath = canonicalPath(dep)
+        if(filePath == firstHeader):
+            break
+        if(filePath in forced or os.path.basename(filePath) == "stdc-predef.h"):
+            gm.AddEdge(lineStack[0], filePath)
+
+    for m in headerTrace:
+        depth = len(m.group(1))
+        filePath = canonicalPath(m.group(2))
+        del lineStack[depth:] # the includer is the last header seen one level up
+        gm.AddEdge(lineStack[-1], filePath)
+        lineStack.append(filePath)
+    return
+
+def GetForcedIncludes(everything):
+    # the canonical paths of the "-include"/"-imacros" files of the compile settings, relative ones from the build folder
+    words = CompileDb.SplitCommand(" ".join([everything["configMacros"], everything["bldFlags"]]))
+    forced = set()
+    for i, word in enumerate(words):
+        for option in ("-include", "-imacros"):
+            if(word == option and i + 1 < len(words)):
+                value = words[i + 1]
+            elif(word.startswith(option) and len(word) > len(option)):
+                value = word[len(option):]
+            else:
+                continue
+            forced.add(everything["pathCanonicalizer"].CanonicalPath(os.path.normpath(os.path.join(everything["bldDir"], value))))
+    return forced
+
+def GenerateGraphMatrixFromScan(everything, gm, directives = None):
+    # the include directives are evaluated by IncludeScanner.py, the compiler is at most asked for its defaults once.
+    import IncludeScanner
+    scanner = IncludeScanner.ScanTranslationUnit(everything["includeScanner"], everything["gccFullPath"], everything["srcFileFullPath"], everything["configMacros"], everything["includeSearchPaths"], everything["bldFlags"], gm, everything["pathCanonicalizer"].CanonicalPath, everything["fileStamps"], directives)
+    everything["scanUnresolved"] = scanner.unresolved
+    everything["scanWarnings"] = scanner.warnings
+    return
+
+def CompareWithScanner(everything):
+    # --scannerDiff: the edges only the compiler's line markers have, and those only the scanner has.
+    scanned = IncludeGraph()
+    GenerateGraphMatrixFromScan(everything, scanned)
+    gccEdges = {(x, y) for x, ys in everything["graphMatrix"].Matrix().items() for y in ys}
+    scannedEdges = {(x, y) for x, ys in scanned.Matrix().items() for y in ys}
+    everything["scannerDiff"] = (sorted(gccEdges - scannedEdges), sorted(scannedEdges - gccEdges))
+    return
+
+# the classification of a path is computed once by the path canonicalizer and cached with its canonical path.
+def IsGeneratedFile(everything, filePath):
+    return everything["pathCanonicalizer"].Category(filePath) == PathCanonicalizer.CATEGORY_GENERATED
+
+def IsZephyrNativeFile(everything, filePath):
+    return everything["pathCanonicalizer"].Category(filePath) == PathCanonicalizer.CATEGORY_ZEPHYR
+
+def IsTheStartingNode(everything, filePath):
+    return everything["pathCanonicalizer"].CanonicalPath(filePath) in everything["startingNodes"]
+
+def IsToolChainFile(everything, filePath):
+    return everything["pathCanonicalizer"].Category(filePath) == PathCanonicalizer.CATEGORY_TOOLCHAIN
+
+def DetermineNodeLooks(everything, node):
+    nodeText = os.path.relpath(node, everything["zephyrDir"]).replace(os.path.sep, "/\n")
+    shape = "oval"
+    style = "filled"
+    fontName = ""
+    if(IsGeneratedFile(everything, node)):            
+        nodeColor = "orange"
+    elif(node in everything["collapsedNodes"]): # --collapse, the whole folder
+        nodeText += "/"
+        shape = "folder"
+        nodeColor = "lightblue"
+    elif(IsTheStartingNode(everything, node)):
+        shape = "box"
+        nodeColor = "green"
+        fontName = "bold"
+    # elif(IsToolChainFile(everything, node)):
+    #     shape = "diamond"
+    #     # nodeText = r"\<{0}\>".format(os.path.basename(node)) # use "<xxx>" for toolchain headers
+    #     # print (f"\t{os.path.relpath(node, everything["gccIncludePath"])} - {node}")
+    #     # nodeText = os.path.relpath(node, everything["gccIncludePath"]).replace(os.path.sep, "/\n")
+    #     nodeColor = "lightgrey"
+    elif(IsZephyrNativeFile(everything, node)):
+        nodeColor = "lightblue"
+    else:
+        nodeColor = "black"
+        style = ""
+    return tuple([nodeText, nodeColor, shape, style, fontName])
+
+def AddLegends(graph):
+    nodeText = "Generated Files"
+    shape = "oval"
+    style = "filled"
+    nodeColor = "orange"
+    graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
+
+    # nodeText = "Toolchain Files"
+    # shape = "diamond"
+    # style = "filled"
+    # nodeColor = "lightgrey"
+    # graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
+
+    nodeText = "In-Zephyr Files"
+    shape = "oval"
+    style = "filled"
+    nodeColor = "lightblue"
+    graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
+
+    nodeText = "Out-of-Zephyr Files"
+    shape = "oval"
+    style = ""
+    nodeColor = "black"
+    graph.node(nodeText, label = nodeText, color = nodeColor, shape = shape, style = style, fontname = "bold")
+    pass
+
+def DumpGraph(everything):
+    gm = everything["graphMatrix"]
+    print (f"Dump graph")
+    for fromNode in gm.FromNodes():
+        print (f"{fromNode}:\n\t{gm.Successors(fromNode)}")
+
+def GetGraphView(everything):
+    # what is drawn: the whole graph, or the smaller view of --focus, --maxDepth, --collapse and --reduce
+    gm = everything["graphMatrix"]
+    if(everything["focus"] is None and everything["maxDepth"] is None and everything["collapseDirs"] is None and not everything["reduce"]):
+        return gm, set()
+    import GraphView
+    return GraphView.ApplyViews(gm, everything["startingNodes"], everything["focus"], everything["maxDepth"], everything["collapseDirs"], everything["reduce"])
+
+def GenerateGraph(everything):
+    from graphviz import Digraph # only the pdf/gv formats need Graphviz
+    with Stage(everything, "dotEmit"):
+        graph = Digraph(engine="dot", comment="Include Map for {0}".format(everything["srcFileFullPath"]))
+        gm, everything["collapsedNodes"] = GetGraphView(everything)
+        nodeLooks = dict() # <nodeId, looks>, each node is classified and drawn only once
+        def DrawNode(nodeId):
+            looks = nodeLooks.get(nodeId)
+            if(looks is None):
+                looks = DetermineNodeLooks(everything, gm.nodes[nodeId])
+                nodeLooks[nodeId] = looks
+                graph.node(looks[0], label = looks[0], color = looks[1], shape = looks[2], style = looks[3], fontname = looks[4])
+            return looks
+        for fromId, successors in gm.successors.items():
+            looks1 = DrawNode(fromId)
+            for toId in successors:
+                looks2 = DrawNode(toId)
+                graph.edge(looks1[0], looks2[0])
+
+        AddLegends(graph)
+
+    with Stage(everything, "render"): # "dot" layout, or just writing the DOT source
+        graphFileName = everything["graphName"]
+        try:
+            if("pdf" in everything["formats"]):
+                pdfFileFullPath = os.path.realpath("./IncludeMap_{0}.gv.pdf".format(graphFileName))
+                everything["pdfFileFullPath"] = pdfFileFullPath
+                graph.render(os.path.realpath("./IncludeMap_{0}.gv".format(graphFileName)), view= False, format="pdf") # graphviz will add the pdf suffix
+                everything["outputFiles"].append(pdfFileFullPath)
+            else: # the DOT source only, without the layout
+                everything["pdfFileFullPath"] = os.path.realpath("./IncludeMap_{0}.gv".format(graphFileName))
+                graph.save(everything["pdfFileFullPath"])
+                everything["outputFiles"].append(everything["pdfFileFullPath"])
+        except:
+            print(sys.exc_info()[0])
+            ErrorHandling(everything, 3)
+    pass
+
+def ExportGraphData(everything, fileFormat):
+    # no Graphviz involved, the graph matrix is dumped as it is.
+    data = GraphExport.GraphToDict("Include Map for {0}".format(everything["srcFileFullPath"]), everything["graphMatrix"], everything["startingNodes"], everything["pathCanonicalizer"].Category)
+    exportFileFullPath = os.path.realpath("./IncludeMap_{0}{1}".format(everything["graphName"], GraphExport.FILE_SUFFIXES[fileFormat]))
+    everything["exportFileFullPath"] = exportFileFullPath
+    try:
+        with Stage(everything, "export"):
+            GraphExport.ExportGraph(data, fileFormat, exportFileFullPath)
+    except ImportError:
+        ErrorHandling(everything, 6)
+    except OSError:
+        print(sys.exc_info()[0])
+        ErrorHandling(everything, 5)
+    everything["outputFiles"].append(exportFileFullPath)
+    return
+
+def OutputGraph(everything):
+    everything["outputFiles"] = []
+    if("pdf" in everything["formats"] or "gv" in everything["formats"]):
+        GenerateGraph(everything)
+    for fileFormat in everything["formats"]:
+        if(fileFormat in GraphExport.FORMATS):
+            ExportGraphData(everything, fileFormat)
+    return
+
+def OutputHeaderCosts(everything, translationUnits):
+    srcFileFullPaths = {tu["srcFileFullPath"] for tu in translationUnits}
+    headerCosts = HeaderCost.AggregateHeaderCosts((tu["headerCosts"] for tu in translationUnits), srcFileFullPaths)
+    rankedCosts = HeaderCost.RankHeaderCosts(headerCosts)
+    print(f"[The {everything["headerCost"]} most expensive headers of {len(translationUnits)} translation units:]")
+    print(HeaderCost.FormatHeaderCostTable(rankedCosts, everything["headerCost"]))
+    csvFileFullPath = os.path.realpath("./HeaderCost_{0}.csv".format(everything["graphName"]))
+    everything["exportFileFullPath"] = csvFileFullPath
+    try:
+        HeaderCost.ExportHeaderCostCsv(rankedCosts, csvFileFullPath)
+    except OSError:
+        print(sys.exc_info()[0])
+        ErrorHandling(everything, 5)
+    everything["outputFiles"].append(csvFileFullPath)
+    return
+
+def OutputScannerDiff(everything, translationUnits):
+    differing = [tu for tu in translationUnits if tu["scannerDiff"] != ([], [])]
+    for tu in differing:
+        missing, extra = tu["scannerDiff"]
+        print(f"[Scanner vs. compiler for:]{os.linesep}{tu["srcFileFullPath"]}")
+        for fromNode, toNode in missing:
+            print(f"- {fromNode} -> {toNode}")
+        for fromNode, toNode in extra:
+            print(f"+ {fromNode} -> {toNode}")
+        for includer, header in tu["scanUnresolved"]:
+            print(f"  not found: {header} in {includer}")
+        for fileFullPath, warning in tu["scanWarnings"]:
+            print(f"  warning: {warning} in {fileFullPath}")
+    print(f"[The scanner matches the compiler for:]{os.linesep}{len(translationUnits) - len(differing)} of {len(translationUnits)} translation units")
+    return
+
+def DoWork(everything):
+    print(f"[Start generating include map for:]{os.linesep}{everything["srcFileFullPath"]}")
+    with Stage(everything, "compileDb"):
+        GetNinjaBuildBlock4SourceFile(everything)
+    ProcessTranslationUnit(everything)
+    if("error" in everything):
+        ErrorHandling(everything, 8)
+    if(not everything["upToDate"]):
+        with Stage(everything, "cacheStore"):
+            IncludeMapCache.PruneGraphCache(everything["graphCache"], everything["compileDb"])
+            IncludeMapCache.SaveGraphCache(everything["bldDir"], everything["graphCache"])
+    # DumpGraph(everything)
+    OutputGraph(everything)
+    if(everything["headerCost"] is not None):
+        OutputHeaderCosts(everything, [everything])
+    if(everything["scannerDiffMode"]):
+        OutputScannerDiff(everything, [everything])
+    return
+
+def GetGraphName4TranslationUnit(everything, srcFileFullPath):
+    # basenames like main.c are not unique across a build, so name the graph after the path.
+    if(IsZephyrNativeFile(everything, srcFileFullPath)):
+        graphName = os.path.relpath(srcFileFullPath, everything["zephyrDir"])
+    else:
+        graphName = os.path.splitdrive(srcFileFullPath)[1]
+    return graphName.strip(os.path.sep).replace(os.path.sep, "_")
+
+def NewTranslationUnit(everything, index, srcFileFullPath, buildBlock):
+    tu = dict(everything)
+    tu["srcFileFullPath"] = srcFileFullPath
+    tu["startingNodes"] = {srcFileFullPath}
+    tu["buildBlock"] = buildBlock
+    tu["ppFilePrefix"] = "{0}.".format(index) # keep the pp.* files of parallel jobs apart with --keepPP
+    tu["graphName"] = GetGraphName4TranslationUnit(everything, srcFileFullPath)
+    tu["graphMatrix"] = IncludeGraph()
+    tu["includeDirectives"] = IncludeGraph()
+    return tu
+
+def CheckTranslationUnit(tu):
+    # the compile settings and the caches of a translation unit, True if the preprocessor has to run
+    LoadCompileSettings(tu)
+    with Stage(tu, "cacheCheck"):
+        upToDate = LoadCachedGraphMatrix(tu)
+    if(upToDate):
+        return False
+    with Stage(tu, "ppCacheCheck"):
+        cached = LoadPreProcessorCacheEntry(tu)
+    return not cached
+
+def FinishTranslationUnit(tu, preprocessed, graphBuilt = False):
+    if(preprocessed):
+        if(not graphBuilt):
+            GenerateGraphMatrix(tu)
+        if("error" in tu): # nothing is cached, the next run tries again
+            return tu
+        with Stage(tu, "ppCacheStore"):
+            StorePreProcessorCacheEntry(tu)
+    if(not tu["upToDate"]):
+        with Stage(tu, "cacheStore"):
+            StoreGraphMatrix(tu)
+    if(tu["scannerDiffMode"]):
+        with Stage(tu, "scannerDiff"):
+            CompareWithScanner(tu)
+    return tu
+
+def ProcessTranslationUnit(tu):
+    # a single translation unit, with the same timeout and JobError as the whole-build runs
+    JobRunner.RunJobs([tu], ProcessTranslationUnitAsync, lambda x: None, 1, tu["jobTimeout"])
+    return tu
+
+async def ProcessTranslationUnitAsync(tu, runner):
+    # the same as ProcessTranslationUnit(), the compiler run by the job runner, the rest in worker threads
+    preprocess = await asyncio.to_thread(CheckTranslationUnit, tu)
+    streamed = preprocess and not tu["scanner"] and not tu["depsOnly"]
+    if(preprocess and not tu["scanner"]):
+        if(streamed): # the graph is built from the "-E" output as it comes, in a worker thread
+            SetPpFileFullPath(tu)
+        try:
+            stdout, stderr = await runner.Run(tu["srcFileFullPath"], GetPreProcessorArgv(tu), JobStage(tu, "preprocess"), (lambda lines: GenerateGraphMatrix(tu, lines)) if streamed else None, "graphBuild")
+        except JobRunner.JobError as e:
+            tu["error"] = e
+            return tu
+        if(not streamed):
+            SetPreProcessorOutput(tu, stdout, stderr)
+    return await asyncio.to_thread(FinishTranslationUnit, tu, preprocess, streamed)
+
+def RunTranslationUnits(everything, translationUnits, OutputProgress):
+    """
+    Process the translation units with the job runner and return the failed ones, OutputProgress(tu) is called as each one ends.
+    The graph caches of the translation units done are kept even if the run is interrupted.
+    """
+    try:
+        JobRunner.RunJobs(translationUnits, ProcessTranslationUnitAsync, OutputProgress, everything["jobs"], everything["jobTimeout"])
+    finally:
+        for bldDir, tu in {tu["bldDir"]: tu for tu in translationUnits}.items():
+            graphCache = tu["graphCache"]
+            pruned = IncludeMapCache.PruneGraphCache(graphCache, tu["compileDb"])
+            if(pruned > 0 or not all(tu["upToDate"] for tu in translationUnits if tu["bldDir"] == bldDir)):
+                with Stage(everything, "cacheStore"):
+                    IncludeMapCache.SaveGraphCache(bldDir, graphCache)
+                    GraphStore.SaveGraphStore(bldDir, graphCache) # the whole build, for the queries
+    failed = [tu for tu in translationUnits if "error" in tu]
+    everything["jobErrors"] = [tu["error"].ToDict() for tu in failed]
+    return failed
+
+def BuildTranslationUnitGraph(everything, srcFileFullPath):
+    # for the include map daemon: the graph of one source file, None if it is not part of the build.
+    LoadCompileDb(everything)
+    buildBlock = everything["compileDb"].get(srcFileFullPath)
+    if(buildBlock is None):
+        return None
+    return ProcessTranslationUnit(NewTranslationUnit(everything, 0, srcFileFullPath, buildBlock))
+
+def MergeGraphMatrices(everything, translationUnits):
+    gm = everything["graphMatrix"]
+    for tu in translationUnits:
+        gm.Merge(tu["graphMatrix"])
+    return
+
+def GetTranslationUnitStatus(tu):
+    if("error" in tu):
+        return " (failed)"
+    return " (up to date)" if tu["upToDate"] else " (preprocessor cache)" if tu["ppCacheHit"] else ""
+
+def OutputJobErrors(failed, count):
+    if(len(failed) == 0):
+        return
+    print(f"[{len(failed)} of {count} translation units failed:]")
+    for tu in failed:
+        error = tu["error"]
+        print(f"{error.srcFileFullPath}{os.linesep}    {error.reason}")
+        for line in error.stderrTail:
+            print(f"    | {line}")
+    return
+
+def DoWorkForAllTargets(everything):
+    with Stage(everything, "compileDb"):
+        GetCompileEdges(everything)
+    srcFileFullPaths = list(everything["compileEdges"].keys())
+    print(f"[Start generating include maps with {everything["jobs"]} jobs]")
+    translationUnits = [NewTranslationUnit(everything, i, x, everything["compileEdges"][x]) for i, x in enumerate(srcFileFullPaths)]
+    def OutputProgress(tu):
+        print(f"{tu["srcFileFullPath"]}{GetTranslationUnitStatus(tu)}")
+    failed = RunTranslationUnits(everything, translationUnits, OutputProgress)
+    OutputJobErrors(failed, len(translationUnits))
+    translationUnits = [tu for tu in translationUnits if "error" not in tu] # the maps of the others are still made
+    srcFileFullPaths = [tu["srcFileFullPath"] for tu in translationUnits]
+    everything["translationUnits"] = translationUnits
+
+    # most of a render is the "dot" layout in its own process, so the maps are rendered in parallel too
+    with ThreadPoolExecutor(max_workers=everything["jobs"]) as pool:
+        list(pool.map(OutputGraph, translationUnits))
+
+    # the project-wide map: every translation unit is a starting node
+    everything["srcFileFullPath"] = everything["compileDbFile"]
+    everything["startingNodes"] = set(srcFileFullPaths)
+    everything["graphName"] = "all"
+    with Stage(everything, "merge"):
+        MergeGraphMatrices(everything, translationUnits)
+    OutputGraph(everything)
+    everything["outputFiles"] = [x for tu in translationUnits for x in tu["outputFiles"]] + everything["outputFiles"] # every file written, not only the project-wide map
+    if(everything["headerCost"] is not None):
+        OutputHeaderCosts(everything, translationUnits)
+    if(everything["scannerDiffMode"]):
+        OutputScannerDiff(everything, translationUnits)
+    return
+
+def NewBuild(everything, index, bldDir, gccFullPath):
+    # the settings of one of the "diff" builds, the zephyr folder and the per-run caches are shared
+    build = dict(everything)
+    for key in ("compileDb", "compileDbFile", "compileEdges"):
+        build.pop(key, None)
+    build["buildIndex"] = index
+    build["bldDir"] = bldDir
+    build["gccFullPath"] = gccFullPath
+    build["pathCanonicalizer"] = PathCanonicalizer.PathCanonicalizer(everything["zephyrDir"], bldDir, os.path.dirname(os.path.dirname(gccFullPath)))
+    build["graphCache"] = IncludeMapCache.LoadGraphCache(bldDir)
+    return build
+
+def DoWorkForBuilds(everything, bldDirs, gccFullPaths):
+    builds = [NewBuild(everything, i, x, gccFullPaths[i] if len(gccFullPaths) > 1 else gccFullPaths[0]) for i, x in enumerate(bldDirs)]
+    buildNames = BuildDiff.GetBuildNames(bldDirs)
+    translationUnits = []
+    for build in builds:
+        with Stage(build, "compileDb"):
+            if("srcFileFullPath" in everything.keys()):
+                LoadCompileDb(build)
+                buildBlock = build["compileDb"].get(everything["srcFileFullPath"])
+                build["compileEdges"] = {everything["srcFileFullPath"]: buildBlock} if buildBlock is not None else dict()
+            else:
+                GetCompileEdges(build)
+        translationUnits.extend(NewTranslationUnit(build, len(translationUnits) + i, x, y) for i, (x, y) in enumerate(build["compileEdges"].items()))
+    if(len(translationUnits) == 0):
+        ErrorHandling(everything, 1)
+    # the translation units of all the builds share the job pool, not one build after the other
+    print(f"[Start generating include maps of {len(builds)} builds with {everything["jobs"]} jobs]")
+    def OutputProgress(tu):
+        print(f"{tu["srcFileFullPath"]} [{buildNames[tu["buildIndex"]]}]{GetTranslationUnitStatus(tu)}")
+    failed = RunTranslationUnits(everything, translationUnits, OutputProgress)
+    OutputJobErrors(failed, len(translationUnits))
+    translationUnits = [tu for tu in translationUnits if "error" not in tu]
+
+    with Stage(everything, "merge"):
+        diff = BuildDiff.BuildDiff(buildNames)
+        for tu in translationUnits:
+            diff.AddGraph(tu["buildIndex"], tu["srcFileFullPath"], tu["graphMatrix"], tu["bldDir"])
+    OutputBuildDiff(everything, diff)
+    return
+
+def OutputBuildDiff(everything, diff):
+    names = diff.buildNames
+    allBuilds = (1 << len(names)) - 1
+    for srcFileFullPath in diff.translationUnits:
+        builtBy = diff.builtBy[srcFileFullPath]
+        if(builtBy != allBuilds):
+            print(f"[Only built by {", ".join(x for i, x in enumerate(names) if builtBy >> i & 1)}:]{os.linesep}{srcFileFullPath}")
+            continue
+        for i in range(1, len(names)): # every build compared to the first one
+            result = diff.Compare(srcFileFullPath, 0, i)
+            if(not any(result.values())):
+                continue
+            print(f"[{names[i]} vs. {names[0]} for:]{os.linesep}{srcFileFullPath}")
+            for header in result["addedHeaders"]:
+                print(f"+ {header}")
+            for header in result["removedHeaders"]:
+                print(f"- {header}")
+            for fromNode, toNode in result["addedEdges"]:
+                print(f"  + {fromNode} -> {toNode}")
+            for fromNode, toNode in result["removedEdges"]:
+                print(f"  - {fromNode} -> {toNode}")
+    print(f"[Headers and includes of every build:]")
+    for name, headerCount, edgeCount in diff.CountPerBuild():
+        print(f"{name}: {headerCount} headers, {edgeCount} includes")
+    diffFileFullPath = os.path.realpath("./IncludeMapDiff_{0}.json".format(everything["graphName"]))
+    everything["exportFileFullPath"] = diffFileFullPath
+    try:
+        diff.Export(diffFileFullPath)
+    except OSError:
+        print(sys.exc_info()[0])
+        ErrorHandling(everything, 5)
+    everything["outputFiles"] = [diffFileFullPath]
+    return
+
+def OutputProfile(everything):
+    profiler = everything["profiler"]
+    if(everything["profileFormat"] == "trace"):
+        traceFileFullPath = os.path.realpath("./IncludeMap_{0}.trace.json".format(everything["graphName"]))
+        everything["exportFileFullPath"] = traceFileFullPath
+        try:
+            profiler.ExportTrace(traceFileFullPath)
+        except OSError:
+            print(sys.exc_info()[0])
+            ErrorHandling(everything, 5)
+        print(f"[Profile saved as:]{os.linesep}{traceFileFullPath}")
+    else:
+        print("[Profile:]")
+        print(profiler.FormatTable())
+    return
+
+def OutputIncludeSearchPaths(everything):
+    print("[The include search paths:]")
+    for option, value in everything["includeOptions"]:
+        print(value if option is None else f"{option}{value}" if option == "-I" else f"{option} {value}")
+    return
+
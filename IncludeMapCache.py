@@ -0,0 +1,135 @@
+"""
+On-disk caches of Zephyr Include Map.
+
+All caches live in <bldDir>/.includemap/ and are pickled dicts carrying a
+"version" and the "bldDir" they were made for. They are only accelerators:
+a missing, stale or unreadable cache is rebuilt, a read-only build folder
+just means no cache.
+
+tu-graphs.bin keeps the graph matrix of each translation unit together with
+its fingerprint: the hash of the preprocessor command and the size+mtime of
+the source file and of every header seen in its line markers. Like ninja's
+depfiles, a translation unit whose fingerprint still matches is not
+preprocessed again. Each entry also keeps the include directives of the
+translation unit, those skipped by include guards too, for the analysis. The entries of source files removed from the build are
+dropped whenever the cache is saved.
+"""
+import os
+import os.path
+import sys
+
+CACHE_DIR_NAME = ".includemap"
+GRAPH_CACHE_FILE_NAME = "tu-graphs.bin"
+GRAPH_CACHE_VERSION = 2 # bump when the entry layout changes
+
+def GetCacheFileFullPath(bldDir, cacheFileName):
+    return os.path.join(bldDir, CACHE_DIR_NAME, cacheFileName)
+
+def GetFileStamp(fileFullPath):
+    st = os.stat(fileFullPath)
+    return (st.st_size, st.st_mtime_ns)
+
+def HashFile(fileFullPath):
+    import hashlib # like pickle, not needed by the queries on a fresh graph store
+    h = hashlib.blake2b(digest_size=16)
+    with open(fileFullPath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def HashStrings(strings):
+    import hashlib
+    h = hashlib.blake2b(digest_size=16)
+    for x in strings:
+        h.update(x.encode("utf-8", "surrogateescape"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def ReadCacheFile(cacheFileFullPath, version, bldDir):
+    import pickle
+    try:
+        with open(cacheFileFullPath, "rb") as f:
+            cache = pickle.load(f)
+    except Exception: # missing, truncated or written by another version
+        return None
+    if(not isinstance(cache, dict) or cache.get("version") != version or cache.get("bldDir") != bldDir):
+        return None
+    return cache
+
+def WriteCacheFile(cacheFileFullPath, cache):
+    import pickle
+    WriteFileAtomically(cacheFileFullPath, pickle.dumps(cache, protocol=pickle.HIGHEST_PROTOCOL))
+    return
+
+def WriteFileAtomically(fileFullPath, data):
+    tmpFileFullPath = "{0}.{1}.tmp".format(fileFullPath, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(fileFullPath), exist_ok=True)
+        with open(tmpFileFullPath, "wb") as f:
+            f.write(data)
+        os.replace(tmpFileFullPath, fileFullPath) # concurrent runs never see a partial file
+    except OSError:
+        if(os.path.exists(tmpFileFullPath)):
+            os.remove(tmpFileFullPath)
+    return
+
+def LoadGraphCache(bldDir):
+    """
+    Return the <srcFileFullPath, entry> dict of tu-graphs.bin, empty if there is none.
+    """
+    cache = ReadCacheFile(GetCacheFileFullPath(bldDir, GRAPH_CACHE_FILE_NAME), GRAPH_CACHE_VERSION, bldDir)
+    return cache["entries"] if cache is not None else dict()
+
+def SaveGraphCache(bldDir, entries):
+    cache = dict()
+    cache["version"] = GRAPH_CACHE_VERSION
+    cache["bldDir"] = bldDir
+    cache["entries"] = entries
+    WriteCacheFile(GetCacheFileFullPath(bldDir, GRAPH_CACHE_FILE_NAME), cache)
+    return
+
+def PruneGraphCache(entries, compileDb):
+    """
+    Remove the entries of the source files no longer in the compile database, return how many were removed.
+    The graph store and the reverse index are made from tu-graphs.bin, they would list them otherwise.
+    """
+    removed = [x for x in entries if x not in compileDb]
+    for srcFileFullPath in removed:
+        del entries[srcFileFullPath]
+    return len(removed)
+
+def GetCachedFileStamp(fileStamps, fileFullPath):
+    # thousands of translation units share the same headers, so each one is stat'ed once per run.
+    stamp = fileStamps.get(fileFullPath)
+    if(stamp is None):
+        try:
+            stamp = GetFileStamp(fileFullPath)
+        except OSError:
+            stamp = (-1, -1) # never matches a recorded stamp
+        fileStamps[fileFullPath] = stamp
+    return stamp
+
+def InternMatrix(graphMatrix):
+    # paths are interned so that pickle stores each header path once for the whole build.
+    return {sys.intern(x): [sys.intern(y) for y in toNodes] for x, toNodes in graphMatrix.items()}
+
+def NewGraphCacheEntry(cmdHash, srcFileFullPath, graphMatrix, includeDirectives, fileStamps):
+    # the directives name no file the graph matrix does not have: a header skipped by its guard was entered before.
+    files = {srcFileFullPath}
+    for fromNode, toNodes in graphMatrix.items():
+        files.add(fromNode)
+        files.update(toNodes)
+    entry = dict()
+    entry["cmdHash"] = cmdHash
+    entry["fileStamps"] = {sys.intern(x): GetCachedFileStamp(fileStamps, x) for x in files}
+    entry["graphMatrix"] = InternMatrix(graphMatrix)
+    entry["includeDirectives"] = InternMatrix(includeDirectives)
+    return entry
+
+def IsGraphCacheEntryFresh(entry, cmdHash, fileStamps):
+    if(entry is None or entry["cmdHash"] != cmdHash):
+        return False
+    for fileFullPath, stamp in entry["fileStamps"].items():
+        if(GetCachedFileStamp(fileStamps, fileFullPath) != stamp):
+            return False
+    return True
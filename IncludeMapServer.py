@@ -0,0 +1,223 @@
+"""
+Include map daemon for Zephyr Include Map.
+
+"GenIncludeMap2.py serve" keeps the compile database, the path canonicalizer
+and the include graphs of the translation units in memory, and answers queries
+over HTTP on localhost, so an editor or a CI script does not pay for a new
+Python process, a compile database load and a preprocessor run every time.
+
+    GET /graph?file=<source file>           the include map of a source file, as in --format json
+    GET /includers?header=<header>          the files including the header directly,
+                                            and the translation units including it at all
+    GET /chain?from=<file>&to=<header>      the shortest include chain from a file to a header
+    GET /status                             what is in memory
+
+Paths may be absolute or relative to the zephyr folder. The answers are JSON.
+
+A graph is served from memory as long as its fingerprint (see IncludeMapCache.py)
+still matches, otherwise the source file is preprocessed again. The compile
+database file is watched, and reloaded when it changes.
+"""
+import os.path
+import json
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import IncludeMapCache
+import GraphExport
+import JobRunner
+from IncludeGraph import IncludeGraph
+
+DEFAULT_PORT = 8765
+WATCH_INTERVAL = 2.0 # seconds between two checks of the compile database file
+
+class IncludeMapService:
+    def __init__(self, everything, buildTranslationUnit):
+        self.everything = everything
+        self.buildTranslationUnit = buildTranslationUnit # (everything, srcFileFullPath) -> translation unit or None
+        self.lock = threading.RLock() # one preprocessor run or state change at a time
+        self.graphs = dict() # <srcFileFullPath, (cache entry, IncludeGraph)>
+        self.mergedGraph = None # all the translation units, for chains from a header
+        self.compileDbStamp = None
+
+    def CanonicalPath(self, path):
+        if(not os.path.isabs(path)):
+            path = os.path.join(self.everything["zephyrDir"], path)
+        return self.everything["pathCanonicalizer"].CanonicalPath(path)
+
+    def WatchCompileDb(self):
+        # a changed build.ninja/compile_commands.json means changed flags: reload it on the next query.
+        with self.lock:
+            compileDbFile = self.everything.get("compileDbFile")
+            if(compileDbFile is None):
+                return
+            try:
+                stamp = IncludeMapCache.GetFileStamp(compileDbFile)
+            except OSError:
+                stamp = None
+            if(self.compileDbStamp is not None and stamp != self.compileDbStamp):
+                print(f"[Compile database changed, reloading:]{os.linesep}{compileDbFile}")
+                self.everything.pop("compileDb", None)
+                self.everything.pop("compileDbFile", None)
+                stamp = None
+            self.compileDbStamp = stamp
+        return
+
+    def GetGraph(self, srcFileFullPath):
+        with self.lock:
+            self.everything["fileStamps"] = dict() # headers may have changed since the last query
+            self.everything["fileHashes"] = dict()
+            tu = self.buildTranslationUnit(self.everything, srcFileFullPath)
+            if(tu is None):
+                return None, False
+            if("error" in tu):
+                raise tu["error"]
+            if(self.compileDbStamp is None and "compileDbFile" in self.everything):
+                self.compileDbStamp = IncludeMapCache.GetFileStamp(self.everything["compileDbFile"])
+            if(not tu["upToDate"]):
+                IncludeMapCache.PruneGraphCache(self.everything["graphCache"], self.everything["compileDb"])
+                IncludeMapCache.SaveGraphCache(self.everything["bldDir"], self.everything["graphCache"])
+            entry = self.everything["graphCache"][srcFileFullPath]
+            cached = self.graphs.get(srcFileFullPath)
+            if(cached is None or cached[0] is not entry):
+                cached = (entry, tu["graphMatrix"])
+                self.graphs[srcFileFullPath] = cached
+                self.mergedGraph = None
+            return cached[1], tu["upToDate"]
+
+    def GetAllGraphs(self):
+        # every translation unit seen so far, in this or an earlier run
+        with self.lock:
+            for srcFileFullPath, entry in self.everything["graphCache"].items():
+                cached = self.graphs.get(srcFileFullPath)
+                if(cached is None or cached[0] is not entry):
+                    self.graphs[srcFileFullPath] = (entry, IncludeGraph.FromMatrix(entry["graphMatrix"]))
+                    self.mergedGraph = None
+            return {x: y[1] for x, y in self.graphs.items()}
+
+    def GetMergedGraph(self):
+        graphs = self.GetAllGraphs()
+        with self.lock:
+            if(self.mergedGraph is None):
+                mergedGraph = IncludeGraph()
+                for graph in graphs.values():
+                    mergedGraph.Merge(graph)
+                self.mergedGraph = mergedGraph
+            return self.mergedGraph
+
+    def QueryGraph(self, srcFile):
+        srcFileFullPath = self.CanonicalPath(srcFile)
+        graph, upToDate = self.GetGraph(srcFileFullPath)
+        if(graph is None):
+            return 404, {"error": "The source file [{0}] is not part of the build.".format(srcFileFullPath)}
+        data = GraphExport.GraphToDict("Include Map for {0}".format(srcFileFullPath), graph, {srcFileFullPath}, self.everything["pathCanonicalizer"].Category)
+        data["upToDate"] = upToDate
+        return 200, data
+
+    def QueryIncluders(self, header):
+        headerFullPath = self.CanonicalPath(header)
+        includers = dict() # ordered set of the files including the header directly
+        translationUnits = []
+        for srcFileFullPath, graph in self.GetAllGraphs().items():
+            headerId = graph.nodeIds.get(headerFullPath)
+            if(headerId is None):
+                continue
+            translationUnits.append(srcFileFullPath)
+            for fromId, successors in graph.successors.items():
+                if(headerId in successors):
+                    includers[graph.nodes[fromId]] = None
+        return 200, {"header": headerFullPath, "includers": list(includers), "translationUnits": translationUnits}
+
+    def QueryChain(self, fromFile, toFile):
+        fromFullPath = self.CanonicalPath(fromFile)
+        toFullPath = self.CanonicalPath(toFile)
+        graph = None
+        if(fromFullPath in self.everything.get("compileDb", dict()) or fromFullPath in self.everything["graphCache"]):
+            graph, _ = self.GetGraph(fromFullPath)
+        if(graph is None): # a header: look through all the translation units
+            graph = self.GetMergedGraph()
+        chain = FindIncludeChain(graph, fromFullPath, toFullPath)
+        return 200, {"from": fromFullPath, "to": toFullPath, "chain": chain}
+
+    def QueryStatus(self):
+        status = dict()
+        status["compileDbFile"] = self.everything.get("compileDbFile")
+        status["translationUnits"] = len(self.everything["graphCache"])
+        status["graphsInMemory"] = len(self.graphs)
+        status["pathCache"] = self.everything["pathCanonicalizer"].CacheInfo()._asdict()
+        return 200, status
+
+def FindIncludeChain(graph, fromFullPath, toFullPath):
+    # breadth-first, so the chain is the shortest one; None if there is none.
+    fromId = graph.nodeIds.get(fromFullPath)
+    toId = graph.nodeIds.get(toFullPath)
+    if(fromId is None or toId is None):
+        return None
+    parents = {fromId: None}
+    queue = deque([fromId])
+    while(len(queue) > 0):
+        nodeId = queue.popleft()
+        if(nodeId == toId):
+            chain = []
+            while(nodeId is not None):
+                chain.append(graph.nodes[nodeId])
+                nodeId = parents[nodeId]
+            return chain[::-1]
+        for nextId in graph.successors.get(nodeId, ()):
+            if(nextId not in parents):
+                parents[nextId] = nodeId
+                queue.append(nextId)
+    return None
+
+class IncludeMapRequestHandler(BaseHTTPRequestHandler):
+    service = None # set by Serve()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {x: y[0] for x, y in parse_qs(url.query).items()}
+        service = self.service
+        try:
+            if(url.path == "/graph" and "file" in query):
+                code, body = service.QueryGraph(query["file"])
+            elif(url.path == "/includers" and "header" in query):
+                code, body = service.QueryIncluders(query["header"])
+            elif(url.path == "/chain" and "from" in query and "to" in query):
+                code, body = service.QueryChain(query["from"], query["to"])
+            elif(url.path == "/status"):
+                code, body = service.QueryStatus()
+            else:
+                code, body = 400, {"error": "Unknown query, see the help of \"GenIncludeMap2.py serve\"."}
+        except JobRunner.JobError as e:
+            code, body = 500, {"error": "Failed to preprocess the source file.", "job": e.ToDict()}
+        except SystemExit: # ErrorHandling() of the pipeline, its message is in the server log
+            code, body = 500, {"error": "Failed to generate the include map, see the server log."}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        return
+
+    def log_message(self, format, *args):
+        return # one line per query would drown the pipeline messages
+
+def Serve(everything, buildTranslationUnit, port = DEFAULT_PORT):
+    service = IncludeMapService(everything, buildTranslationUnit)
+    IncludeMapRequestHandler.service = service
+    server = ThreadingHTTPServer(("127.0.0.1", port), IncludeMapRequestHandler)
+    stopWatching = threading.Event()
+    def Watch():
+        while(not stopWatching.wait(WATCH_INTERVAL)):
+            service.WatchCompileDb()
+    threading.Thread(target=Watch, daemon=True).start()
+    print(f"[Serving include maps on:]{os.linesep}http://127.0.0.1:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopWatching.set()
+        server.server_close()
+    return
@@ -0,0 +1,709 @@
+"""
+Built-in include scanner of Zephyr Include Map, enabled by --scanner.
+
+Only the directives are looked at, so neither the cross compiler nor a
+preprocessed file is needed:
+
+- #if/#ifdef/#ifndef/#elif/#else/#endif are evaluated against the macros of
+  the command line (DEFINES, -D/-U in FLAGS), of -imacros/-include files like
+  autoconf.h, and of every #define seen so far, with function-like macros,
+  #, ## and __VA_ARGS__, so IS_ENABLED(CONFIG_...) works.
+- #include, #include_next and computed includes (#include MACRO) are resolved
+  like gcc does by HeaderResolver.py: the includer's folder for "...", then
+  -iquote, -I, -isystem, the compiler's own folders and -idirafter, in this order.
+- a file with an include guard whose macro is defined, or with #pragma once,
+  is not entered again, like gcc's multiple-include optimization; so the map
+  is the same as the one built from the line markers of "gcc -E".
+- the include directives themselves, guarded repeats included, can be kept
+  in a second graph: which includes are redundant is a question about what
+  the files say, not about what the preprocessor entered (see Reachability.py).
+
+If the compiler given with -t exists, it is asked once per language and
+flags for its predefined macros and include folders, which the toolchain's
+own headers depend on. Otherwise only __STDC__ and __STDC_VERSION__ or
+__cplusplus are predefined, and toolchain headers that cannot be found are
+kept as unresolved leaves named as written.
+
+Every file is read and its directives are parsed once per run, in a
+ParseCache shared by all the translation units and jobs.
+"""
+import os
+import os.path
+import re
+import subprocess
+import threading
+import CompileDb
+import IncludeMapCache
+import HeaderResolver
+
+# preprocessing tokens; literals first, so that L'x' is not an identifier L
+ppTokenRegex = re.compile(r"""
+    L?'(?:\\.|[^'\\])*'
+  | L?"(?:\\.|[^"\\])*"
+  | [A-Za-z_]\w*
+  | \.?\d(?:[eEpP][+-]|[\w.])*
+  | \#\#|\.\.\.|<<=|>>=|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^!~<>=?:,;.()\[\]{}\#]
+  | \S
+""", re.X)
+commentOrLiteralRegex = re.compile(r"//[^\n]*|/\*.*?\*/|\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'", re.S)
+directiveRegex = re.compile(r"^[ \t]*#[ \t]*(\w*)[ \t]*(.*)$", re.M)
+defineRegex = re.compile(r"([A-Za-z_]\w*)(\(([^)]*)\))?")
+includeOperandRegex = re.compile(r"\"([^\"]*)\"|<([^>]*)>")
+numberSuffixRegex = re.compile(r"[uUlL]+$")
+
+IF_DIRECTIVES = ("if", "ifdef", "ifndef")
+ELIF_DIRECTIVES = ("elif", "elifdef", "elifndef")
+HAS_FEATURE_OPERATORS = ("__has_attribute", "__has_cpp_attribute", "__has_c_attribute", "__has_builtin", "__has_feature", "__has_extension")
+# defined for #ifdef and defined(), though not in the macro table
+BUILTIN_NAMES = frozenset(("__has_include", "__has_include_next", "__FILE__", "__LINE__", "__COUNTER__", "__DATE__", "__TIME__", "__INCLUDE_LEVEL__", "__BASE_FILE__") + HAS_FEATURE_OPERATORS)
+CPP_EXTENSIONS = (".cpp", ".cc", ".cxx", ".c++", ".C")
+EMPTY = frozenset()
+
+def Tokenize(text):
+    return ppTokenRegex.findall(text)
+
+class Macro:
+    __slots__ = ("name", "params", "variadic", "body")
+
+    def __init__(self, name, params, variadic, body):
+        self.name = name
+        self.params = params # None for an object-like macro
+        self.variadic = variadic
+        self.body = body # tokens
+
+def ParseDefine(text):
+    m = defineRegex.match(text)
+    if(m is None):
+        return None
+    if(m.group(2) is None): # "#define X (1)" is object-like, the "(" has to follow the name right away
+        return Macro(m.group(1), None, False, Tokenize(text[m.end():]))
+    params = [x.strip() for x in m.group(3).split(",")] if m.group(3).strip() else []
+    variadic = len(params) > 0 and params[-1].endswith("...")
+    if(variadic):
+        params[-1] = params[-1][:-3].strip() or "__VA_ARGS__" # GNU "args..." names the variable arguments
+    return Macro(m.group(1), params, variadic, Tokenize(text[m.end():]))
+
+class ParsedFile:
+    __slots__ = ("directives", "guard")
+
+    def __init__(self, directives, guard):
+        self.directives = directives # [(directive, operand)]
+        self.guard = guard # the include guard macro, None if the file has none
+
+def ParseDirective(name, rest):
+    if(name in ("if", "elif")):
+        return (name, Tokenize(rest))
+    if(name in ("ifdef", "ifndef", "elifdef", "elifndef", "undef")):
+        tokens = Tokenize(rest)
+        return (name, tokens[0] if len(tokens) > 0 else "")
+    if(name in ("else", "endif")):
+        return (name, None)
+    if(name == "define"):
+        macro = ParseDefine(rest)
+        return (name, macro) if macro is not None else None
+    if(name in ("include", "include_next", "import")):
+        m = includeOperandRegex.match(rest)
+        if(m is not None):
+            operand = (True, m.group(1)) if m.group(1) is not None else (False, m.group(2))
+        else: # computed include, expanded when it is reached
+            operand = (None, Tokenize(rest))
+        return ("include_next" if name == "include_next" else "include", operand)
+    if(name == "pragma" and rest.split()[:1] == ["once"]):
+        return ("once", None)
+    return None # #error, #warning, #line, other #pragma...
+
+def FindIncludeGuard(directives, text, spans):
+    # "#ifndef X ... #endif" around the whole file, with no #else/#elif at its level
+    if(len(directives) < 2):
+        return None
+    first = directives[0]
+    if(first[0] == "ifndef"):
+        guard = first[1]
+    else:
+        guard = None
+        tokens = first[1] if first[0] == "if" else []
+        if(tokens[:2] == ["!", "defined"]): # "#if !defined(X)"
+            names = [x for x in tokens[2:] if x not in ("(", ")")]
+            if(len(names) == 1):
+                guard = names[0]
+    if(guard is None): # like gcc, the macro does not have to be defined right away, only before the file is included again
+        return None
+    depth = 0
+    for i, (name, operand) in enumerate(directives):
+        if(name in IF_DIRECTIVES):
+            depth += 1
+        elif(name == "endif"):
+            depth -= 1
+            if(depth == 0):
+                if(i != len(directives) - 1):
+                    return None
+                break
+        elif(depth == 1 and (name in ELIF_DIRECTIVES or name == "else")):
+            return None
+    if(text[:spans[0][0]].strip() != "" or text[spans[-1][1]:].strip() != ""):
+        return None
+    return guard
+
+def ParseFile(fileFullPath):
+    with open(fileFullPath, "r", errors="replace") as f:
+        text = f.read()
+    if("\\" in text):
+        text = text.replace("\\\r\n", "").replace("\\\n", "") # line continuations
+    if("/" in text):
+        text = commentOrLiteralRegex.sub(lambda m: m.group(0) if m.group(0)[0] in "\"'" else ("\n" * m.group(0).count("\n") or " "), text)
+    directives = []
+    spans = []
+    for m in directiveRegex.finditer(text):
+        directive = ParseDirective(m.group(1), m.group(2))
+        if(directive is not None):
+            directives.append(directive)
+            spans.append(m.span())
+    return ParsedFile(directives, FindIncludeGuard(directives, text, spans))
+
+class ParseCache:
+    """
+    The parsed directives of every file, the header resolver and the compiler defaults, shared by all translation units.
+    """
+    def __init__(self):
+        self.files = dict() # <fileFullPath, (stamp, ParsedFile or None)>
+        self.headerResolver = HeaderResolver.HeaderResolver()
+        self.compilerDefaults = dict() # <(gcc, language, flags), (macros, include folders)>
+        self.lock = threading.Lock()
+
+    def GetParsedFile(self, fileFullPath, fileStamps):
+        stamp = IncludeMapCache.GetCachedFileStamp(fileStamps, fileFullPath) # a changed file is parsed again, e.g. by "serve"
+        cached = self.files.get(fileFullPath)
+        if(cached is not None and cached[0] == stamp):
+            return cached[1]
+        try:
+            parsed = ParseFile(fileFullPath)
+        except OSError:
+            parsed = None
+        self.files[fileFullPath] = (stamp, parsed)
+        return parsed
+
+    def GetCompilerDefaults(self, gccFullPath, language, flags):
+        key = (gccFullPath, language, tuple(flags))
+        with self.lock: # run the compiler once, not once per job
+            defaults = self.compilerDefaults.get(key)
+            if(defaults is None):
+                defaults = QueryCompilerDefaults(gccFullPath, language, flags)
+                self.compilerDefaults[key] = defaults
+        return defaults
+
+def QueryCompilerDefaults(gccFullPath, language, flags):
+    macros = dict()
+    includeDirs = []
+    if(os.path.isfile(gccFullPath)):
+        try:
+            result = subprocess.run([gccFullPath] + flags + ["-x", language, "-dD", "-E", "-v", os.devnull], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace")
+            output, log = result.stdout, result.stderr
+        except OSError:
+            output, log = "", ""
+        builtIn = False
+        for line in output.splitlines():
+            m = re.match(r"#\s+\d+\s+\"(.*)\"", line)
+            if(m is not None): # keep the built-in macros, not those of the preincluded stdc-predef.h
+                builtIn = m.group(1) in ("<built-in>", "<command-line>")
+            elif(builtIn and line.startswith("#define ")):
+                macro = ParseDefine(line[8:])
+                if(macro is not None):
+                    macros[macro.name] = macro
+        inList = False
+        for line in log.splitlines():
+            if(line.startswith("#include <...> search starts here:")):
+                inList = True
+            elif(line.startswith("End of search list.")):
+                inList = False
+            elif(inList and line.startswith(" ")):
+                includeDirs.append(os.path.normpath(line.strip()))
+    if(len(macros) == 0): # no compiler to ask
+        macros["__STDC__"] = Macro("__STDC__", None, False, ["1"])
+        if(language == "c++"):
+            macros["__cplusplus"] = Macro("__cplusplus", None, False, ["201703L"])
+        else:
+            macros["__STDC_VERSION__"] = Macro("__STDC_VERSION__", None, False, ["201710L"])
+    return macros, includeDirs
+
+def GetCompilerQueryFlags(flags):
+    # only the flags changing the predefined macros or the compiler's include folders
+    prefixes = ("-m", "-f", "-std", "-O", "--sysroot", "-isysroot", "-nostdinc", "-ansi", "-specs", "--specs", "-undef")
+    return [x for x in flags if x.startswith(prefixes)]
+
+class CommandLine:
+    """
+    What the scanner needs from DEFINES, INCLUDES and FLAGS.
+    """
+    def __init__(self, configMacros, includeSearchPaths, bldFlags):
+        self.macroArgs = [] # ("D", "NAME=VALUE") or ("U", "NAME"), in command line order
+        self.quoteDirs = []
+        self.angleDirs = []
+        self.systemDirs = []
+        self.afterDirs = [] # -idirafter, searched after the compiler's own folders
+        self.forcedIncludes = [] # -imacros files, then -include files
+        self.imacrosCount = 0
+        self.otherFlags = []
+        self.freestanding = False
+        self.noStdInc = False
+        imacros = []
+        includes = []
+        args = CompileDb.SplitCommand(" ".join([configMacros, includeSearchPaths, bldFlags]))
+        i = 0
+        while(i < len(args)):
+            arg = args[i]
+            option, value = None, None
+            for x in ("-D", "-U", "-I", "-isystem", "-iquote", "-imacros", "-include", "-idirafter"):
+                if(arg == x and i + 1 < len(args)):
+                    option, value = x, args[i + 1]
+                    i += 1
+                    break
+                if(arg.startswith(x) and len(arg) > len(x) and x not in ("-include",)):
+                    option, value = x, arg[len(x):]
+                    break
+            if(option in ("-D", "-U")):
+                self.macroArgs.append((option[1], value))
+            elif(option == "-I"):
+                self.angleDirs.append(value)
+            elif(option == "-isystem"):
+                self.systemDirs.append(value)
+            elif(option == "-idirafter"):
+                self.afterDirs.append(value)
+            elif(option == "-iquote"):
+                self.quoteDirs.append(value)
+            elif(option == "-imacros"):
+                imacros.append(value)
+            elif(option == "-include"):
+                includes.append(value)
+            else:
+                if(arg == "-ffreestanding"):
+                    self.freestanding = True
+                elif(arg == "-nostdinc"):
+                    self.noStdInc = True
+                self.otherFlags.append(arg)
+            i += 1
+        self.forcedIncludes = imacros + includes
+        self.imacrosCount = len(imacros)
+
+def GetLanguage(srcFileFullPath):
+    return "c++" if srcFileFullPath.endswith(CPP_EXTENSIONS) else "c"
+
+def CollectArguments(tokens, start):
+    # tokens[start] is "(", return the arguments and the index after ")"
+    depth = 0
+    args = [[]]
+    for k in range(start + 1, len(tokens)):
+        text = tokens[k][0]
+        if(text == "("):
+            depth += 1
+        elif(text == ")"):
+            if(depth == 0):
+                return args, k + 1
+            depth -= 1
+        elif(text == "," and depth == 0):
+            args.append([])
+            continue
+        args[-1].append(tokens[k])
+    return None, len(tokens)
+
+def Stringify(tokens):
+    text = " ".join(x[0] for x in tokens)
+    return "\"{0}\"".format(text.replace("\\", "\\\\").replace("\"", "\\\""))
+
+class MacroExpander:
+    """
+    Macro expansion of a token list, with the hide sets of the C standard so that recursion stops.
+    Tokens are (text, hide set) pairs.
+    """
+    def __init__(self, macros):
+        self.macros = macros
+
+    def Expand(self, tokens):
+        macros = self.macros
+        tokens = list(tokens)
+        out = []
+        i = 0
+        while(i < len(tokens)):
+            text, hideSet = tokens[i]
+            macro = macros.get(text)
+            if(macro is None or text in hideSet):
+                out.append(tokens[i])
+                i += 1
+                continue
+            if(macro.params is None):
+                hideSet = hideSet | {text}
+                tokens[i:i + 1] = [(x, hideSet) for x in macro.body] # rescanned with what follows
+                continue
+            if(i + 1 >= len(tokens) or tokens[i + 1][0] != "("):
+                out.append(tokens[i])
+                i += 1
+                continue
+            args, end = CollectArguments(tokens, i + 1)
+            if(args is None):
+                out.extend(tokens[i:])
+                break
+            hideSet = (hideSet & tokens[end - 1][1]) | {text}
+            tokens[i:end] = self.Substitute(macro, args, hideSet)
+        return out
+
+    def Substitute(self, macro, args, hideSet):
+        params = macro.params
+        if(len(params) == 0 and args == [[]]):
+            args = []
+        fixedCount = len(params) - 1 if macro.variadic else len(params)
+        args = args + [[] for x in range(fixedCount - len(args))]
+        argMap = dict(zip(params[:fixedCount], args[:fixedCount]))
+        if(macro.variadic):
+            variableArgs = []
+            for k, arg in enumerate(args[fixedCount:]):
+                if(k > 0):
+                    variableArgs.append((",", EMPTY))
+                variableArgs.extend(arg)
+            argMap[params[-1]] = variableArgs
+        expandedArgs = dict()
+        body = macro.body
+        result = []
+        i = 0
+        while(i < len(body)):
+            text = body[i]
+            if(text == "#" and i + 1 < len(body) and body[i + 1] in argMap):
+                result.append((Stringify(argMap[body[i + 1]]), hideSet))
+                i += 2
+                continue
+            if(text == "##" and len(result) > 0 and i + 1 < len(body)):
+                right = body[i + 1]
+                rightTexts = [x[0] for x in argMap[right]] if right in argMap else [right]
+                if(len(rightTexts) == 0):
+                    if(macro.variadic and right == params[-1] and result[-1][0] == ","):
+                        result.pop(-1) # GNU ", ## __VA_ARGS__" drops the comma
+                    i += 2
+                    continue
+                left = result.pop(-1)
+                result.append((left[0] + rightTexts[0], hideSet))
+                result.extend((x, hideSet) for x in rightTexts[1:])
+                i += 2
+                continue
+            if(text in argMap):
+                if(i + 1 < len(body) and body[i + 1] == "##"): # pasted: not expanded
+                    arg = argMap[text]
+                    if(len(arg) > 0):
+                        result.extend((x[0], x[1] | hideSet) for x in arg)
+                    else:
+                        result.append(("", hideSet)) # placemarker
+                else:
+                    expanded = expandedArgs.get(text)
+                    if(expanded is None):
+                        expanded = self.Expand(argMap[text])
+                        expandedArgs[text] = expanded
+                    result.extend((x[0], x[1] | hideSet) for x in expanded)
+                i += 1
+                continue
+            result.append((text, hideSet))
+            i += 1
+        return [x for x in result if x[0] != ""]
+
+def ParseNumber(text):
+    if(text[0] in "L'"):
+        text = text[1:] if text[0] == "L" else text
+        inner = text[1:-1]
+        if(not inner.startswith("\\")):
+            return ord(inner[0]) if len(inner) > 0 else 0
+        escapes = {"n": 10, "t": 9, "r": 13, "a": 7, "b": 8, "f": 12, "v": 11, "\\": 92, "'": 39, "\"": 34, "?": 63}
+        if(inner[1] in escapes):
+            return escapes[inner[1]]
+        if(inner[1] == "x"):
+            return int(inner[2:], 16)
+        return int(inner[1:], 8)
+    text = numberSuffixRegex.sub("", text)
+    if(text[:2] in ("0x", "0X")):
+        return int(text[2:], 16)
+    if(text[:2] in ("0b", "0B")):
+        return int(text[2:], 2)
+    if(len(text) > 1 and text[0] == "0"):
+        return int(text, 8)
+    return int(text)
+
+BINARY_PRECEDENCE = {"*": 10, "/": 10, "%": 10, "+": 9, "-": 9, "<<": 8, ">>": 8, "<": 7, "<=": 7, ">": 7, ">=": 7, "==": 6, "!=": 6, "&": 5, "^": 4, "|": 3, "&&": 2, "||": 1}
+
+def ApplyBinary(op, a, b):
+    if(op == "*"): return a * b
+    if(op == "/"): return 0 if b == 0 else (abs(a) // abs(b)) * (1 if (a < 0) == (b < 0) else -1)
+    if(op == "%"): return 0 if b == 0 else a - b * ((abs(a) // abs(b)) * (1 if (a < 0) == (b < 0) else -1))
+    if(op == "+"): return a + b
+    if(op == "-"): return a - b
+    if(op == "<<"): return a << b if 0 <= b < 64 else 0
+    if(op == ">>"): return a >> b if 0 <= b < 64 else 0
+    if(op == "<"): return int(a < b)
+    if(op == "<="): return int(a <= b)
+    if(op == ">"): return int(a > b)
+    if(op == ">="): return int(a >= b)
+    if(op == "=="): return int(a == b)
+    if(op == "!="): return int(a != b)
+    if(op == "&"): return a & b
+    if(op == "^"): return a ^ b
+    if(op == "|"): return a | b
+    if(op == "&&"): return int(bool(a) and bool(b))
+    return int(bool(a) or bool(b))
+
+class ExpressionParser:
+    # the integer constant expression of #if, all identifiers left after the expansion are 0
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def Next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def Peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def ParseConditional(self):
+        condition = self.ParseBinary(1)
+        if(self.Peek() == "?"):
+            self.pos += 1
+            a = self.ParseConditional()
+            if(self.Next() != ":"):
+                raise ValueError("missing : in ?:")
+            b = self.ParseConditional()
+            return a if condition else b
+        return condition
+
+    def ParseBinary(self, minPrecedence):
+        left = self.ParseUnary()
+        while(True):
+            op = self.Peek()
+            precedence = BINARY_PRECEDENCE.get(op)
+            if(precedence is None or precedence < minPrecedence):
+                return left
+            self.pos += 1
+            right = self.ParseBinary(precedence + 1)
+            left = ApplyBinary(op, left, right)
+
+    def ParseUnary(self):
+        token = self.Next()
+        if(token == "("):
+            value = self.ParseConditional()
+            if(self.Next() != ")"):
+                raise ValueError("missing )")
+            return value
+        if(token == "!"):
+            return int(not self.ParseUnary())
+        if(token == "-"):
+            return -self.ParseUnary()
+        if(token == "+"):
+            return self.ParseUnary()
+        if(token == "~"):
+            return ~self.ParseUnary()
+        if(token[0].isdigit() or token[0] in "'." or token.startswith("L'")):
+            return ParseNumber(token)
+        if(token == "true"):
+            return 1
+        if(token[0].isalpha() or token[0] == "_"):
+            return 0
+        raise ValueError("unexpected {0}".format(token))
+
+class IncludeScanner:
+    """
+    Scan one translation unit into an IncludeGraph.
+    """
+    def __init__(self, parseCache, searchPath, macros, graph, canonicalPath, fileStamps, directives = None):
+        self.parseCache = parseCache
+        self.searchPath = searchPath
+        self.macros = macros
+        self.expander = MacroExpander(macros)
+        self.graph = graph
+        self.directives = directives # every active #include, entered or not, None if not kept
+        self.canonicalPath = canonicalPath
+        self.fileStamps = fileStamps
+        self.onceFiles = set()
+        self.completedFiles = set()
+        self.unresolved = [] # (includer, header as written)
+        self.warnings = [] # (file, message)
+
+    def Define(self, macroArgs):
+        for kind, value in macroArgs:
+            name, sep, body = value.partition("=")
+            if(kind == "D"):
+                self.macros[name] = Macro(name, None, False, Tokenize(body) if sep else ["1"])
+            else:
+                self.macros.pop(name, None)
+        return
+
+    def IsDefined(self, name):
+        return name in self.macros or name in BUILTIN_NAMES
+
+    def Scan(self, srcFileFullPath, forcedIncludes):
+        srcNode = self.canonicalPath(srcFileFullPath)
+        for forced in forcedIncludes:
+            # like gcc: relative to the current folder first, then the search chain
+            foundPath, dirIndex = (os.path.normpath(os.path.abspath(forced)), None) if self.parseCache.headerResolver.IsFile(os.path.abspath(forced)) else self.searchPath.Resolve(forced, True, None)
+            if(foundPath is None):
+                self.unresolved.append((srcNode, forced))
+                continue
+            self.Enter(srcNode, foundPath, dirIndex)
+        parsed = self.parseCache.GetParsedFile(srcNode, self.fileStamps)
+        if(parsed is not None):
+            self.Process(srcNode, os.path.dirname(srcFileFullPath), parsed, None)
+        return
+
+    def Enter(self, includerNode, foundPath, dirIndex):
+        node = self.canonicalPath(foundPath)
+        if(node in self.onceFiles):
+            return
+        parsed = self.parseCache.GetParsedFile(node, self.fileStamps)
+        if(parsed is not None and parsed.guard is not None and node in self.completedFiles and parsed.guard in self.macros):
+            return # gcc does not even open it again, once it has been read to its end
+        self.graph.AddEdge(includerNode, node)
+        if(parsed is not None):
+            self.Process(node, os.path.dirname(foundPath), parsed, dirIndex)
+        self.completedFiles.add(node)
+        return
+
+    def ExpandIncludeOperand(self, tokens):
+        texts = [x[0] for x in self.expander.Expand([(x, EMPTY) for x in tokens])]
+        if(len(texts) > 0 and texts[0].startswith("\"")):
+            return True, texts[0][1:-1]
+        if(len(texts) > 1 and texts[0] == "<" and ">" in texts):
+            return False, "".join(texts[1:texts.index(">")])
+        return None, None
+
+    def ReplaceOperators(self, tokens, fileDir, dirIndex):
+        # "defined X", "__has_include(...)" and "__has_attribute(...)"... by 1 or 0
+        resolved = []
+        i = 0
+        while(i < len(tokens)):
+            token = tokens[i]
+            if(token == "defined"):
+                if(i + 1 < len(tokens) and tokens[i + 1] == "("):
+                    name = tokens[i + 2] if i + 2 < len(tokens) else ""
+                    i += 4
+                else:
+                    name = tokens[i + 1] if i + 1 < len(tokens) else ""
+                    i += 2
+                resolved.append("1" if self.IsDefined(name) else "0")
+                continue
+            if(token in ("__has_include", "__has_include_next") or token in HAS_FEATURE_OPERATORS):
+                end = i + 2
+                depth = 0
+                while(end < len(tokens) and (tokens[end] != ")" or depth > 0)):
+                    depth += 1 if tokens[end] == "(" else -1 if tokens[end] == ")" else 0
+                    end += 1
+                operand = tokens[i + 2:end]
+                value = "0" # the attributes and builtins of the compiler are not known
+                if(token.startswith("__has_include") and len(operand) > 0):
+                    if(operand[0].startswith("\"")):
+                        quoted, name = True, operand[0][1:-1]
+                    elif(operand[0] == "<" and ">" in operand):
+                        quoted, name = False, "".join(operand[1:operand.index(">")])
+                    else:
+                        quoted, name = self.ExpandIncludeOperand(operand)
+                    if(name is not None):
+                        nextAfter = (dirIndex if dirIndex is not None else self.searchPath.angleStart - 1) if token == "__has_include_next" else None
+                        value = "1" if self.searchPath.Resolve(name, quoted, fileDir, nextAfter)[0] is not None else "0"
+                resolved.append(value)
+                i = end + 1
+                continue
+            resolved.append(token)
+            i += 1
+        return resolved
+
+    def Evaluate(self, tokens, fileNode, fileDir, dirIndex):
+        # the operators first, their operands must not be expanded, then again for those coming from a macro, like glibc's __glibc_has_attribute(x)
+        expanded = [x[0] for x in self.expander.Expand([(x, EMPTY) for x in self.ReplaceOperators(tokens, fileDir, dirIndex)])]
+        expanded = self.ReplaceOperators(expanded, fileDir, dirIndex)
+        try:
+            parser = ExpressionParser(expanded)
+            value = parser.ParseConditional()
+            return value != 0
+        except (IndexError, ValueError, TypeError):
+            self.warnings.append((fileNode, "cannot evaluate #if {0}".format(" ".join(tokens))))
+            return False
+
+    def Process(self, fileNode, fileDir, parsed, dirIndex):
+        macros = self.macros
+        condStack = [] # (the enclosing group is active, a branch of this group was taken)
+        active = True
+        for directive, operand in parsed.directives:
+            if(directive in IF_DIRECTIVES):
+                if(active):
+                    if(directive == "if"):
+                        taken = self.Evaluate(operand, fileNode, fileDir, dirIndex)
+                    else:
+                        taken = self.IsDefined(operand) == (directive == "ifdef")
+                    condStack.append((True, taken))
+                    active = taken
+                else:
+                    condStack.append((False, True))
+            elif(directive in ELIF_DIRECTIVES):
+                if(len(condStack) == 0):
+                    continue
+                parentActive, taken = condStack[-1]
+                if(parentActive and not taken):
+                    if(directive == "elif"):
+                        taken = self.Evaluate(operand, fileNode, fileDir, dirIndex)
+                    else:
+                        taken = self.IsDefined(operand) == (directive == "elifdef")
+                    condStack[-1] = (True, taken)
+                    active = taken
+                else:
+                    active = False
+            elif(directive == "else"):
+                if(len(condStack) == 0):
+                    continue
+                parentActive, taken = condStack[-1]
+                active = parentActive and not taken
+                condStack[-1] = (parentActive, True)
+            elif(directive == "endif"):
+                if(len(condStack) > 0):
+                    active = condStack.pop(-1)[0]
+            elif(not active):
+                continue
+            elif(directive == "define"):
+                macros[operand.name] = operand
+            elif(directive == "undef"):
+                macros.pop(operand, None)
+            elif(directive == "once"):
+                self.onceFiles.add(fileNode)
+            else: # include, include_next
+                quoted, name = operand
+                if(quoted is None):
+                    quoted, name = self.ExpandIncludeOperand(name)
+                    if(name is None):
+                        self.warnings.append((fileNode, "cannot expand a computed #include"))
+                        continue
+                if(directive == "include_next"):
+                    nextAfter = dirIndex if dirIndex is not None else self.searchPath.angleStart - 1
+                    foundPath, foundIndex = self.searchPath.Resolve(name, quoted, fileDir, nextAfter)
+                else:
+                    foundPath, foundIndex = self.searchPath.Resolve(name, quoted, fileDir)
+                if(foundPath is None):
+                    self.unresolved.append((fileNode, name))
+                    self.graph.AddEdge(fileNode, name) # kept as a leaf, like the name gcc would complain about
+                    if(self.directives is not None):
+                        self.directives.AddEdge(fileNode, name)
+                    continue
+                if(self.directives is not None): # before the guard check, the -include files are no directive
+                    self.directives.AddEdge(fileNode, self.canonicalPath(foundPath))
+                self.Enter(fileNode, foundPath, foundIndex)
+        return
+
+def ScanTranslationUnit(parseCache, gccFullPath, srcFileFullPath, configMacros, includeSearchPaths, bldFlags, graph, canonicalPath, fileStamps, directives = None):
+    """
+    Build the include graph of a source file from its compile settings; return the scanner for its unresolved includes and warnings.
+    With directives, an IncludeGraph, its include directives are kept too.
+    """
+    cmdLine = CommandLine(configMacros, includeSearchPaths, bldFlags)
+    language = GetLanguage(srcFileFullPath)
+    compilerMacros, compilerDirs = parseCache.GetCompilerDefaults(gccFullPath, language, GetCompilerQueryFlags(cmdLine.otherFlags))
+    systemDirs = cmdLine.systemDirs + ([] if cmdLine.noStdInc else compilerDirs) + cmdLine.afterDirs
+    searchPath = parseCache.headerResolver.GetSearchPath(cmdLine.quoteDirs, cmdLine.angleDirs, systemDirs)
+    scanner = IncludeScanner(parseCache, searchPath, dict(compilerMacros), graph, canonicalPath, fileStamps, directives)
+    scanner.Define(cmdLine.macroArgs)
+    forcedIncludes = list(cmdLine.forcedIncludes)
+    if(not cmdLine.freestanding and not cmdLine.noStdInc):
+        predef, _ = searchPath.Resolve("stdc-predef.h", False, None)
+        if(predef is not None): # gcc includes it after the -imacros files and before the -include files, unless freestanding
+            forcedIncludes.insert(cmdLine.imacrosCount, predef)
+    scanner.Scan(srcFileFullPath, forcedIncludes)
+    return scanner
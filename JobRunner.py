@@ -0,0 +1,152 @@
+"""
+Compiler jobs of Zephyr Include Map, for the whole-build and "diff" runs.
+
+A "gcc -E" started through a shell, with no time limit and no look at its
+exit status, turns a hung compiler into a hung run, and a failing one into
+an empty include map nobody notices. The jobs are run on an asyncio event
+loop instead:
+
+- the compiler is started directly, with the argv made from the compile
+  settings, no shell in between,
+- at most "jobs" compilers run at a time (-j, the number of CPUs by default),
+  the other translation units wait for a free slot,
+- a compiler running longer than --timeout seconds is killed,
+- a compiler that cannot be started, is killed or exits with an error is a
+  JobError of its translation unit: what went wrong and the end of its
+  stderr. So is an error of the code reading its output, the compiler is
+  killed then. The other translation units go on,
+- Ctrl-C cancels the jobs waiting for a slot and kills the running compilers,
+- every result is handed over as soon as its job ends, in the order the jobs
+  end, so the graphs are built while the other compilers are still running,
+- a job can stream the compiler output instead of keeping it: the "-E" output
+  of a translation unit can be hundreds of MB, so it goes through an OS pipe
+  to a worker thread reading it line by line, and with -j N at most N pipe
+  buffers are in memory, not N whole outputs. Only stderr is collected.
+  The reader threads have a pool of their own, one per slot: in the default
+  executor, shared with the other worker threads of the run, a compiler
+  could wait for a reader with its timeout running.
+"""
+import os
+import signal
+import asyncio
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+STDERR_TAIL_LINES = 20 # the compiler messages kept in a JobError
+
+class JobError(Exception):
+    def __init__(self, srcFileFullPath, reason, returnCode = None, stderr = ""):
+        super().__init__("{0}: {1}".format(srcFileFullPath, reason))
+        self.srcFileFullPath = srcFileFullPath
+        self.reason = reason
+        self.returnCode = returnCode
+        self.stderrTail = stderr.splitlines()[-STDERR_TAIL_LINES:]
+
+    def ToDict(self):
+        return {"source": self.srcFileFullPath, "reason": self.reason, "returnCode": self.returnCode, "stderr": self.stderrTail}
+
+class JobRunner:
+    def __init__(self, jobs, timeout):
+        self.slots = asyncio.Semaphore(jobs)
+        self.freeSlots = list(range(jobs - 1, -1, -1)) # which of the -j slots a job runs in, for the trace rows
+        self.timeout = timeout or None # 0: no limit
+        self.readers = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="JobReader")
+
+    def Close(self):
+        # every reader is done once its job is, see Kill()
+        self.readers.shutdown()
+        return
+
+    async def Run(self, srcFileFullPath, argv, span, consume = None, consumeStage = "reading the output"):
+        """
+        Run a compiler and return its (stdout, stderr) as text, or raise a JobError.
+        With consume, stdout is not kept: consume(lines) reads it in a worker thread while the compiler runs,
+        and (None, stderr) is returned. An exception of consume() is a JobError "<consumeStage> failed".
+        span is a job span, see Profiler.JobStage(): the wall time from the start of the compiler to its end.
+        """
+        async with self.slots:
+            slot = self.freeSlots.pop()
+            try:
+                return await self.RunInSlot(srcFileFullPath, argv, span.InSlot(slot), consume, consumeStage)
+            finally:
+                self.freeSlots.append(slot)
+
+    async def RunInSlot(self, srcFileFullPath, argv, span, consume, consumeStage):
+        with span:
+            readFd, writeFd = os.pipe() if consume is not None else (None, None)
+            try:
+                process = await asyncio.create_subprocess_exec(*argv, stdin=subprocess.DEVNULL, stdout=writeFd if writeFd is not None else subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+            except OSError as e:
+                if(readFd is not None):
+                    os.close(readFd)
+                raise JobError(srcFileFullPath, "cannot run {0}: {1}".format(argv[0], e.strerror))
+            finally:
+                if(writeFd is not None):
+                    os.close(writeFd) # the compiler has its own copy, the reader sees the end of the output when it exits
+            reader = asyncio.get_running_loop().run_in_executor(self.readers, ReadLines, consume, readFd) if readFd is not None else None
+            try:
+                async with asyncio.timeout(self.timeout):
+                    stdout, stderr = await (process.communicate() if reader is None else Communicate(process, reader))
+            except TimeoutError:
+                await Kill(process, reader)
+                raise JobError(srcFileFullPath, "killed after {0:g} seconds".format(self.timeout))
+            except asyncio.CancelledError: # Ctrl-C
+                await Kill(process, reader)
+                raise
+            except Exception as e: # raised by consume(), e.g. on output it cannot parse
+                await Kill(process, reader)
+                raise JobError(srcFileFullPath, "{0} failed: {1}: {2}".format(consumeStage, type(e).__name__, e))
+        stdout = stdout.decode("utf-8", "replace") if stdout is not None else None
+        stderr = stderr.decode("utf-8", "replace")
+        if(process.returncode != 0):
+            raise JobError(srcFileFullPath, "{0} exited with {1}".format(argv[0], process.returncode), process.returncode, stderr)
+        return stdout, stderr
+
+def ReadLines(consume, readFd):
+    # in a worker thread: the pipe is read as it is written, closed early if consume() fails so the compiler is not left blocked
+    with open(readFd, "r", errors="replace") as f:
+        consume(f)
+    return
+
+async def Communicate(process, reader):
+    # process.communicate() with stdout going to the reader thread
+    stderr = await process.stderr.read()
+    await process.wait()
+    await asyncio.shield(reader) # a timeout or Ctrl-C does not leave the thread running on its own, see Kill()
+    return None, stderr
+
+async def Kill(process, reader = None):
+    # "gcc" is only the driver, the preprocessor is its child "cc1": the process group is killed, on POSIX
+    if(hasattr(os, "killpg")):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    elif(process.returncode is None):
+        process.kill()
+    await process.wait()
+    if(reader is not None): # the output ends with the compiler, the reader thread is done soon after
+        await asyncio.wait([reader])
+        if(not reader.cancelled()):
+            reader.exception() # an error of consume() on the cut output says nothing more, do not log it
+    return
+
+def RunJobs(items, job, onDone, jobs, timeout):
+    """
+    Run the coroutine job(item, runner) of every item, onDone(result) is called as each of them ends.
+    On Ctrl-C the jobs left are cancelled and KeyboardInterrupt is raised once their compilers are killed.
+    """
+    async def RunAll():
+        runner = JobRunner(jobs, timeout)
+        tasks = [asyncio.create_task(job(x, runner)) for x in items]
+        try:
+            for task in asyncio.as_completed(tasks):
+                onDone(await task)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            runner.Close()
+        return
+    asyncio.run(RunAll())
+    return
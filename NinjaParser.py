@@ -0,0 +1,248 @@
+"""
+Ninja build file parser for Zephyr Include Map.
+
+build.ninja (and every file it pulls in with include/subninja) is streamed once.
+Each build edge is indexed by the full path of its first explicit input, so the
+compile settings of a source file can be looked up with a single dict access:
+
+    <srcFileFullPath, {"DEFINES": ..., "INCLUDES": ..., "FLAGS": ..., "rule": ...}>
+
+Supported syntax: comments, top-level and indented variable bindings, $-escapes
+and $-line continuations, "rule"/"pool"/"build"/"default" declarations,
+"include" (same scope) and "subninja" (child scope).
+
+The index is cached in <bldDir>/.includemap/ninja-index.bin, keyed by the size,
+mtime and content hash of every ninja file read, and rebuilt when stale.
+"""
+import os.path
+import re
+import sys
+from IncludeMapCache import GetCacheFileFullPath, GetFileStamp, HashFile, ReadCacheFile, WriteCacheFile
+
+# the variables we care about for each compile edge
+INDEXED_VARIABLES = ("DEFINES", "INCLUDES", "FLAGS")
+
+INDEX_CACHE_FILE_NAME = "ninja-index.bin"
+INDEX_CACHE_VERSION = 2 # bump when the index layout changes
+
+# a path in a "build" line, or one of the separators ":", "|", "||", "|@"
+buildLineTokenRegex = re.compile(r"((?:\$.|[^\s$:|])+)|(\|\||\|@|\||:)")
+# $$, "$ ", "$:", ${var} and $var
+varRefRegex = re.compile(r"\$(\$|\s|:|\{([a-zA-Z0-9_.-]+)\}|([a-zA-Z0-9_-]+))")
+
+class NinjaScope:
+    # variables and rules visible to a ninja file; a subninja gets a child scope.
+    def __init__(self, parent = None):
+        self.parent = parent
+        self.variables = dict()
+        self.rules = dict() # <ruleName, <varName, rawValue>>
+
+    def LookupVariable(self, name):
+        scope = self
+        while(scope is not None):
+            if(name in scope.variables):
+                return scope.variables[name]
+            scope = scope.parent
+        return ""
+
+    def LookupRule(self, name):
+        scope = self
+        while(scope is not None):
+            if(name in scope.rules):
+                return scope.rules[name]
+            scope = scope.parent
+        return None
+
+def EvaluateString(rawValue, lookup):
+    # expand the variable references and escapes of a ninja string
+    if("$" not in rawValue):
+        return rawValue
+    def Expand(m):
+        escaped = m.group(1)
+        if(m.group(2) is not None):
+            return lookup(m.group(2))
+        if(m.group(3) is not None):
+            return lookup(m.group(3))
+        return escaped # $$, "$ " and "$:"
+    return varRefRegex.sub(Expand, rawValue)
+
+def ReadLogicalLines(f):
+    # join "$"-continued physical lines; the continuation's leading spaces are dropped.
+    pending = None
+    for rawLine in f:
+        line = rawLine.rstrip("\r\n")
+        if(pending is not None):
+            line = pending + line.lstrip(" ")
+            pending = None
+        trailingDollars = len(line) - len(line.rstrip("$"))
+        if(trailingDollars % 2 == 1):
+            pending = line[:-1]
+            continue
+        yield line
+    if(pending is not None):
+        yield pending
+
+def SplitBinding(line):
+    name, sep, value = line.partition("=")
+    if(sep == ""):
+        return None, None
+    return name.strip(), value.lstrip(" ")
+
+def ParseBuildLine(rest):
+    # "outputs [| implicit-outputs]: rule inputs [| implicit] [|| order-only] [|@ validations]"
+    outputs = []
+    ruleName = None
+    explicitInputs = []
+    section = "outputs"
+    for m in buildLineTokenRegex.finditer(rest):
+        path, separator = m.group(1), m.group(2)
+        if(separator == ":" and section in ("outputs", "implicitOutputs")):
+            section = "rule"
+        elif(separator is not None and section not in ("outputs", "rule")):
+            section = "otherInputs" # every input after the first separator is not explicit
+        elif(separator == "|"):
+            section = "implicitOutputs"
+        elif(section == "outputs"):
+            outputs.append(path)
+        elif(section == "rule"):
+            ruleName = path
+            section = "inputs"
+        elif(section == "inputs"):
+            explicitInputs.append(path)
+    return outputs, ruleName, explicitInputs
+
+def ParseNinjaFile(ninjaFileFullPath, bldDir, scope, index, ninjaFiles):
+    ninjaFiles.append(ninjaFileFullPath)
+    with open(ninjaFileFullPath, "r") as f:
+        bindings = None # the indented bindings of the current rule/build/pool
+        pendingEdge = None
+        for line in ReadLogicalLines(f):
+            stripped = line.lstrip(" ")
+            if(stripped == "" or stripped[0] == "#"):
+                continue
+            if(len(stripped) != len(line)): # indented binding
+                if(bindings is not None):
+                    name, value = SplitBinding(stripped)
+                    if(name is not None):
+                        bindings[name] = value
+                continue
+
+            if(pendingEdge is not None):
+                IndexBuildEdge(pendingEdge, bldDir, scope, index)
+                pendingEdge = None
+            bindings = None
+
+            keyword, _, rest = stripped.partition(" ")
+            if(keyword == "build"):
+                outputs, ruleName, explicitInputs = ParseBuildLine(rest)
+                bindings = dict()
+                pendingEdge = (outputs, ruleName, explicitInputs, bindings)
+            elif(keyword == "rule"):
+                bindings = dict()
+                scope.rules[rest.strip()] = bindings
+            elif(keyword == "pool"):
+                bindings = dict() # pool depth is not of interest
+            elif(keyword == "default"):
+                pass
+            elif(keyword in ("include", "subninja")):
+                path = EvaluateString(rest.strip(), scope.LookupVariable)
+                path = path if os.path.isabs(path) else os.path.join(bldDir, path)
+                ParseNinjaFile(path, bldDir, scope if keyword == "include" else NinjaScope(scope), index, ninjaFiles)
+            else:
+                name, value = SplitBinding(stripped)
+                if(name is not None): # top-level bindings are evaluated right away
+                    scope.variables[name] = EvaluateString(value, scope.LookupVariable)
+        if(pendingEdge is not None):
+            IndexBuildEdge(pendingEdge, bldDir, scope, index)
+    return
+
+def IndexBuildEdge(pendingEdge, bldDir, scope, index):
+    outputs, ruleName, explicitInputs, rawBindings = pendingEdge
+    if(len(explicitInputs) == 0 or ruleName == "phony"):
+        return
+
+    # edge bindings see the earlier edge bindings, then the enclosing scope.
+    edgeVariables = dict()
+    def LookupEdgeVariable(name):
+        if(name in edgeVariables):
+            return edgeVariables[name]
+        return scope.LookupVariable(name)
+    for name, rawValue in rawBindings.items():
+        edgeVariables[name] = EvaluateString(rawValue, LookupEdgeVariable)
+
+    # like in ninja, a variable not bound on the edge comes from the rule, then the scope.
+    rule = scope.LookupRule(ruleName) or dict()
+    def LookupIndexedVariable(name):
+        if(name in edgeVariables):
+            return edgeVariables[name]
+        if(name in rule):
+            return EvaluateString(rule[name], LookupEdgeVariable)
+        return scope.LookupVariable(name)
+
+    # the compile settings may be bound on the edge or its rule, or only used by the rule's command and bound in the scope
+    usedVariables = {m.group(2) or m.group(3) for m in varRefRegex.finditer(rule.get("command", ""))}
+    if(not any(x in rawBindings or x in rule or x in usedVariables for x in INDEXED_VARIABLES)):
+        return # not a compile edge
+    values = {x: LookupIndexedVariable(x) for x in INDEXED_VARIABLES}
+
+    srcFile = EvaluateString(explicitInputs[0], LookupEdgeVariable)
+    srcFileFullPath = os.path.realpath(os.path.join(bldDir, srcFile)) # relative paths are relative to the build folder
+    if(srcFileFullPath in index):
+        return # like the old line scan, the first edge of a source file wins
+    # the same flags repeat for thousands of edges; interning lets the cache pickle them once.
+    entry = {x: sys.intern(y) for x, y in values.items()}
+    entry["rule"] = sys.intern(ruleName)
+    index[srcFileFullPath] = entry
+    return
+
+def BuildSourceIndex(ninjaBldFile, bldDir, ninjaFiles = None):
+    """
+    Parse build.ninja once and return <srcFileFullPath, {DEFINES, INCLUDES, FLAGS, rule}>.
+    The paths of all the ninja files read are appended to ninjaFiles.
+    """
+    index = dict()
+    ParseNinjaFile(ninjaBldFile, bldDir, NinjaScope(), index, ninjaFiles if ninjaFiles is not None else [])
+    return index
+
+def IsIndexCacheFresh(cache):
+    # size+mtime match: trust it. Otherwise compare the content hash, so a touched but
+    # unchanged build.ninja (e.g. after a no-op cmake re-run) still hits the cache.
+    touched = False
+    for ninjaFile in cache["ninjaFiles"]:
+        try:
+            stamp = GetFileStamp(ninjaFile["path"])
+        except OSError:
+            return False, False
+        if(stamp == ninjaFile["stamp"]):
+            continue
+        if(stamp[0] != ninjaFile["stamp"][0] or HashFile(ninjaFile["path"]) != ninjaFile["hash"]):
+            return False, False
+        ninjaFile["stamp"] = stamp
+        touched = True
+    return True, touched
+
+def LoadSourceIndex(ninjaBldFile, bldDir, cachedOnly = False):
+    """
+    Same as BuildSourceIndex(), but served from <bldDir>/.includemap/ninja-index.bin when it is fresh.
+    With cachedOnly, None is returned instead of parsing when the cache is missing or stale.
+    """
+    cacheFileFullPath = GetCacheFileFullPath(bldDir, INDEX_CACHE_FILE_NAME)
+    cache = ReadCacheFile(cacheFileFullPath, INDEX_CACHE_VERSION, bldDir)
+    if(cache is not None):
+        fresh, touched = IsIndexCacheFresh(cache)
+        if(fresh):
+            if(touched):
+                WriteCacheFile(cacheFileFullPath, cache)
+            return cache["index"]
+    if(cachedOnly):
+        return None
+
+    ninjaFiles = []
+    index = BuildSourceIndex(ninjaBldFile, bldDir, ninjaFiles)
+    cache = dict()
+    cache["version"] = INDEX_CACHE_VERSION
+    cache["bldDir"] = bldDir
+    cache["ninjaFiles"] = [{"path": x, "stamp": GetFileStamp(x), "hash": HashFile(x)} for x in ninjaFiles]
+    cache["index"] = index
+    WriteCacheFile(cacheFileFullPath, cache)
+    return index
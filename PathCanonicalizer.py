@@ -0,0 +1,53 @@
+"""
+Path canonicalization for Zephyr Include Map.
+
+A Zephyr translation unit has thousands of line markers, but they point at a
+few hundred headers, and the same headers again in the next translation unit.
+Each os.path.realpath() is a chain of lstat() calls, which is slow on network
+file systems. The canonicalizer maps a raw marker path to its canonical path
+and category once, and serves the repeats from a bounded LRU cache that is
+shared by all the translation units of a run.
+"""
+import os.path
+import functools
+
+CATEGORY_GENERATED = "generated" # in the build folder
+CATEGORY_ZEPHYR = "zephyr" # in the zephyr folder
+CATEGORY_TOOLCHAIN = "toolchain" # shipped with the compiler
+CATEGORY_OUT_OF_TREE = "outOfTree"
+
+DEFAULT_CACHE_SIZE = 1 << 16
+
+def IsInDir(path, dirPath):
+    return path == dirPath or path.startswith(dirPath.rstrip(os.path.sep) + os.path.sep)
+
+class PathCanonicalizer:
+    def __init__(self, zephyrDir, bldDir, toolchainDir = None, cacheSize = DEFAULT_CACHE_SIZE):
+        self.zephyrDir = zephyrDir
+        self.bldDir = bldDir
+        self.toolchainDir = toolchainDir
+        # functools.lru_cache is thread-safe, the parallel jobs of a whole-build run share it.
+        self.Canonicalize = functools.lru_cache(maxsize=cacheSize)(self.CanonicalizeUncached)
+
+    def CanonicalizeUncached(self, rawPath):
+        path = os.path.normpath(os.path.realpath(rawPath))
+        return path, self.Categorize(path)
+
+    def Categorize(self, path):
+        # the build folder is usually inside the zephyr folder, so it is checked first.
+        if(IsInDir(path, self.bldDir)):
+            return CATEGORY_GENERATED
+        if(IsInDir(path, self.zephyrDir)):
+            return CATEGORY_ZEPHYR
+        if((self.toolchainDir is not None and IsInDir(path, self.toolchainDir)) or "zephyr-sdk" in path):
+            return CATEGORY_TOOLCHAIN
+        return CATEGORY_OUT_OF_TREE
+
+    def CanonicalPath(self, rawPath):
+        return self.Canonicalize(rawPath)[0]
+
+    def Category(self, rawPath):
+        return self.Canonicalize(rawPath)[1]
+
+    def CacheInfo(self):
+        return self.Canonicalize.cache_info()
@@ -0,0 +1,164 @@
+"""
+Shared preprocessor cache of Zephyr Include Map, enabled by --ppCacheDir.
+
+tu-graphs.bin (see IncludeMapCache.py) only helps the build folder it lives
+in and is trusted by size+mtime. This cache works like ccache: it can be
+shared by everybody generating maps of the same build, and is keyed by
+content.
+
+    key:   hash of the mode (-E/-H), the compiler (path, size, mtime),
+           DEFINES, INCLUDES, FLAGS, and the path and content of the source
+           file; relative include folders are made absolute first, so runs
+           from different folders share their entries
+    entry: up to MAX_VARIANTS results for the key, each with the content
+           hash of every header the line markers showed, the graph matrix,
+           the include directives and, if counted, the header costs; never
+           the preprocessed text
+
+A variant is used only if every one of its headers still has the same content,
+then the compiler is not run at all. Entries are files in
+<ppCacheDir>/<2 hex digits>/<key>.json; a hit refreshes their mtime, and
+TrimPreProcessorCache() removes the least recently used ones beyond the size cap.
+
+Unlike the pickled caches of the build folder, whoever can write to the
+shared folder can write entries every other user reads. So an entry is plain
+JSON, and a variant is used only if it holds nothing but the expected
+strings, lists and counters. A bad entry is a cache miss, never code run.
+It can still give a wrong include map, so only share the folder with users
+whose maps you would trust.
+"""
+import os
+import os.path
+import IncludeMapCache
+
+PP_CACHE_VERSION = 3 # bump when the entry layout changes
+ENTRY_FILE_SUFFIX = ".json"
+OLD_ENTRY_FILE_SUFFIX = ".bin" # pickled entries of PP_CACHE_VERSION 2 and before, only trimmed
+MAX_VARIANTS = 4 # results kept per key, e.g. for a header edited back and forth
+DEFAULT_PP_CACHE_SIZE_MB = 512
+
+def GetFileHash(fileHashes, fileFullPath):
+    # shared headers are hashed once per run; None if the file is gone.
+    fileHash = fileHashes.get(fileFullPath, False)
+    if(fileHash is False):
+        try:
+            fileHash = IncludeMapCache.HashFile(fileFullPath)
+        except OSError:
+            fileHash = None
+        fileHashes[fileFullPath] = fileHash
+    return fileHash
+
+def GetPreProcessorCacheKey(cmdStrings, gccFullPath, srcFileFullPath, fileHashes):
+    try:
+        gccStamp = IncludeMapCache.GetFileStamp(gccFullPath)
+    except OSError:
+        return None
+    srcHash = GetFileHash(fileHashes, srcFileFullPath)
+    if(srcHash is None):
+        return None
+    return IncludeMapCache.HashStrings(list(cmdStrings) + [str(gccStamp), srcHash])
+
+def GetEntryFileFullPath(ppCacheDir, key):
+    return os.path.join(ppCacheDir, key[:2], key + ENTRY_FILE_SUFFIX)
+
+def IsStringDict(value, isItem):
+    return isinstance(value, dict) and all(isinstance(x, str) and isItem(y) for x, y in value.items())
+
+def IsStringList(value):
+    return isinstance(value, list) and all(isinstance(x, str) for x in value)
+
+def IsCounterList(value):
+    return isinstance(value, list) and len(value) == 4 and all(type(x) is int for x in value)
+
+def IsValidVariant(variant):
+    # exactly the plain data Store() writes, anything else in a shared entry is ignored
+    if(not isinstance(variant, dict)):
+        return False
+    if(not IsStringDict(variant.get("fileHashes"), lambda x: isinstance(x, str))):
+        return False
+    if(not IsStringDict(variant.get("graphMatrix"), IsStringList) or not IsStringDict(variant.get("includeDirectives"), IsStringList)):
+        return False
+    return "headerCosts" not in variant or IsStringDict(variant["headerCosts"], IsCounterList)
+
+def ReadEntry(ppCacheDir, key):
+    # the cache is shared by all build folders, its files carry no bldDir.
+    import json # like pickle for the caches of the build folder, only needed with --ppCacheDir
+    try:
+        with open(GetEntryFileFullPath(ppCacheDir, key), "rb") as f:
+            entry = json.loads(f.read())
+    except Exception: # missing, truncated or not JSON
+        return []
+    if(not isinstance(entry, dict) or entry.get("version") != PP_CACHE_VERSION or not isinstance(entry.get("variants"), list)):
+        return []
+    return [x for x in entry["variants"] if IsValidVariant(x)]
+
+def WriteEntry(ppCacheDir, key, entry):
+    import json
+    IncludeMapCache.WriteFileAtomically(GetEntryFileFullPath(ppCacheDir, key), json.dumps(entry, separators=(",", ":")).encode("utf-8", "surrogateescape"))
+    return
+
+def LookUp(ppCacheDir, key, fileHashes, needHeaderCosts):
+    """
+    Return the variant of the key whose headers are all unchanged, None if there is none.
+    """
+    for variant in ReadEntry(ppCacheDir, key):
+        if(needHeaderCosts and "headerCosts" not in variant):
+            continue
+        if(all(GetFileHash(fileHashes, x) == y for x, y in variant["fileHashes"].items())):
+            try:
+                os.utime(GetEntryFileFullPath(ppCacheDir, key)) # most recently used
+            except OSError:
+                pass
+            return variant
+    return None
+
+def Store(ppCacheDir, key, srcFileFullPath, graphMatrix, includeDirectives, headerCosts, fileHashes):
+    variant = dict()
+    files = set()
+    for fromNode, toNodes in graphMatrix.items():
+        files.add(fromNode)
+        files.update(toNodes)
+    files.discard(srcFileFullPath) # its content is part of the key
+    variant["fileHashes"] = {x: GetFileHash(fileHashes, x) for x in files}
+    variant["graphMatrix"] = graphMatrix
+    variant["includeDirectives"] = includeDirectives
+    if(headerCosts is not None):
+        variant["headerCosts"] = {x: list(y) for x, y in headerCosts.items()}
+    variants = [variant] + [x for x in ReadEntry(ppCacheDir, key) if x["fileHashes"] != variant["fileHashes"]]
+    entry = dict()
+    entry["version"] = PP_CACHE_VERSION
+    entry["variants"] = variants[:MAX_VARIANTS]
+    WriteEntry(ppCacheDir, key, entry)
+    return
+
+def TrimPreProcessorCache(ppCacheDir, maxBytes):
+    """
+    Remove the least recently used entries until the cache fits in maxBytes.
+    """
+    files = []
+    total = 0
+    try:
+        subDirs = [x.path for x in os.scandir(ppCacheDir) if x.is_dir()]
+    except OSError:
+        return
+    for subDir in subDirs:
+        try:
+            for x in os.scandir(subDir):
+                if(x.is_file() and x.name.endswith((ENTRY_FILE_SUFFIX, OLD_ENTRY_FILE_SUFFIX))):
+                    st = x.stat()
+                    files.append((st.st_mtime_ns, st.st_size, x.path))
+                    total += st.st_size
+        except OSError:
+            continue
+    if(total <= maxBytes):
+        return
+    files.sort()
+    for mtime, size, path in files:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if(total <= maxBytes):
+            break
+    return
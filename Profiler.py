@@ -0,0 +1,214 @@
+"""
+Per-stage instrumentation of Zephyr Include Map, enabled by --profile.
+
+Each pipeline stage of each translation unit is a span:
+
+    with Stage(everything, "graphBuild") as span:
+        ...
+        span.CountGraph(graph)
+
+which records its wall time, the CPU time of its thread, the peak RSS of the
+process when it ended, and counters: bytes and lines read, line markers,
+nodes and edges. The spans of all the worker threads of a whole-build run go
+to the same profiler, and are summed per stage in the summary table, or
+written as Chrome trace events (chrome://tracing, ui.perfetto.dev) with one
+row per worker thread.
+
+The compilers of a whole-build run are awaited on the event loop thread,
+many at a time, so its thread CPU time and its single row would mix them up.
+They are job spans instead (JobStage()): wall time only, taken by the job
+runner around each compiler, one trace row per -j slot. Their CPU time is
+the "preprocessor cpu" of the run, from the ended child processes.
+
+Without --profile, Stage() returns a shared do-nothing span, nothing is
+measured and no line of the preprocessed output is looked at twice.
+"""
+import os
+import time
+import json
+import threading
+try:
+    import resource # not on Windows
+except ImportError:
+    resource = None
+
+def GetPeakRss():
+    # in KB, ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None
+
+def GetChildrenUsage():
+    # the CPU seconds and the peak RSS (KB) of the preprocessor runs that have ended
+    if(resource is None):
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+class NullSpan:
+    # what Stage() gives without --profile
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+    def Count(self, name, value):
+        return
+
+    def CountGraph(self, graph):
+        return
+
+    def Lines(self, lines):
+        return lines
+
+    def InSlot(self, slot):
+        return self
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    def __init__(self, profiler, name, srcFileFullPath):
+        self.profiler = profiler
+        self.name = name
+        self.srcFileFullPath = srcFileFullPath
+        self.counters = dict()
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        self.start = time.perf_counter()
+        self.cpuStart = time.thread_time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.thread_time() - self.cpuStart
+        self.peakRss = GetPeakRss()
+        self.profiler.AddSpan(self)
+        return False
+
+    def Count(self, name, value):
+        self.counters[name] = self.counters.get(name, 0) + value
+        return
+
+    def CountGraph(self, graph):
+        self.Count("nodes", graph.NodeCount())
+        self.Count("edges", graph.EdgeCount())
+        return
+
+    def Lines(self, lines):
+        # pass the lines through, counting the bytes, lines and line markers on the way
+        nbytes = 0
+        nlines = 0
+        markers = 0
+        try:
+            for line in lines:
+                nbytes += len(line)
+                nlines += 1
+                if(line.startswith("# ")):
+                    markers += 1
+                yield line
+        finally:
+            self.Count("bytes", nbytes)
+            self.Count("lines", nlines)
+            self.Count("markers", markers)
+
+class JobSpan(Span):
+    # a compiler job, timed on the wall clock only: it shares the event loop thread with the other jobs
+    def InSlot(self, slot):
+        self.tid = slot + 1 # the trace row of the slot: thread ids are addresses, never that small
+        return self
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = None
+        self.peakRss = None
+        self.profiler.AddSpan(self)
+        return False
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+        self.start = time.perf_counter()
+        self.cpuStart = time.process_time()
+
+    def Stage(self, name, srcFileFullPath):
+        return Span(self, name, srcFileFullPath)
+
+    def JobStage(self, name, srcFileFullPath):
+        return JobSpan(self, name, srcFileFullPath)
+
+    def AddSpan(self, span):
+        with self.lock:
+            self.spans.append(span)
+        return
+
+    def Summarize(self):
+        """
+        Return <stage, {count, wall, cpu, maxWall, counters}> in the order the stages first ran, and the run totals.
+        """
+        stages = dict()
+        for span in self.spans:
+            stage = stages.get(span.name)
+            if(stage is None):
+                stage = {"count": 0, "wall": 0.0, "cpu": 0.0, "maxWall": 0.0, "counters": dict()}
+                stages[span.name] = stage
+            stage["count"] += 1
+            stage["wall"] += span.wall
+            stage["cpu"] = stage["cpu"] + span.cpu if span.cpu is not None and stage["cpu"] is not None else None # None: job spans
+            stage["maxWall"] = max(stage["maxWall"], span.wall)
+            for name, value in span.counters.items():
+                stage["counters"][name] = stage["counters"].get(name, 0) + value
+        totals = dict()
+        totals["wall"] = time.perf_counter() - self.start
+        totals["cpu"] = time.process_time() - self.cpuStart
+        totals["childrenCpu"], totals["childrenPeakRss"] = GetChildrenUsage()
+        totals["peakRss"] = GetPeakRss()
+        totals["threads"] = len({x.tid for x in self.spans if x.cpu is not None})
+        return stages, totals
+
+    def FormatTable(self):
+        stages, totals = self.Summarize()
+        busy = sum(x["wall"] for x in stages.values()) or 1.0
+        rows = ["{0:<14} {1:>6} {2:>10} {3:>10} {4:>10} {5:>7}  {6}".format("stage", "count", "wall(s)", "cpu(s)", "max(s)", "share", "counters")]
+        for name, stage in stages.items():
+            counters = " ".join("{0}={1}".format(x, y) for x, y in stage["counters"].items())
+            cpu = "-" if stage["cpu"] is None else "{0:.3f}".format(stage["cpu"])
+            rows.append("{0:<14} {1:>6} {2:>10.3f} {3:>10} {4:>10.3f} {5:>6.1f}%  {6}".format(name, stage["count"], stage["wall"], cpu, stage["maxWall"], 100.0 * stage["wall"] / busy, counters))
+        rows.append("elapsed {0:.3f}s, cpu {1:.3f}s in {2} thread(s), preprocessor cpu {3}s".format(totals["wall"], totals["cpu"], totals["threads"], "?" if totals["childrenCpu"] is None else "{0:.3f}".format(totals["childrenCpu"])))
+        rows.append("peak RSS {0} KB, preprocessor peak RSS {1} KB".format(totals["peakRss"] or "?", totals["childrenPeakRss"] or "?"))
+        return os.linesep.join(rows)
+
+    def ExportTrace(self, fileFullPath):
+        # Chrome trace-event format: complete events, in microseconds since the start of the run
+        pid = os.getpid()
+        events = []
+        for tid in sorted({x.tid for x in self.spans if x.cpu is None}): # job spans
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": "job slot {0}".format(tid)}})
+        for span in self.spans:
+            args = dict(span.counters)
+            if(span.cpu is not None):
+                args["cpu"] = span.cpu
+                args["peakRssKB"] = span.peakRss
+            if(span.srcFileFullPath is not None):
+                args["file"] = span.srcFileFullPath
+            events.append({"name": span.name, "ph": "X", "ts": (span.start - self.start) * 1e6, "dur": span.wall * 1e6, "pid": pid, "tid": span.tid, "args": args})
+        with open(fileFullPath, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return
+
+def Stage(everything, name):
+    profiler = everything.get("profiler")
+    if(profiler is None):
+        return NULL_SPAN
+    return profiler.Stage(name, everything.get("srcFileFullPath"))
+
+def JobStage(everything, name):
+    # the span of a compiler run by the job runner, see JobSpan
+    profiler = everything.get("profiler")
+    if(profiler is None):
+        return NULL_SPAN
+    return profiler.JobStage(name, everything.get("srcFileFullPath"))
@@ -0,0 +1,307 @@
+"""
+Reachability engine of Zephyr Include Map: which headers each file pulls in.
+
+"Does X reach Y", "what is the full header set of this translation unit",
+"which includes of this file are already pulled in by its earlier includes":
+walking the <path, [path, ...]> dicts for every question costs a graph
+traversal each time, thousands of times over for a whole build. Instead:
+
+- the nodes have dense integer ids, the graph store path ids for a whole
+  build (see GraphStore.py), the IncludeGraph node ids for a single map,
+- the strongly connected components are found once (headers including each
+  other make cycles), numbered in reverse topological order,
+- the closure of every component is an integer bit set of the components it
+  reaches, itself included, made in one pass over the components: the
+  successors are numbered first, so a closure is the OR of theirs.
+
+The graphs of all the translation units are merged first: a header has one
+closure for the whole build, made once and shared by every translation unit
+including it, so "X reaches Y" is a shift and an AND, and the header set of a
+translation unit is the closure of its source file.
+
+Include guards hide the second include of a header: once a translation unit
+has entered a header, later includes of it leave no line marker and no edge.
+So the implied includes are looked for in the include directives of each
+file, guarded repeats included (kept from "gcc -E -dI" or by the include
+scanner, see IncludeMap.py), and the closures are made over the directives as
+well as the edges: a directive is implied if an earlier directive of the
+same file reaches its header. One reached only by a later directive is not
+reported, removing it would change the order the headers are included in.
+With --depsOnly the directives are not known, the edges of those translation
+units stand in.
+"""
+import os.path
+from collections import deque
+
+def GetStronglyConnectedComponents(nodeCount, successors):
+    """
+    Return the component of every node, numbered in reverse topological order (Tarjan's algorithm, without recursion).
+    successors is <nodeId, node ids>.
+    """
+    index = [-1] * nodeCount
+    lowLink = [0] * nodeCount
+    onStack = [False] * nodeCount
+    component = [-1] * nodeCount
+    stack = []
+    nextIndex = 0
+    componentCount = 0
+    for startId in range(nodeCount):
+        if(index[startId] != -1):
+            continue
+        work = [(startId, iter(successors.get(startId, ())))]
+        index[startId] = lowLink[startId] = nextIndex
+        nextIndex += 1
+        stack.append(startId)
+        onStack[startId] = True
+        while(len(work) > 0):
+            nodeId, nodeSuccessors = work[-1]
+            pushed = False
+            for toId in nodeSuccessors:
+                if(index[toId] == -1):
+                    index[toId] = lowLink[toId] = nextIndex
+                    nextIndex += 1
+                    stack.append(toId)
+                    onStack[toId] = True
+                    work.append((toId, iter(successors.get(toId, ()))))
+                    pushed = True
+                    break
+                if(onStack[toId]):
+                    lowLink[nodeId] = min(lowLink[nodeId], index[toId])
+            if(pushed):
+                continue
+            work.pop(-1)
+            if(len(work) > 0):
+                parentId = work[-1][0]
+                lowLink[parentId] = min(lowLink[parentId], lowLink[nodeId])
+            if(lowLink[nodeId] == index[nodeId]):
+                while(True):
+                    memberId = stack.pop(-1)
+                    onStack[memberId] = False
+                    component[memberId] = componentCount
+                    if(memberId == nodeId):
+                        break
+                componentCount += 1
+    return component, componentCount
+
+class Reachability:
+    def __init__(self, nodeCount, successors):
+        self.nodeCount = nodeCount
+        self.successors = successors # <nodeId, node ids in include order>
+        self.component, self.componentCount = GetStronglyConnectedComponents(nodeCount, successors)
+        self.members = [[] for x in range(self.componentCount)] # <component, node ids>
+        for nodeId, c in enumerate(self.component):
+            self.members[c].append(nodeId)
+        self.componentSuccessors = [set() for x in range(self.componentCount)]
+        for fromId, toIds in successors.items():
+            fromComponent = self.component[fromId]
+            for toId in toIds:
+                if(self.component[toId] != fromComponent):
+                    self.componentSuccessors[fromComponent].add(self.component[toId])
+        self.reach = [0] * self.componentCount # <component, bit set of the components it reaches, itself included>
+        for c in range(self.componentCount): # successors are numbered first
+            bits = 1 << c
+            for s in self.componentSuccessors[c]:
+                bits |= self.reach[s]
+            self.reach[c] = bits
+        self.cyclicComponents = [c for c in range(self.componentCount) if len(self.members[c]) > 1]
+
+    def Reaches(self, fromId, toId):
+        # True if fromId includes toId, directly or not, or is toId
+        return (self.reach[self.component[fromId]] >> self.component[toId]) & 1 == 1
+
+    def GetClosure(self, nodeId):
+        # the node ids reachable from a node, itself included
+        bits = self.reach[self.component[nodeId]]
+        closure = []
+        while(bits):
+            low = bits & -bits
+            closure.extend(self.members[low.bit_length() - 1])
+            bits ^= low
+        return closure
+
+    def GetClosureSize(self, nodeId):
+        # len(GetClosure()) without listing it: one bit per component, plus the other members of the cycles in it
+        bits = self.reach[self.component[nodeId]]
+        return bits.bit_count() + sum(len(self.members[c]) - 1 for c in self.cyclicComponents if (bits >> c) & 1)
+
+    def GetIncludedBy(self, roots):
+        """
+        Return <component, bit set of the roots reaching it>, in one pass the other way around:
+        the includers are numbered last, so a component has the bits of all of them.
+        """
+        includedBy = [0] * self.componentCount
+        for i, rootId in enumerate(roots):
+            includedBy[self.component[rootId]] |= 1 << i
+        for c in range(self.componentCount - 1, -1, -1):
+            for s in self.componentSuccessors[c]:
+                includedBy[s] |= includedBy[c]
+        return includedBy
+
+    def GetChain(self, fromId, toId):
+        """
+        Return the shortest include chain from a node to another as node ids, None if it does not reach it.
+        Only the nodes reaching toId are visited.
+        """
+        if(not self.Reaches(fromId, toId)):
+            return None
+        target = self.component[toId]
+        parents = {fromId: None}
+        queue = deque([fromId])
+        while(len(queue) > 0):
+            nodeId = queue.popleft()
+            if(nodeId == toId):
+                chain = []
+                while(nodeId is not None):
+                    chain.append(nodeId)
+                    nodeId = parents[nodeId]
+                return chain[::-1]
+            for nextId in self.successors.get(nodeId, ()):
+                if(nextId not in parents and (self.reach[self.component[nextId]] >> target) & 1):
+                    parents[nextId] = nodeId
+                    queue.append(nextId)
+        return None
+
+    def FindImpliedIncludes(self, nodeId, includes = None):
+        """
+        Return (header, implied by) for every include of a file already reached through an earlier one of its includes.
+        includes are the node ids of its include directives in the order of the file, its successors by default.
+        """
+        component = self.component
+        reach = self.reach
+        includes = list(self.successors.get(nodeId, ()) if includes is None else includes)
+        implied = []
+        for i, headerId in enumerate(includes):
+            headerComponent = component[headerId]
+            if(headerComponent == component[nodeId]): # an include back into a cycle
+                continue
+            for otherId in includes[:i]:
+                if(component[otherId] != headerComponent and (reach[component[otherId]] >> headerComponent) & 1):
+                    implied.append((headerId, otherId))
+                    break
+        return implied
+
+    def GetHeaviestChains(self, weights):
+        """
+        Return <component, (weight of the heaviest chain from it, next edge)>, weights is <nodeId, weight>.
+        The weight of a chain is the sum of the weights of its nodes, every member of a cycle on it included.
+        With weights of 1 the heaviest chain is the deepest one.
+        """
+        best = [None] * self.componentCount
+        for c in range(self.componentCount): # successors are numbered first
+            weight = sum(weights[x] for x in self.members[c])
+            heaviest = (weight, None)
+            for fromId in self.members[c]:
+                for toId in self.successors.get(fromId, ()):
+                    s = self.component[toId]
+                    if(s != c and weight + best[s][0] > heaviest[0]):
+                        heaviest = (weight + best[s][0], (fromId, toId))
+            best[c] = heaviest
+        return best
+
+    def WalkHeaviestChain(self, best, nodeId):
+        # the nodes of the heaviest chain from a node, through the members of the cycles on the way
+        chain = [nodeId]
+        nextEdge = best[self.component[nodeId]][1]
+        while(nextEdge is not None):
+            fromId, toId = nextEdge
+            if(fromId != chain[-1]):
+                chain.extend(self.GetChain(chain[-1], fromId)[1:]) # inside the cycle
+            chain.append(toId)
+            nextEdge = best[self.component[toId]][1]
+        return chain
+
+def MergeRows(merged, rows):
+    for fromId, toIds in rows.items():
+        mergedIds = merged.get(fromId)
+        if(mergedIds is None):
+            merged[fromId] = dict.fromkeys(toIds)
+        else:
+            mergedIds.update(dict.fromkeys(toIds))
+    return
+
+def MergeGraphStore(store):
+    """
+    Return the <pathId, path ids> unions of the include directives of every translation unit of a graph store,
+    and of its graphs and directives together, in the order the includes were first seen.
+    A translation unit without directives (--depsOnly) gives its graph instead.
+    """
+    directives = dict()
+    successors = dict()
+    for tuIndex in range(store.tuCount):
+        graph = store.GetSuccessors(tuIndex)
+        rows = store.GetDirectives(tuIndex) or graph
+        MergeRows(directives, rows)
+        MergeRows(successors, graph)
+        MergeRows(successors, rows)
+    return directives, successors
+
+def AnalyzeGraphStore(store, top):
+    # the include analysis of every translation unit of a graph store, see AnalyzeIncludes()
+    directives, successors = MergeGraphStore(store)
+    reachability = Reachability(store.pathCount, successors)
+    paths = [store.GetPath(x) for x in range(store.pathCount)]
+    return AnalyzeIncludes(reachability, paths, list(store.tuRoots), top, directives)
+
+def GetFileSizes(paths):
+    # the weights of "heaviest", 0 for a file gone since the map was made
+    sizes = []
+    for path in paths:
+        try:
+            sizes.append(os.path.getsize(path))
+        except OSError:
+            sizes.append(0)
+    return sizes
+
+def AnalyzeIncludes(reachability, paths, roots, top, directives = None):
+    """
+    Return the reports of the include analysis of a build, as plain data:
+
+        translationUnits   <source file, how many files it pulls in>
+        impliedIncludes    the include directives already reached through an earlier directive of the same file,
+                           with the number of translation units including that file, most included first
+        deepestChains      the longest include chain of every translation unit, the top ones
+        heaviestChains     the include chain of every translation unit with the most bytes on disk, the top ones
+        cycles             the files including each other
+    """
+    if(directives is None): # <nodeId, node ids of its include directives>
+        directives = reachability.successors
+    report = dict()
+    report["translationUnits"] = {paths[x]: reachability.GetClosureSize(x) - 1 for x in roots}
+
+    implied = []
+    includedBy = reachability.GetIncludedBy(roots)
+    for nodeId, includes in directives.items():
+        for headerId, otherId in reachability.FindImpliedIncludes(nodeId, includes):
+            entry = dict()
+            entry["file"] = paths[nodeId]
+            entry["header"] = paths[headerId]
+            entry["impliedBy"] = paths[otherId]
+            entry["chain"] = [paths[x] for x in reachability.GetChain(otherId, headerId)]
+            entry["translationUnits"] = includedBy[reachability.component[nodeId]].bit_count()
+            implied.append(entry)
+    implied.sort(key=lambda x: (-x["translationUnits"], x["file"]))
+    report["impliedIncludes"] = implied
+
+    for name, weights in (("deepestChains", [1] * len(paths)), ("heaviestChains", GetFileSizes(paths))):
+        best = reachability.GetHeaviestChains(weights)
+        ranked = sorted(roots, key=lambda x: best[reachability.component[x]][0], reverse=True)[:top]
+        report[name] = [{"weight": best[reachability.component[x]][0], "chain": [paths[y] for y in reachability.WalkHeaviestChain(best, x)]} for x in ranked]
+
+    report["cycles"] = [sorted(paths[x] for x in reachability.members[c]) for c in reachability.cyclicComponents]
+    return report
+
+def FormatAnalysis(report, top):
+    rows = []
+    rows.append("[{0} includes are already reached through an earlier include of the same file:]".format(len(report["impliedIncludes"])))
+    for entry in report["impliedIncludes"][:top]:
+        rows.append("{0} ({1} translation units){2}    {3}, by {4}".format(entry["file"], entry["translationUnits"], os.linesep, entry["header"], " -> ".join(entry["chain"])))
+    rows.append("[Deepest include chains:]")
+    for entry in report["deepestChains"]:
+        rows.append("{0}: {1}".format(entry["weight"], " -> ".join(entry["chain"])))
+    rows.append("[Heaviest include chains, in bytes on disk:]")
+    for entry in report["heaviestChains"]:
+        rows.append("{0}: {1}".format(entry["weight"], " -> ".join(entry["chain"])))
+    rows.append("[{0} include cycles:]".format(len(report["cycles"])))
+    for members in report["cycles"][:top]:
+        rows.append(" <-> ".join(members))
+    return os.linesep.join(rows)
@@ -0,0 +1,192 @@
+"""
+Reverse-dependency index of Zephyr Include Map.
+
+The include maps answer "what does this source file pull in". When a header
+changes, the question is the other way around: which translation units have
+to be rebuilt, and through which include chain do they get the header.
+
+The index inverts the graphs of graph-store.bin (see GraphStore.py) into
+<header, translation units>, and keeps the breadth-first tree of every
+translation unit, so the shortest include chain is a walk up the parents.
+It is saved as <bldDir>/.includemap/reverse-index.bin next to the graph store,
+with the same path ids, as flat arrays of 32-bit integers:
+
+    header           magic, version, counts, and the size+mtime of the
+                     tu-graphs.bin it was made from
+    includedByStart  pathCount+1 offsets, the translation units including path i
+                     are includedBy[includedByStart[i]:includedByStart[i+1]]
+    includedBy       translation unit indexes
+    parentStart      tuCount+1 offsets, the tree of translation unit t is
+                     parentStart[t] to parentStart[t+1]
+    parentNodes      the path ids reached by each translation unit, sorted
+    parentIds        the parent of each of them in the breadth-first tree
+
+Both files are memory-mapped: a query binary-searches the header path, reads
+its list of translation units and walks up their trees, and the pages of the
+other headers and translation units are never read. The index is rebuilt,
+without running the preprocessor, whenever the graph cache changed.
+"""
+import os
+import os.path
+import mmap
+import bisect
+from array import array
+from collections import deque
+import IncludeMapCache
+import GraphStore
+
+REVERSE_INDEX_FILE_NAME = "reverse-index.bin"
+REVERSE_INDEX_MAGIC = 0x494D495A # "ZIMI" when read in the byte order it was written in
+REVERSE_INDEX_VERSION = 2 # bump when the layout changes
+HEADER_WORDS = 8 # magic, version, pathCount, tuCount, includedByCount, parentCount, reserved, reserved
+HEADER_BYTES = HEADER_WORDS * 4 + 16 # and the (size, mtime) stamp of tu-graphs.bin as two int64
+NO_PARENT = 0xFFFFFFFF # the parent of the source file itself
+
+def BuildReverseIndex(store):
+    """
+    Return the reverse index of a graph store as bytes; the path ids of the store are kept,
+    so the graphs are inverted without looking up any path.
+    """
+    includedBy = [None] * store.pathCount # <pathId, array of tuIndex>
+    parentStart = array("I", [0])
+    parentNodes = array("I")
+    parentIds = array("I")
+    for tuIndex in range(store.tuCount):
+        rootId = store.tuRoots[tuIndex]
+        successors = store.GetSuccessors(tuIndex)
+        # breadth-first, so the parents give the shortest chain; includes are visited in include order.
+        parents = {rootId: NO_PARENT}
+        queue = deque([rootId])
+        while(len(queue) > 0):
+            nodeId = queue.popleft()
+            for nextId in successors.get(nodeId, ()):
+                if(nextId not in parents):
+                    parents[nextId] = nodeId
+                    queue.append(nextId)
+        for nodeId in sorted(parents):
+            parentNodes.append(nodeId)
+            parentIds.append(parents[nodeId])
+            if(nodeId != rootId):
+                if(includedBy[nodeId] is None):
+                    includedBy[nodeId] = array("I")
+                includedBy[nodeId].append(tuIndex)
+        parentStart.append(len(parentNodes))
+    includedByStart = array("I", [0])
+    includedByList = array("I")
+    for tuIndexes in includedBy:
+        if(tuIndexes is not None):
+            includedByList.extend(tuIndexes)
+        includedByStart.append(len(includedByList))
+    header = array("I", [REVERSE_INDEX_MAGIC, REVERSE_INDEX_VERSION, store.pathCount, store.tuCount, len(includedByList), len(parentNodes), 0, 0])
+    stamp = array("q", store.graphCacheStamp)
+    return b"".join([header.tobytes(), stamp.tobytes(), includedByStart.tobytes(), includedByList.tobytes(), parentStart.tobytes(), parentNodes.tobytes(), parentIds.tobytes()])
+
+class ReverseIndex:
+    """
+    Read-only view of a reverse index, on an mmap or on bytes, with the graph store it was made from for the paths.
+    """
+    def __init__(self, buffer, store):
+        view = memoryview(buffer)
+        header = view[:HEADER_WORDS * 4].cast("I")
+        if(len(view) < HEADER_BYTES or header[0] != REVERSE_INDEX_MAGIC or header[1] != REVERSE_INDEX_VERSION):
+            raise ValueError("not a reverse index")
+        pathCount, self.tuCount, includedByCount, parentCount = header[2:6]
+        self.graphCacheStamp = tuple(view[HEADER_WORDS * 4:HEADER_BYTES].cast("q"))
+        if(pathCount != store.pathCount or self.tuCount != store.tuCount or self.graphCacheStamp != store.graphCacheStamp):
+            raise ValueError("reverse index of another graph store")
+        offset = HEADER_BYTES
+        def Take(count):
+            nonlocal offset
+            section = view[offset:offset + count * 4].cast("I")
+            offset += count * 4
+            return section
+        self.includedByStart = Take(pathCount + 1)
+        self.includedBy = Take(includedByCount)
+        self.parentStart = Take(self.tuCount + 1)
+        self.parentNodes = Take(parentCount)
+        self.parentIds = Take(parentCount)
+        if(offset != len(view)):
+            raise ValueError("truncated reverse index")
+        self.store = store
+
+    def GetTuIndexes(self, headerFullPath):
+        headerId = self.store.FindPathId(headerFullPath)
+        if(headerId is None):
+            return None, []
+        return headerId, self.includedBy[self.includedByStart[headerId]:self.includedByStart[headerId + 1]]
+
+    def GetTranslationUnits(self, headerFullPath):
+        """
+        Return the source files including the header, directly or not.
+        """
+        headerId, tuIndexes = self.GetTuIndexes(headerFullPath)
+        return [self.store.GetPath(self.store.tuRoots[x]) for x in tuIndexes]
+
+    def GetParent(self, tuIndex, nodeId):
+        # binary search in the sorted tree of the translation unit, None if it does not reach the node
+        low, high = self.parentStart[tuIndex], self.parentStart[tuIndex + 1]
+        i = bisect.bisect_left(self.parentNodes, nodeId, low, high)
+        if(i == high or self.parentNodes[i] != nodeId):
+            return None
+        return self.parentIds[i]
+
+    def GetShortestChain(self, headerFullPath, srcFileFullPath):
+        """
+        Return [srcFileFullPath, ..., headerFullPath], None if the source file does not include the header.
+        """
+        headerId = self.store.FindPathId(headerFullPath)
+        tuIndex = self.store.GetTranslationUnit(srcFileFullPath)
+        if(headerId is None or tuIndex is None or self.GetParent(tuIndex, headerId) is None):
+            return None
+        return self.WalkChain(tuIndex, headerId)
+
+    def WalkChain(self, tuIndex, headerId):
+        chain = []
+        nodeId = headerId
+        while(nodeId != NO_PARENT):
+            chain.append(self.store.GetPath(nodeId))
+            nodeId = self.GetParent(tuIndex, nodeId)
+        return chain[::-1]
+
+    def GetIncludes(self, headerFullPath):
+        """
+        Return <srcFileFullPath, shortest chain> for every translation unit including the header.
+        """
+        headerId, tuIndexes = self.GetTuIndexes(headerFullPath)
+        return {self.store.GetPath(self.store.tuRoots[x]): self.WalkChain(x, headerId) for x in tuIndexes}
+
+def OpenReverseIndex(fileFullPath, store):
+    # memory-mapped like the graph store; None if missing, not an index or made from another store
+    try:
+        with open(fileFullPath, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError): # missing, or empty
+        return None
+    try:
+        return ReverseIndex(buffer, store)
+    except (ValueError, TypeError):
+        return None
+
+def LoadReverseIndex(bldDir, graphCache = None):
+    """
+    Return the reverse index of the build folder, None if no include map has been cached yet.
+    The saved index is used as long as it was made from the current graph store, otherwise it is rebuilt from it.
+    """
+    store = GraphStore.LoadGraphStore(bldDir, graphCache)
+    if(store is None):
+        return None
+    fileFullPath = IncludeMapCache.GetCacheFileFullPath(bldDir, REVERSE_INDEX_FILE_NAME)
+    index = OpenReverseIndex(fileFullPath, store)
+    if(index is not None):
+        return index
+    data = BuildReverseIndex(store)
+    tmpFileFullPath = "{0}.{1}.tmp".format(fileFullPath, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(fileFullPath), exist_ok=True)
+        with open(tmpFileFullPath, "wb") as f:
+            f.write(data)
+        os.replace(tmpFileFullPath, fileFullPath) # an index being mapped by a query is not changed
+    except OSError:
+        if(os.path.exists(tmpFileFullPath)):
+            os.remove(tmpFileFullPath)
+    return ReverseIndex(data, store)
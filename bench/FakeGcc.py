@@ -0,0 +1,147 @@
+"""
+A stand-in for the Zephyr cross gcc, for the benchmark fixture of GenBenchFixture.py.
+
+It understands just enough of the command line GenIncludeMap2.py builds:
+
+    -E          preprocessed text with gcc-style line markers on stdout
+    -dI         with -E, every #include directive echoed before what it enters,
+                the guarded repeats that enter nothing too
+    -M -H       the dependency rule on stdout and the "-H" header trace on stderr
+    -I, -isystem, -iquote, -idirafter, -imacros, -include, -D, -U; anything else is ignored
+
+#include "..." and <...> are resolved like gcc does: the directory of the
+including file first for quotes, then -iquote, -I, -isystem and -idirafter in order.
+Headers with an include guard (#ifndef X / #define X ... #endif) are entered
+only once per translation unit, which is what gcc's multiple-include
+optimization does, so re-includes leave no line marker. No other directive
+is evaluated, the fixture does not need it.
+"""
+import sys
+import os.path
+import re
+
+includeRegex = re.compile(r"\s*#\s*include\s*([\"<])([^\">]+)[\">]")
+guardRegex = re.compile(r"\s*#\s*ifndef\s+(\w+)")
+
+class FakePreProcessor:
+    def __init__(self, quoteDirs, angleDirs, echoDirectives):
+        self.quoteDirs = quoteDirs
+        self.angleDirs = angleDirs
+        self.echoDirectives = echoDirectives
+        self.guarded = set() # headers whose guard macro is defined already
+        self.depth = 0
+        self.deps = [] # in the order of the dependency rule
+        self.trace = [] # the "-H" lines
+
+    def Resolve(self, name, quoted, includerDir):
+        searchDirs = ([includerDir] + self.quoteDirs if quoted else []) + self.angleDirs
+        for d in searchDirs:
+            path = os.path.join(d, name)
+            if(os.path.isfile(path)):
+                return os.path.normpath(path)
+        return None
+
+    def Process(self, path, out):
+        with open(path) as f:
+            lines = f.readlines()
+        includerDir = os.path.dirname(path)
+        for lineNo, line in enumerate(lines, 1):
+            m = includeRegex.match(line)
+            if(m is None):
+                if(out is not None and not line.lstrip().startswith("#")):
+                    out.append(line)
+                continue
+            headerPath = self.Resolve(m.group(2), m.group(1) == "\"", includerDir)
+            if(headerPath is None):
+                sys.stderr.write("{0}:{1}: fatal error: {2}: No such file or directory\n".format(path, lineNo, m.group(2)))
+                sys.exit(1)
+            if(self.echoDirectives and out is not None):
+                out.append("#include {0}\n".format("\"{0}\"".format(m.group(2)) if m.group(1) == "\"" else "<{0}>".format(m.group(2))))
+            if(self.Include(headerPath, out) and out is not None):
+                out.append("# {0} \"{1}\" 2\n".format(lineNo + 1, path))
+        return
+
+    def Include(self, headerPath, out):
+        if(headerPath in self.guarded):
+            return False
+        with open(headerPath) as f:
+            m = guardRegex.match(f.readline())
+        if(m is not None):
+            self.guarded.add(headerPath)
+        if(headerPath not in self.deps):
+            self.deps.append(headerPath)
+        self.depth += 1
+        self.trace.append("{0} {1}\n".format("." * self.depth, headerPath))
+        if(out is not None):
+            out.append("# 1 \"{0}\" 1\n".format(headerPath))
+        self.Process(headerPath, out)
+        self.depth -= 1
+        return True
+
+def ParseArgs(argv):
+    opts = {"E": False, "M": False, "H": False, "dI": False, "quote": [], "angle": [], "system": [], "after": [], "forced": [], "src": None}
+    i = 0
+    while(i < len(argv)):
+        arg = argv[i]
+        if(arg in ("-E", "-M", "-H", "-dI")):
+            opts[arg[1:]] = True
+        elif(arg in ("-I", "-isystem", "-iquote", "-idirafter", "-imacros", "-include", "-o", "-D", "-U")):
+            i += 1
+            value = argv[i]
+            if(arg == "-I"):
+                opts["angle"].append(value)
+            elif(arg == "-isystem"):
+                opts["system"].append(value)
+            elif(arg == "-iquote"):
+                opts["quote"].append(value)
+            elif(arg == "-idirafter"):
+                opts["after"].append(value)
+            elif(arg in ("-imacros", "-include")):
+                opts["forced"].append(value)
+        elif(arg.startswith("-I")):
+            opts["angle"].append(arg[2:])
+        elif(arg.startswith("-iquote")):
+            opts["quote"].append(arg[7:])
+        elif(arg.startswith("-idirafter")):
+            opts["after"].append(arg[10:])
+        elif(not arg.startswith("-")):
+            opts["src"] = arg
+        i += 1
+    return opts
+
+def Main(argv):
+    opts = ParseArgs(argv)
+    srcFile = opts["src"]
+    pp = FakePreProcessor(opts["quote"], opts["angle"] + opts["system"] + opts["after"], opts["dI"])
+    out = [] if opts["E"] else None
+    if(out is not None):
+        out.append("# 0 \"{0}\"\n# 0 \"<built-in>\"\n# 0 \"<command-line>\"\n".format(srcFile))
+    for forced in opts["forced"]:
+        # like gcc: entered from <command-line>, listed in the dependency rule but not in the "-H" trace
+        forcedPath = os.path.normpath(os.path.abspath(forced))
+        pp.deps.append(forcedPath)
+        pp.guarded.add(forcedPath)
+        if(out is not None):
+            out.append("# 1 \"{0}\" 1\n".format(forcedPath))
+            pp.Process(forcedPath, out)
+            out.append("# 1 \"<command-line>\" 2\n")
+        else:
+            pp.Process(forcedPath, None)
+    del pp.trace[:]
+    if(out is not None):
+        out.append("# 1 \"{0}\"\n".format(srcFile))
+    pp.Process(srcFile, out)
+    if(out is not None):
+        sys.stdout.writelines(out)
+    elif(opts["M"]):
+        target = os.path.splitext(os.path.basename(srcFile))[0] + ".o"
+        sys.stdout.write("{0}: {1}".format(target, srcFile))
+        for dep in pp.deps:
+            sys.stdout.write(" \\\n {0}".format(dep))
+        sys.stdout.write("\n")
+        if(opts["H"]):
+            sys.stderr.writelines(pp.trace)
+    return 0
+
+if __name__=="__main__":
+    sys.exit(Main(sys.argv[1:]))
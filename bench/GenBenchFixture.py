@@ -0,0 +1,150 @@
+"""
+Synthetic Zephyr-like build for benchmarking Zephyr Include Map.
+
+    <root>/zephyr/include/zephyr/common.h       included by every header, guarded
+    <root>/zephyr/include/zephyr/l<d>/h<i>.h    the header tree: <depth> levels of <width>
+                                                headers, each including <fanOut> headers
+                                                of the next level
+    <root>/zephyr/include/quote/quoted.h        found through -iquote
+    <root>/zephyr/include/after/after.h         found through -idirafter
+    <root>/zephyr/src/<module>/src<i>.c         the translation units
+    <root>/zephyr/build/build.ninja             one compile edge per translation unit
+    <root>/zephyr/build/compile_commands.json   the same, with relative folders
+    <root>/zephyr/build/zephyr/include/generated/autoconf.h
+    <root>/toolchain/bin/gcc                    runs FakeGcc.py
+
+The headers of a level are shared by the level above, so most includes are
+guarded re-includes, like in Zephyr. Every source file includes common.h
+again after the headers already pulling it in, for the implied includes. The same seed gives the same tree.
+
+    python3 bench/GenBenchFixture.py --root /tmp/bench --tus 500 --depth 5 --fanOut 4
+"""
+import sys
+import os
+import os.path
+import stat
+import json
+import random
+import shlex
+import argparse
+
+MODULES = ("kernel", "drivers", "subsys", "lib")
+
+def WriteFile(fileFullPath, text):
+    os.makedirs(os.path.dirname(fileFullPath), exist_ok=True)
+    with open(fileFullPath, "w") as f:
+        f.write(text)
+    return
+
+def GetBodyText(name, lines):
+    # declarations, one per line, a few tens of bytes each like Zephyr's headers
+    return "".join("extern int {0}_symbol_{1}(int arg, const char *name);\n".format(name, i) for i in range(lines))
+
+def GenHeaderTree(zephyrDir, options, rng):
+    includeDir = os.path.join(zephyrDir, "include", "zephyr")
+    WriteFile(os.path.join(includeDir, "common.h"), "#ifndef ZEPHYR_COMMON_H_\n#define ZEPHYR_COMMON_H_\n{0}#endif\n".format(GetBodyText("common", options.lines)))
+    for depth in range(options.depth):
+        for i in range(options.width):
+            name = "l{0}_h{1}".format(depth, i)
+            guard = "ZEPHYR_{0}_H_".format(name.upper())
+            includes = ["#include <zephyr/common.h>\n"]
+            if(depth + 1 < options.depth):
+                children = rng.sample(range(options.width), min(options.fanOut, options.width))
+                includes += ["#include <zephyr/l{0}/h{1}.h>\n".format(depth + 1, x) for x in children]
+            text = "#ifndef {0}\n#define {0}\n{1}{2}#endif\n".format(guard, "".join(includes), GetBodyText(name, options.lines))
+            WriteFile(os.path.join(includeDir, "l{0}".format(depth), "h{0}.h".format(i)), text)
+    return
+
+def GetIncludeFolders(zephyrDir, srcFileFullPath):
+    # (option, folder) of a translation unit; the generated folder is relative to the build folder
+    return [("-I", os.path.join(zephyrDir, "include")), ("-I", "zephyr/include/generated"), ("-I", os.path.dirname(srcFileFullPath)), ("-iquote", os.path.join(zephyrDir, "include", "quote")), ("-idirafter", os.path.join(zephyrDir, "include", "after"))]
+
+def GenTranslationUnits(zephyrDir, options, rng):
+    srcFileFullPaths = []
+    WriteFile(os.path.join(zephyrDir, "include", "quote", "quoted.h"), "#ifndef QUOTED_H_\n#define QUOTED_H_\n#include <zephyr/common.h>\n#endif\n")
+    WriteFile(os.path.join(zephyrDir, "include", "after", "after.h"), "#ifndef AFTER_H_\n#define AFTER_H_\nextern int after;\n#endif\n")
+    for i in range(options.tus):
+        module = MODULES[i % len(MODULES)]
+        srcFileFullPath = os.path.join(zephyrDir, "src", module, "src{0}.c".format(i))
+        tops = rng.sample(range(options.width), min(options.fanOut, options.width))
+        includes = "".join("#include <zephyr/l0/h{0}.h>\n".format(x) for x in tops)
+        # common.h again after the headers pulling it in: a guarded repeat, implied by the first of them
+        WriteFile(srcFileFullPath, "{0}#include <zephyr/common.h>\n#include \"local.h\"\n#include \"quoted.h\"\n#include <after.h>\n{1}".format(includes, GetBodyText("src{0}".format(i), options.lines)))
+        srcFileFullPaths.append(srcFileFullPath)
+    for module in MODULES:
+        WriteFile(os.path.join(zephyrDir, "src", module, "local.h"), "#ifndef LOCAL_H_\n#define LOCAL_H_\n#include <zephyr/common.h>\n#endif\n")
+    return srcFileFullPaths
+
+def GenBuildNinja(zephyrDir, bldDir, gccFullPath, srcFileFullPaths):
+    autoconf = os.path.join(bldDir, "zephyr", "include", "generated", "autoconf.h")
+    WriteFile(autoconf, "".join("#define CONFIG_OPTION_{0} 1\n".format(i) for i in range(1000)))
+    lines = ["# CMAKE generated file: DO NOT EDIT!\n", "ninja_required_version = 1.5\n\n"]
+    for module in MODULES:
+        lines.append("rule C_COMPILER__{0}_unscanned_\n  depfile = $DEP_FILE\n  deps = gcc\n".format(module))
+        lines.append("  command = {0} $DEFINES $INCLUDES $FLAGS -o $out -c $in\n  description = Building C object $out\n\n".format(gccFullPath))
+    for i, srcFileFullPath in enumerate(srcFileFullPaths):
+        module = MODULES[i % len(MODULES)]
+        obj = "zephyr/{0}/CMakeFiles/{0}.dir/src{1}.c.obj".format(module, i)
+        lines.append("build {0}: C_COMPILER__{1}_unscanned_ {2} || cmake_object_order_depends_target_{1}\n".format(obj, module, srcFileFullPath))
+        lines.append("  DEFINES = -DKERNEL -D__ZEPHYR__=1 -D_FORTIFY_SOURCE=1\n")
+        lines.append("  DEP_FILE = {0}.d\n".format(obj))
+        lines.append("  FLAGS = -Os -ffreestanding -imacros {0} $\n      -Wall -Wformat -Wno-main\n".format(autoconf))
+        lines.append("  INCLUDES = {0}\n".format(" ".join(x + y if x == "-I" else "{0} {1}".format(x, y) for x, y in GetIncludeFolders(zephyrDir, srcFileFullPath))))
+        lines.append("  OBJECT_DIR = zephyr/{0}/CMakeFiles/{0}.dir\n\n".format(module))
+    WriteFile(os.path.join(bldDir, "build.ninja"), "".join(lines))
+    return
+
+def GenCompileCommands(zephyrDir, bldDir, gccFullPath, srcFileFullPaths):
+    # what CMake writes next to build.ninja; the folders relative to the build folder, some as separate words
+    autoconf = os.path.join(bldDir, "zephyr", "include", "generated", "autoconf.h")
+    commands = []
+    for i, srcFileFullPath in enumerate(srcFileFullPaths):
+        module = MODULES[i % len(MODULES)]
+        obj = "zephyr/{0}/CMakeFiles/{0}.dir/src{1}.c.obj".format(module, i)
+        includes = []
+        for option, folder in GetIncludeFolders(zephyrDir, srcFileFullPath):
+            folder = os.path.relpath(os.path.join(bldDir, folder), bldDir)
+            includes += [option + folder] if option == "-I" else [option, folder]
+        arguments = [gccFullPath, "-DKERNEL", "-D__ZEPHYR__=1", "-D_FORTIFY_SOURCE=1"] + includes + ["-Os", "-ffreestanding", "-imacros", autoconf, "-Wall", "-Wformat", "-Wno-main", "-o", obj, "-c", srcFileFullPath]
+        commands.append({"directory": bldDir, "command": shlex.join(arguments), "file": srcFileFullPath})
+    WriteFile(os.path.join(bldDir, "compile_commands.json"), json.dumps(commands, indent=2))
+    return
+
+def GenFakeToolchain(root):
+    gccFullPath = os.path.join(root, "toolchain", "bin", "gcc")
+    fakeGcc = os.path.join(os.path.dirname(os.path.realpath(__file__)), "FakeGcc.py")
+    WriteFile(gccFullPath, "#!/bin/sh\nexec \"{0}\" \"{1}\" \"$@\"\n".format(sys.executable, fakeGcc))
+    os.chmod(gccFullPath, os.stat(gccFullPath).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return gccFullPath
+
+def GenBenchFixture(options):
+    """
+    Return the zephyr folder, the build folder, the gcc and the source files of the fixture.
+    """
+    root = os.path.realpath(options.root)
+    zephyrDir = os.path.join(root, "zephyr")
+    bldDir = os.path.join(zephyrDir, "build")
+    rng = random.Random(options.seed)
+    GenHeaderTree(zephyrDir, options, rng)
+    srcFileFullPaths = GenTranslationUnits(zephyrDir, options, rng)
+    gccFullPath = GenFakeToolchain(root)
+    GenBuildNinja(zephyrDir, bldDir, gccFullPath, srcFileFullPaths)
+    GenCompileCommands(zephyrDir, bldDir, gccFullPath, srcFileFullPaths)
+    return zephyrDir, bldDir, gccFullPath, srcFileFullPaths
+
+def AddFixtureArgs(parser):
+    parser.add_argument("--root", type=str, required=True, help="where to generate the fixture.")
+    parser.add_argument("--tus", type=int, default=200, help="how many translation units. default: 200.")
+    parser.add_argument("--depth", type=int, default=5, help="how many levels of headers. default: 5.")
+    parser.add_argument("--width", type=int, default=24, help="how many headers per level. default: 24.")
+    parser.add_argument("--fanOut", type=int, default=4, help="how many headers each file includes from the next level. default: 4.")
+    parser.add_argument("--lines", type=int, default=40, help="how many lines of declarations per file. default: 40.")
+    parser.add_argument("--seed", type=int, default=1, help="the seed of the random includes. default: 1.")
+    return
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    AddFixtureArgs(parser)
+    zephyrDir, bldDir, gccFullPath, srcFileFullPaths = GenBenchFixture(parser.parse_args())
+    print(f"[Fixture generated:]{os.linesep}-z {zephyrDir} -b {bldDir} -t {gccFullPath}")
+    sys.exit(0)
@@ -0,0 +1,261 @@
+"""
+Benchmark of Zephyr Include Map on the synthetic build of GenBenchFixture.py.
+
+Single translation unit, each stage timed on its own, in-process:
+
+    ninjaParse    build.ninja parsed into the source index, without the cache
+    preprocess    the "gcc -E" subprocess, its output read from the pipe
+    markerParse   the line markers matched in the preprocessed text
+    graphBuild    GenerateGraphMatrix() on the preprocessed text
+    dotEmit       GenerateGraph() to a .gv file, skipped if the graphviz package is not installed
+    render        Graphviz "dot" to pdf, skipped if "dot" is not installed either
+
+Whole build, GenIncludeMap2.py --all --format gv in a subprocess:
+
+    cold          no cache at all
+    warm          every translation unit up to date
+    depsOnlyCold  --depsOnly, no cache at all
+    jsonCold      --compileDb json, no cache at all: compile_commands.json with
+                  relative -iquote and -idirafter folders, its map has to be
+                  the same as the build.ninja one (jsonSameAsNinja)
+
+and the "analyze" count of implied includes (impliedIncludes), which only
+the #include directives of "-dI" can find, guarded repeats included.
+
+Startup of GenIncludeMap2.py, "python -X importtime" in a subprocess, for the
+invocations that run no map stage at all:
+
+    help          --help
+    includers     "includers" of a header, on the cached include maps
+
+    importMs      the import time of every module, as reported by -X importtime,
+                  the interpreter's own startup (site...) included
+    wallMs        the whole process
+
+the import time is checked against --startupBudget, 50 ms by default, and
+the modules costing the most are listed when it is over.
+
+Every timing is the best of --repeat runs, in seconds. The report is JSON,
+so two runs can be diffed to catch a regression:
+
+    python3 bench/RunBench.py --root /tmp/bench --tus 500 --output bench.json
+"""
+import sys
+import os
+import os.path
+import io
+import re
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import importlib.util
+import contextlib
+
+benchDir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(benchDir))
+import GenBenchFixture
+import IncludeMap
+import NinjaParser
+import CompileDb
+import IncludeMapCache
+import PathCanonicalizer
+from IncludeGraph import IncludeGraph
+
+importTimeRegex = re.compile(r"import time:\s+(\d+)\s+\|\s+\d+\s+\|(.*)")
+
+def TimeIt(func, repeat):
+    # the best of the runs, and what the last run returned
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+def NewEverything(zephyrDir, bldDir, gccFullPath, srcFileFullPath):
+    # the same settings GenIncludeMap2.py makes from its command line, for one source file
+    everything = dict()
+    everything["zephyrDir"] = zephyrDir
+    everything["bldDir"] = bldDir
+    everything["gccFullPath"] = gccFullPath
+    everything["pathCanonicalizer"] = PathCanonicalizer.PathCanonicalizer(zephyrDir, bldDir, os.path.dirname(os.path.dirname(gccFullPath)))
+    everything["graphMatrix"] = IncludeGraph()
+    everything["includeDirectives"] = IncludeGraph()
+    everything["jobs"] = 1
+    everything["jobTimeout"] = 300
+    everything["targets"] = None
+    everything["ppFilePrefix"] = ""
+    everything["compileDbBackend"] = "ninja"
+    everything["depsOnly"] = False
+    everything["keepPP"] = False
+    everything["rebuild"] = True
+    everything["formats"] = ["gv"]
+    everything["headerCost"] = None
+    everything["scanner"] = False
+    everything["scannerDiffMode"] = False
+    everything["focus"] = None
+    everything["maxDepth"] = None
+    everything["collapseDirs"] = None
+    everything["reduce"] = False
+    everything["graphCache"] = dict()
+    everything["fileStamps"] = dict()
+    everything["upToDate"] = False
+    everything["outputFiles"] = []
+    everything["srcFileFullPath"] = srcFileFullPath
+    everything["startingNodes"] = {srcFileFullPath}
+    everything["graphName"] = os.path.basename(srcFileFullPath)
+    return everything
+
+def BenchSingleTranslationUnit(zephyrDir, bldDir, gccFullPath, srcFileFullPath, repeat):
+    stages = dict()
+    ninjaBldFile = os.path.join(bldDir, CompileDb.NINJA_BUILD_FILE_NAME)
+    stages["ninjaParse"], index = TimeIt(lambda: NinjaParser.BuildSourceIndex(ninjaBldFile, bldDir), repeat)
+
+    everything = NewEverything(zephyrDir, bldDir, gccFullPath, srcFileFullPath)
+    IncludeMap.GetNinjaBuildBlock4SourceFile(everything)
+    IncludeMap.LoadCompileSettings(everything)
+    def PreProcess():
+        return subprocess.run(IncludeMap.GetPreProcessorArgv(everything), stdout=subprocess.PIPE, text=True, errors="replace", check=True).stdout
+    stages["preprocess"], ppText = TimeIt(PreProcess, repeat)
+
+    lineMarkerRegex = re.compile(r"#\s+\d+\s+\"(.*)\"\s+([12])")
+    def ParseMarkers():
+        return sum(1 for x in io.StringIO(ppText) if x.startswith("#") and lineMarkerRegex.match(x) is not None)
+    stages["markerParse"], markers = TimeIt(ParseMarkers, repeat)
+
+    def BuildGraph():
+        everything["graphMatrix"] = IncludeGraph()
+        everything["includeDirectives"] = IncludeGraph()
+        IncludeMap.GenerateGraphMatrix(everything, io.StringIO(ppText)) # the captured output, as if streamed
+        return everything["graphMatrix"]
+    stages["graphBuild"], graph = TimeIt(BuildGraph, repeat)
+
+    def EmitDot():
+        everything["outputFiles"] = []
+        IncludeMap.GenerateGraph(everything)
+        return everything["outputFiles"][0]
+    if(importlib.util.find_spec("graphviz") is None):
+        print("The \"graphviz\" package is not installed, dotEmit and render are skipped: pip install graphviz", file=sys.stderr)
+        stages["dotEmit"] = None
+        stages["render"] = None
+    else:
+        stages["dotEmit"], gvFileFullPath = TimeIt(EmitDot, repeat)
+        if(shutil.which("dot") is not None):
+            import graphviz
+            stages["render"], _ = TimeIt(lambda: graphviz.render("dot", "pdf", gvFileFullPath), repeat)
+        else:
+            stages["render"] = None # no Graphviz installed
+
+    result = dict()
+    result["srcFileFullPath"] = srcFileFullPath
+    result["stages"] = stages
+    result["compileEdges"] = len(index)
+    result["ppBytes"] = len(ppText)
+    result["markers"] = markers
+    result["nodes"] = graph.NodeCount()
+    result["edges"] = graph.EdgeCount()
+    return result
+
+def BenchWholeBuild(zephyrDir, bldDir, gccFullPath, jobs, repeat):
+    cmd = [sys.executable, os.path.join(os.path.dirname(benchDir), "GenIncludeMap2.py"), "-z", zephyrDir, "-b", bldDir, "-t", gccFullPath, "--all", "--format", "gv", "-j", str(jobs)]
+    cacheDir = os.path.join(bldDir, IncludeMapCache.CACHE_DIR_NAME)
+    def Run(extraArgs, cold):
+        if(cold):
+            shutil.rmtree(cacheDir, ignore_errors=True)
+        subprocess.run(cmd + extraArgs, stdout=subprocess.DEVNULL, check=True)
+        return
+    stages = dict()
+    stages["cold"], _ = TimeIt(lambda: Run([], True), repeat)
+    stages["warm"], _ = TimeIt(lambda: Run([], False), repeat)
+    stages["depsOnlyCold"], _ = TimeIt(lambda: Run(["--depsOnly"], True), repeat)
+    Run([], False)
+    with open("IncludeMap_all.gv") as f:
+        ninjaMap = f.read()
+    stages["jsonCold"], _ = TimeIt(lambda: Run(["--compileDb", "json"], True), repeat)
+    with open("IncludeMap_all.gv") as f:
+        jsonMap = f.read()
+    subprocess.run([cmd[0], cmd[1], "analyze"] + cmd[2:8], stdout=subprocess.DEVNULL, check=True)
+    with open("IncludeAnalysis_all.json") as f:
+        analysis = json.load(f)
+    result = dict()
+    result["jobs"] = jobs
+    result["stages"] = stages
+    result["jsonSameAsNinja"] = jsonMap == ninjaMap
+    result["impliedIncludes"] = len(analysis["impliedIncludes"])
+    return result
+
+def GetImportTimes(stderrText):
+    # <module, self import time in microseconds> from the "import time: self | cumulative | module" lines
+    times = dict()
+    for line in stderrText.splitlines():
+        m = importTimeRegex.match(line)
+        if(m is not None):
+            times[m.group(2).strip()] = int(m.group(1))
+    return times
+
+def BenchStartup(zephyrDir, bldDir, gccFullPath, repeat, budgetMs):
+    script = os.path.join(os.path.dirname(benchDir), "GenIncludeMap2.py")
+    common = ["-z", zephyrDir, "-b", bldDir, "-t", gccFullPath]
+    queries = dict()
+    queries["help"] = ["--help"]
+    queries["includers"] = ["includers"] + common + ["--header", os.path.join(zephyrDir, "include", "zephyr", "common.h")]
+    # with the .pyc files written, as in normal use: the first run makes them and the include maps the query reads, it is not timed
+    env = {x: y for x, y in os.environ.items() if x != "PYTHONDONTWRITEBYTECODE"}
+    subprocess.run([sys.executable, script] + common + ["--all", "--depsOnly", "--format", "json"], stdout=subprocess.DEVNULL, env=env, check=True)
+    result = dict()
+    result["budgetMs"] = budgetMs
+    for name, args in queries.items():
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            run = subprocess.run([sys.executable, "-X", "importtime", script] + args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env, check=True)
+            wallMs = (time.perf_counter() - start) * 1000
+            times = GetImportTimes(run.stderr)
+            importMs = sum(times.values()) / 1000
+            if(best is None or importMs < best["importMs"]):
+                best = {"importMs": round(importMs, 1), "wallMs": round(wallMs, 1), "modules": len(times)}
+                slowest = sorted(times.items(), key=lambda x: x[1], reverse=True)[:10]
+        best["withinBudget"] = best["importMs"] <= budgetMs
+        if(not best["withinBudget"]):
+            best["slowestImports"] = {x: round(us / 1000, 1) for x, us in slowest}
+            print("{0}: {1} ms of imports, over the {2} ms budget".format(name, best["importMs"], budgetMs), file=sys.stderr)
+        result[name] = best
+    return result
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    GenBenchFixture.AddFixtureArgs(parser)
+    parser.add_argument("--repeat", type=int, default=3, help="how many times to run each stage, the best run is reported. default: 3.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="the jobs of the whole-build runs. default: the number of CPUs.")
+    parser.add_argument("--skipWholeBuild", action="store_true", help="only benchmark the single translation unit.")
+    parser.add_argument("--skipStartup", action="store_true", help="do not measure the startup of the query-only invocations.")
+    parser.add_argument("--startupBudget", type=float, default=50, help="the import time allowed to the query-only invocations, in ms. default: 50.")
+    parser.add_argument("--output", type=str, help="write the JSON report to this file instead of stdout.")
+    options = parser.parse_args()
+
+    zephyrDir, bldDir, gccFullPath, srcFileFullPaths = GenBenchFixture.GenBenchFixture(options)
+    outDir = os.path.join(os.path.realpath(options.root), "out") # the maps are written to the current folder
+    os.makedirs(outDir, exist_ok=True)
+    os.chdir(outDir)
+
+    report = dict()
+    report["python"] = platform.python_version()
+    report["fixture"] = {"tus": options.tus, "depth": options.depth, "width": options.width, "fanOut": options.fanOut, "lines": options.lines, "seed": options.seed}
+    report["repeat"] = options.repeat
+    with contextlib.redirect_stdout(sys.stderr): # keep the messages of the pipeline out of the report
+        report["singleTu"] = BenchSingleTranslationUnit(zephyrDir, bldDir, gccFullPath, srcFileFullPaths[0], options.repeat)
+    if(not options.skipWholeBuild):
+        report["wholeBuild"] = BenchWholeBuild(zephyrDir, bldDir, gccFullPath, max(1, options.jobs), options.repeat)
+    if(not options.skipStartup):
+        report["startup"] = BenchStartup(zephyrDir, bldDir, gccFullPath, options.repeat, options.startupBudget)
+    text = json.dumps(report, indent=2)
+    if(options.output is not None):
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    sys.exit(0)